@@ -0,0 +1,248 @@
+"""
+Agrupación de marcadores del mapa por nivel de zoom
+
+Para cada fuente (incidencias, reportes) se mantiene en memoria una
+rejilla por nivel de zoom en coordenadas Web Mercator, con
+``MAPA_CELDAS_POR_TESELA`` celdas por tesela y eje (4 → celdas de 64 px).
+Cada celda acumula ``[cantidad, suma_lat, suma_lon]``, así que agregar o
+quitar un punto es O(niveles) y una consulta solo recorre las celdas del
+recuadro en su nivel: el tamaño de la respuesta depende del recuadro y del
+zoom, no de cuántas filas haya.
+
+El índice se construye al arrancar y se actualiza al crear, mover (PATCH
+de lat/lon) o borrar desde este proceso. Los cambios de otros workers se
+recogen reconstruyéndolo cuando cambia la versión de la tabla sin contar
+las escrituras propias (``table_version()`` excluyendo el
+``application_name`` de este proceso, migraciones 017 y 023), comprobada
+cada ``MAPA_REFRESCO`` s. Las escrituras propias que terminan mientras se
+reconstruye se concilian con la instantánea de la carga.
+"""
+import asyncio
+import logging
+from math import cos, log, pi, radians, tan
+from os import getenv
+
+from sqlalchemy import select, text  # type: ignore[import]
+
+from app.database import PROCESO, async_engine
+from app.models import Incidencia, Report
+
+logger = logging.getLogger(__name__)
+
+MAPA_ZOOM_MAX = int(getenv("MAPA_ZOOM_MAX", "16"))
+MAPA_CELDAS_POR_TESELA = int(getenv("MAPA_CELDAS_POR_TESELA", "4"))
+# Celdas como máximo por consulta; si el recuadro tiene más se baja el zoom
+MAPA_MAX_CELDAS = int(getenv("MAPA_MAX_CELDAS", "4096"))
+MAPA_REFRESCO = float(getenv("MAPA_REFRESCO", "60"))
+
+_LAT_MAX = 85.05112878  # límite de Web Mercator
+
+FUENTES = {"incidencias": Incidencia, "reportes": Report}
+# Filas que se pintan en el mapa: los reportes repetidos de otro (``duplicate_of``) no
+_VISIBLES = {
+    fuente: (modelo.lat.is_not(None), modelo.lon.is_not(None))
+    + ((modelo.duplicate_of.is_(None),) if modelo is Report else ())
+    for fuente, modelo in FUENTES.items()
+}
+
+# Versiones sin las escrituras de este proceso, que ya se aplican al índice al hacerlas
+_SQL_VERSIONES = text("SELECT t, table_version(t, :origen) FROM unnest(ARRAY['incidencias', 'reports']) AS t")
+
+
+def _mercator(lat: float, lon: float) -> tuple[float, float]:
+    """Posición en [0, 1) × [0, 1); ``y`` crece hacia el sur"""
+    lat = max(-_LAT_MAX, min(_LAT_MAX, lat))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0
+    return x, y
+
+
+class IndiceClusters:
+    """Rejilla por nivel de zoom: celda → ``[cantidad, suma_lat, suma_lon]``"""
+
+    def __init__(self, zoom_max: int = MAPA_ZOOM_MAX, celdas: int = MAPA_CELDAS_POR_TESELA):
+        self.zoom_max = zoom_max
+        self.celdas = celdas
+        self.niveles: list[dict[tuple[int, int], list]] = [{} for _ in range(zoom_max + 1)]
+        self.total = 0
+
+    def _celda(self, x: float, y: float, zoom: int) -> tuple[int, int]:
+        n = self.celdas << zoom
+        return min(int(x * n), n - 1), min(int(y * n), n - 1)
+
+    def agregar(self, lat: float | None, lon: float | None, signo: int = 1):
+        if lat is None or lon is None:
+            return
+        x, y = _mercator(lat, lon)
+        for zoom, nivel in enumerate(self.niveles):
+            clave = self._celda(x, y, zoom)
+            acumulado = nivel.get(clave)
+            if acumulado is None:
+                if signo < 0:
+                    continue
+                nivel[clave] = [1, lat, lon]
+                continue
+            acumulado[0] += signo
+            acumulado[1] += signo * lat
+            acumulado[2] += signo * lon
+            if acumulado[0] <= 0:
+                del nivel[clave]
+        self.total += signo
+
+    def quitar(self, lat: float | None, lon: float | None):
+        self.agregar(lat, lon, -1)
+
+    def zoom_para(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int) -> int:
+        """Zoom efectivo: el pedido, acotado para no pasar de ``MAPA_MAX_CELDAS``"""
+        zoom = max(0, min(self.zoom_max, zoom))
+        x0, y1 = _mercator(min_lat, min_lon)
+        x1, y0 = _mercator(max_lat, max_lon)
+        while zoom > 0:
+            cx0, cy0 = self._celda(x0, y0, zoom)
+            cx1, cy1 = self._celda(x1, y1, zoom)
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= MAPA_MAX_CELDAS:
+                break
+            zoom -= 1
+        return zoom
+
+    def consultar(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int) -> list[dict]:
+        """Centroide y cantidad de cada celda no vacía del recuadro en ``zoom``"""
+        nivel = self.niveles[zoom]
+        x0, y1 = _mercator(min_lat, min_lon)
+        x1, y0 = _mercator(max_lat, max_lon)
+        cx0, cy0 = self._celda(x0, y0, zoom)
+        cx1, cy1 = self._celda(x1, y1, zoom)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) <= len(nivel):
+            celdas = (
+                acumulado
+                for cx in range(cx0, cx1 + 1)
+                for cy in range(cy0, cy1 + 1)
+                if (acumulado := nivel.get((cx, cy))) is not None
+            )
+        else:
+            celdas = (
+                acumulado for (cx, cy), acumulado in nivel.items()
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1
+            )
+        return [
+            {"lat": suma_lat / cantidad, "lon": suma_lon / cantidad, "cantidad": cantidad}
+            for cantidad, suma_lat, suma_lon in celdas
+        ]
+
+
+_indices = {fuente: IndiceClusters() for fuente in FUENTES}
+_versiones: dict | None = None
+# Durante una carga: (fuente, pk) → posición final de cada cambio propio, o None si se borró
+_diario: dict | None = None
+_carga = asyncio.Lock()
+
+
+def indice(fuente: str) -> IndiceClusters:
+    return _indices[fuente]
+
+
+def _anotar(fuente: str, pk, lat: float | None, lon: float | None, existe: bool = True):
+    if _diario is not None:
+        _diario[(fuente, pk)] = (lat, lon) if existe else None
+
+
+def agregar(fuente: str, pk, lat: float | None, lon: float | None):
+    """Registrar un punto recién insertado (llamar tras el commit)"""
+    _indices[fuente].agregar(lat, lon)
+    _anotar(fuente, pk, lat, lon)
+
+
+def mover(fuente: str, pk, antes: tuple, lat: float | None, lon: float | None):
+    """Cambiar de sitio un punto; ``antes`` es su ``(lat, lon)`` leído con la fila bloqueada"""
+    _indices[fuente].quitar(*antes)
+    _indices[fuente].agregar(lat, lon)
+    _anotar(fuente, pk, lat, lon)
+
+
+def quitar(fuente: str, pk, lat: float | None, lon: float | None):
+    """Retirar un punto borrado (llamar tras el commit)"""
+    _indices[fuente].quitar(lat, lon)
+    _anotar(fuente, pk, lat, lon, existe=False)
+
+
+async def _leer_versiones(conn) -> dict | None:
+    try:
+        async with conn.begin_nested():
+            return dict((await conn.execute(_SQL_VERSIONES, {"origen": PROCESO})).all())
+    except Exception:
+        return None
+
+
+async def _conciliar(conn, nuevos: dict):
+    """
+    Aplicar a ``nuevos`` los cambios propios anotados durante la carga.
+
+    No se sabe si cada uno entró en la instantánea, así que se lee en ella
+    la posición de esas filas y se corrige la diferencia con la final.
+    """
+    en_instantanea = {}
+    while pendientes := [clave for clave in _diario if clave not in en_instantanea]:
+        for fuente, modelo in FUENTES.items():
+            pks = [pk for f, pk in pendientes if f == fuente]
+            if not pks:
+                continue
+            filas = await conn.execute(
+                select(modelo.id, modelo.lat, modelo.lon).where(modelo.id.in_(pks), *_VISIBLES[fuente])
+            )
+            for pk, lat, lon in filas:
+                en_instantanea[(fuente, pk)] = (lat, lon)
+            for pk in pks:
+                en_instantanea.setdefault((fuente, pk), None)
+    for (fuente, pk), final in _diario.items():
+        cargada = en_instantanea[(fuente, pk)]
+        if cargada != final:
+            if cargada:
+                nuevos[fuente].quitar(*cargada)
+            if final:
+                nuevos[fuente].agregar(*final)
+
+
+async def cargar(motor=async_engine) -> dict:
+    """(Re)construir los índices desde la base; devuelve cuántos puntos tiene cada uno"""
+    global _indices, _versiones, _diario
+    async with _carga:
+        _diario = {}
+        try:
+            async with motor.connect() as conn:
+                # Versiones y filas de una misma instantánea
+                conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+                versiones = await _leer_versiones(conn)
+                nuevos = {}
+                for fuente, modelo in FUENTES.items():
+                    nuevo = IndiceClusters()
+                    resultado = await conn.stream(
+                        select(modelo.lat, modelo.lon).where(*_VISIBLES[fuente])
+                    )
+                    async for lat, lon in resultado:
+                        nuevo.agregar(lat, lon)
+                    nuevos[fuente] = nuevo
+                await _conciliar(conn, nuevos)
+                # Sin await desde la conciliación: ningún cambio propio queda fuera
+                _indices, _versiones = nuevos, versiones
+        except Exception as e:
+            logger.warning("No se pudieron cargar los clusters del mapa: %s", e)
+        finally:
+            _diario = None
+    return {fuente: i.total for fuente, i in _indices.items()}
+
+
+async def _ciclo_refresco(motor):
+    while True:
+        await asyncio.sleep(MAPA_REFRESCO)
+        try:
+            async with motor.connect() as conn:
+                versiones = await _leer_versiones(conn)
+            if versiones is not None and versiones != _versiones:
+                await cargar(motor)
+        except Exception:
+            logger.exception("Error refrescando los clusters del mapa")
+
+
+def iniciar_refresco(motor=async_engine) -> asyncio.Task:
+    """Lanzar la reconstrucción periódica de los índices (llamar en el arranque)"""
+    return asyncio.create_task(_ciclo_refresco(motor), name="refresco-clusters-mapa")
@@ -0,0 +1,150 @@
+"""
+Instrumentación SQL por request
+
+Hooks de SQLAlchemy que cuentan sentencias y tiempo de base de datos del
+request en curso (ver ``EstadisticasRequest``) y detectan la firma N+1: la
+misma sentencia ejecutada varias veces con parámetros distintos. El
+middleware de ``app.main`` publica el resultado en ``Server-Timing`` y lo
+acumula por ruta para ``/api/internal/db-stats``.
+"""
+import logging
+import time
+from os import getenv
+
+from sqlalchemy import event  # type: ignore[import]
+
+from app import slow_queries
+from app.database import (
+    EstadisticasRequest,
+    async_engine,
+    async_read_engine,
+    engine,
+    estadisticas_request_actual,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ejecuciones con parámetros distintos a partir de las que se marca N+1
+DB_N1_UMBRAL = int(getenv("DB_N1_UMBRAL", "2"))
+_MAX_EJEMPLOS = 5
+
+
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    conn.info["inicio_sql"] = time.perf_counter()
+
+
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop("inicio_sql", None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    stats = estadisticas_request_actual()
+    if stats is not None:
+        stats.registrar_sentencia(statement, parameters, duracion, executemany)
+    if duracion >= slow_queries.DB_SLOW_QUERY_MS / 1000:
+        slow_queries.registrar(
+            conn.engine, statement, parameters, duracion, stats.ruta() if stats else None, executemany
+        )
+
+
+def instrumentar(motor):
+    """Registrar los hooks de medición en un engine síncrono"""
+    event.listen(motor, "before_cursor_execute", _antes_de_ejecutar)
+    event.listen(motor, "after_cursor_execute", _despues_de_ejecutar)
+
+
+instrumentar(engine)
+for _motor in (async_engine, async_read_engine):
+    if _motor is not None:
+        instrumentar(_motor.sync_engine)
+
+
+class AgregadoRuta:
+    """Acumulado de uso de base de datos de una ruta"""
+
+    __slots__ = ("requests", "sentencias", "tiempo_db", "max_sentencias", "checkouts",
+                 "requests_n1", "ejemplos_n1")
+
+    def __init__(self):
+        self.requests = 0
+        self.sentencias = 0
+        self.tiempo_db = 0.0
+        self.max_sentencias = 0
+        self.checkouts = 0
+        self.requests_n1 = 0
+        self.ejemplos_n1: dict[str, int] = {}
+
+    def como_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "sentencias": self.sentencias,
+            "sentencias_por_request": round(self.sentencias / self.requests, 2) if self.requests else 0,
+            "max_sentencias": self.max_sentencias,
+            "tiempo_db_ms": round(self.tiempo_db * 1000, 2),
+            "tiempo_db_medio_ms": round(self.tiempo_db * 1000 / self.requests, 2) if self.requests else 0,
+            "checkouts": self.checkouts,
+            "requests_n1": self.requests_n1,
+            "ejemplos_n1": self.ejemplos_n1,
+        }
+
+
+_por_ruta: dict[str, AgregadoRuta] = {}
+
+
+def registrar_request(ruta: str, stats: EstadisticasRequest) -> dict[str, int]:
+    """Acumular las estadísticas de un request; devuelve sus sentencias N+1"""
+    agregado = _por_ruta.get(ruta)
+    if agregado is None:
+        agregado = _por_ruta[ruta] = AgregadoRuta()
+    agregado.requests += 1
+    agregado.sentencias += stats.sentencias
+    agregado.tiempo_db += stats.tiempo_db
+    agregado.checkouts += stats.checkouts
+    agregado.max_sentencias = max(agregado.max_sentencias, stats.sentencias)
+
+    repetidas = stats.sentencias_repetidas(DB_N1_UMBRAL)
+    if repetidas:
+        agregado.requests_n1 += 1
+        for sql, veces in repetidas.items():
+            if sql in agregado.ejemplos_n1 or len(agregado.ejemplos_n1) < _MAX_EJEMPLOS:
+                agregado.ejemplos_n1[sql] = max(veces, agregado.ejemplos_n1.get(sql, 0))
+        logger.warning("Posible N+1 en %s: %s", ruta, {sql[:120]: n for sql, n in repetidas.items()})
+    return repetidas
+
+
+def cabecera_server_timing(stats: EstadisticasRequest, repetidas: dict[str, int]) -> str:
+    """Valor de ``Server-Timing`` con el tiempo y número de sentencias SQL"""
+    partes = [
+        f'db;dur={stats.tiempo_db * 1000:.2f};desc="{stats.sentencias} sentencias"',
+        f"db-checkouts;desc={stats.checkouts}",
+    ]
+    if repetidas:
+        partes.append(f'db-n1;desc="{len(repetidas)} repetidas"')
+    return ", ".join(partes)
+
+
+def _estado_pool(motor) -> dict:
+    pool = motor.sync_engine.pool
+    estado = {"clase": type(pool).__name__}
+    for nombre in ("size", "checkedin", "checkedout", "overflow"):
+        metodo = getattr(pool, nombre, None)
+        if metodo is not None:
+            estado[nombre] = metodo()
+    return estado
+
+
+def resumen() -> dict:
+    """Acumulado por ruta y estado actual de los pools"""
+    pools = {"primario": _estado_pool(async_engine)}
+    if async_read_engine is not None:
+        pools["replica"] = _estado_pool(async_read_engine)
+    rutas = sorted(_por_ruta.items(), key=lambda kv: kv[1].tiempo_db, reverse=True)
+    return {
+        "umbral_n1": DB_N1_UMBRAL,
+        "pools": pools,
+        "rutas": {ruta: agregado.como_dict() for ruta, agregado in rutas},
+    }
+
+
+def reiniciar():
+    _por_ruta.clear()
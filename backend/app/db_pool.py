@@ -0,0 +1,169 @@
+"""
+Mantenimiento del pool de conexiones asíncrono
+
+Sustituye a ``pool_pre_ping``: en lugar de un ``SELECT 1`` en cada checkout,
+una tarea en segundo plano revisa periódicamente las conexiones inactivas,
+valida las que llevan tiempo sin usarse y recicla las que se acercan a
+``DB_POOL_RECYCLE`` antes de que un request tenga que reconectar.
+"""
+import asyncio
+import logging
+import time
+
+from sqlalchemy.exc import DBAPIError  # type: ignore[import]
+
+from app.database import (
+    DB_POOL_CHECK_INTERVAL,
+    DB_POOL_IDLE_PING,
+    DB_POOL_RECYCLE,
+    DB_READ_LAG_INTERVAL,
+    DB_READ_MAX_LAG,
+    async_engine,
+    async_read_engine,
+    estado_replica,
+    monitor_pool_activo,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _abrir_y_validar(motor):
+    conn = await motor.connect()
+    try:
+        await conn.exec_driver_sql("SELECT 1")
+    finally:
+        await conn.close()
+
+
+async def calentar_pool(n: int, motor=async_engine) -> int:
+    """Abrir ``n`` conexiones en paralelo y dejarlas en el pool"""
+    if n <= 0:
+        return 0
+    token = monitor_pool_activo.set(True)
+    try:
+        resultados = await asyncio.gather(
+            *[_abrir_y_validar(motor) for _ in range(n)], return_exceptions=True
+        )
+    finally:
+        monitor_pool_activo.reset(token)
+    errores = [r for r in resultados if isinstance(r, Exception)]
+    if errores:
+        logger.warning("No se pudieron precalentar %d conexiones: %s", len(errores), errores[0])
+    return n - len(errores)
+
+
+async def revisar_conexiones_inactivas(motor=async_engine) -> dict:
+    """
+    Revisar cada conexión inactiva del pool una vez.
+
+    El pool es FIFO, así que sacar y devolver tantas conexiones como hay
+    inactivas recorre cada una. Las que superan el 90 % de
+    ``DB_POOL_RECYCLE`` se invalidan y se reabren; las que llevan más de
+    ``DB_POOL_IDLE_PING`` segundos sin uso se validan con ``SELECT 1``.
+    """
+    pool = motor.sync_engine.pool
+    resumen = {"revisadas": 0, "validadas": 0, "recicladas": 0}
+    token = monitor_pool_activo.set(True)
+    try:
+        for _ in range(pool.checkedin()):
+            async with motor.connect() as conn:
+                info = (await conn.get_raw_connection()).info
+                ahora = time.monotonic()
+                resumen["revisadas"] += 1
+
+                if ahora - info.get("abierta_en", ahora) > DB_POOL_RECYCLE * 0.9:
+                    await conn.invalidate()
+                    resumen["recicladas"] += 1
+                    continue
+
+                if ahora - info.get("usada_en", ahora) < DB_POOL_IDLE_PING:
+                    continue
+
+                try:
+                    await conn.exec_driver_sql("SELECT 1")
+                    resumen["validadas"] += 1
+                except DBAPIError:
+                    await conn.invalidate()
+                    resumen["recicladas"] += 1
+    finally:
+        monitor_pool_activo.reset(token)
+
+    if resumen["recicladas"]:
+        await calentar_pool(resumen["recicladas"], motor)
+    return resumen
+
+
+_SQL_LAG_REPLICA = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+async def medir_lag_replica() -> bool:
+    """
+    Medir el retraso de replicación y decidir si la réplica puede servir lecturas.
+
+    Si la réplica no responde o su lag supera ``DB_READ_MAX_LAG`` se marca
+    como no disponible y ``get_read_db`` vuelve al primario.
+    """
+    if async_read_engine is None:
+        return False
+    token = monitor_pool_activo.set(True)
+    try:
+        async with async_read_engine.connect() as conn:
+            lag = (await conn.exec_driver_sql(_SQL_LAG_REPLICA)).scalar()
+        estado_replica.lag = float(lag or 0)
+        estado_replica.disponible = estado_replica.lag <= DB_READ_MAX_LAG
+    except Exception as e:
+        if estado_replica.disponible:
+            logger.warning("Réplica de lectura no disponible, usando el primario: %s", e)
+        estado_replica.lag = None
+        estado_replica.disponible = False
+    finally:
+        monitor_pool_activo.reset(token)
+    estado_replica.verificada_en = time.monotonic()
+    return estado_replica.disponible
+
+
+async def _ciclo_monitor():
+    motores = [m for m in (async_engine, async_read_engine) if m is not None]
+    while True:
+        await asyncio.sleep(DB_POOL_CHECK_INTERVAL)
+        for motor in motores:
+            try:
+                resumen = await revisar_conexiones_inactivas(motor)
+                if resumen["recicladas"]:
+                    logger.info("Pool %s: %s", motor.url.host, resumen)
+            except Exception:
+                logger.exception("Error revisando el pool de conexiones")
+
+
+async def _ciclo_lag_replica():
+    while True:
+        await asyncio.sleep(DB_READ_LAG_INTERVAL)
+        await medir_lag_replica()
+
+
+def iniciar_monitor_pool() -> asyncio.Task:
+    """Lanzar la tarea de mantenimiento del pool (llamar en el arranque)"""
+    return asyncio.create_task(_ciclo_monitor(), name="monitor-pool-db")
+
+
+def iniciar_monitor_replica() -> asyncio.Task | None:
+    """Lanzar la vigilancia del lag de la réplica, si hay réplica configurada"""
+    if async_read_engine is None:
+        return None
+    return asyncio.create_task(_ciclo_lag_replica(), name="monitor-replica-db")
+
+
+async def detener_tarea(tarea: asyncio.Task | None):
+    """Cancelar una tarea de fondo y esperar a que termine"""
+    if tarea is None:
+        return
+    tarea.cancel()
+    try:
+        await tarea
+    except asyncio.CancelledError:
+        pass
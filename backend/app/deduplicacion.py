@@ -0,0 +1,300 @@
+"""
+Deduplicación espacio-temporal de reportes al ingresarlos
+
+Un reporte nuevo se considera repetido si hay otro abierto (ENVIADO o
+EN_PROCESO) del mismo ``type`` a menos de ``DEDUPE_RADIO_M`` metros creado
+en las últimas ``DEDUPE_HORAS`` horas. En ese caso el nuevo se guarda con
+``duplicate_of`` apuntando al existente (conserva su descripción, foto y
+usuario, pero no se lista ni se usa como original), se suma uno a
+``duplicates`` del existente y se devuelve ese reporte.
+
+Los reportes abiertos de la ventana se guardan en memoria en cubetas
+geohash de una precisión cuya celda es al menos del tamaño del radio, de
+modo que los candidatos están en la cubeta del punto o en sus 8 vecinas.
+El índice se carga al arrancar y cada ``DEDUPE_REFRESCO`` s añade los
+reportes que hayan creado otros workers; cada lectura repite los últimos
+``DEDUPE_SOLAPE`` s, porque ``created_at`` lo pone la app al recibir el
+reporte y una fila puede confirmarse después de otras más nuevas. Que un candidato siga abierto se
+comprueba en el propio ``UPDATE`` que lo vincula; dos reportes simultáneos
+en workers distintos pueden crear dos filas, que ``deduplicar_historico``
+marca después con ``duplicate_of``.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from math import asin, cos, radians, sin, sqrt
+from os import getenv
+
+from sqlalchemy import select, tuple_, update  # type: ignore[import]
+
+from app.database import AsyncSessionLocal, async_engine
+from app.models import Report
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_RADIO_M = float(getenv("DEDUPE_RADIO_M", "50"))  # 0 desactiva la deduplicación
+DEDUPE_HORAS = float(getenv("DEDUPE_HORAS", "24"))
+DEDUPE_REFRESCO = float(getenv("DEDUPE_REFRESCO", "30"))
+DEDUPE_SOLAPE = float(getenv("DEDUPE_SOLAPE", "300"))
+
+ESTADOS_ABIERTOS = ("ENVIADO", "EN_PROCESO")
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_RADIO_TIERRA_M = 6_371_000
+
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+    lat_min, lat_max, lon_min, lon_max = -90.0, 90.0, -180.0, 180.0
+    caracteres = []
+    bits = valor = 0
+    par = True  # los bits pares son de longitud
+    while len(caracteres) < precision:
+        if par:
+            medio = (lon_min + lon_max) / 2
+            valor = valor * 2 + (lon >= medio)
+            lon_min, lon_max = (medio, lon_max) if lon >= medio else (lon_min, medio)
+        else:
+            medio = (lat_min + lat_max) / 2
+            valor = valor * 2 + (lat >= medio)
+            lat_min, lat_max = (medio, lat_max) if lat >= medio else (lat_min, medio)
+        par = not par
+        bits += 1
+        if bits == 5:
+            caracteres.append(_BASE32[valor])
+            bits = valor = 0
+    return "".join(caracteres)
+
+
+def _celda_grados(precision: int) -> tuple[float, float]:
+    """``(alto, ancho)`` en grados de una celda geohash"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def precision_para(radio_m: float, lat: float = 0.0) -> int:
+    """Mayor precisión cuya celda mide al menos ``radio_m`` en ambos ejes"""
+    for precision in range(9, 0, -1):
+        alto, ancho = _celda_grados(precision)
+        if alto * 111_320 >= radio_m and ancho * 111_320 * cos(radians(lat)) >= radio_m:
+            return precision
+    return 1
+
+
+def distancia_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia haversine en metros"""
+    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * _RADIO_TIERRA_M * asin(sqrt(a))
+
+
+class IndiceDedupe:
+    """Reportes abiertos recientes en cubetas geohash: ``cubeta → [(id, type, lat, lon, creado)]``"""
+
+    def __init__(self, radio_m: float = DEDUPE_RADIO_M, horas: float = DEDUPE_HORAS, lat_referencia: float = 0.0):
+        self.radio_m = radio_m
+        self.ventana = timedelta(hours=horas)
+        # La celda más estrecha es la de mayor |lat|: se dimensiona para la de referencia
+        self.precision = precision_para(radio_m, lat_referencia)
+        self._alto, self._ancho = _celda_grados(self.precision)
+        self._cubetas: dict[str, list[tuple]] = defaultdict(list)
+        self._cubeta_de: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._cubeta_de)
+
+    def __contains__(self, id_) -> bool:
+        return id_ in self._cubeta_de
+
+    def agregar(self, id_, tipo: str, lat: float, lon: float, creado: datetime):
+        if id_ in self._cubeta_de:
+            return
+        cubeta = geohash(lat, lon, self.precision)
+        self._cubetas[cubeta].append((id_, tipo, lat, lon, creado))
+        self._cubeta_de[id_] = cubeta
+
+    def quitar(self, id_):
+        cubeta = self._cubeta_de.pop(id_, None)
+        if cubeta is None:
+            return
+        entradas = [e for e in self._cubetas[cubeta] if e[0] != id_]
+        if entradas:
+            self._cubetas[cubeta] = entradas
+        else:
+            del self._cubetas[cubeta]
+
+    def candidatos(self, tipo: str, lat: float, lon: float, ahora: datetime) -> list:
+        """Ids del mismo tipo dentro del radio y la ventana, del más cercano al más lejano"""
+        desde = ahora - self.ventana
+        cubetas = {
+            geohash(lat + dy * self._alto, lon + dx * self._ancho, self.precision)
+            for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+        }
+        encontrados = []
+        for cubeta in cubetas:
+            for id_, tipo_e, lat_e, lon_e, creado in self._cubetas.get(cubeta, ()):
+                if tipo_e != tipo or creado < desde:
+                    continue
+                d = distancia_m(lat, lon, lat_e, lon_e)
+                if d <= self.radio_m:
+                    encontrados.append((d, id_))
+        return [id_ for _, id_ in sorted(encontrados)]
+
+    def podar(self, ahora: datetime) -> int:
+        """Quitar las entradas fuera de la ventana"""
+        desde = ahora - self.ventana
+        viejos = [e[0] for entradas in self._cubetas.values() for e in entradas if e[4] < desde]
+        for id_ in viejos:
+            self.quitar(id_)
+        return len(viejos)
+
+
+# Latacunga (-0.93) por defecto; ver precision_para
+_LAT_REFERENCIA = float(getenv("DEDUPE_LAT_REFERENCIA", "-0.93"))
+
+_indice = IndiceDedupe(lat_referencia=_LAT_REFERENCIA)
+_ultimo_creado: datetime | None = None
+
+
+def _abiertos_desde(desde: datetime):
+    return (
+        select(Report.id, Report.type, Report.lat, Report.lon, Report.created_at)
+        .where(
+            Report.created_at > desde,
+            Report.status.in_(ESTADOS_ABIERTOS),
+            Report.duplicate_of.is_(None),
+            Report.lat.is_not(None),
+            Report.lon.is_not(None),
+        )
+        .order_by(Report.created_at)
+    )
+
+
+async def cargar(motor=async_engine) -> int:
+    """Añadir al índice los reportes abiertos creados desde la última carga (o de toda la ventana)"""
+    global _ultimo_creado
+    if DEDUPE_RADIO_M <= 0:
+        return 0
+    ahora = datetime.utcnow()
+    if _ultimo_creado is None:
+        desde = ahora - _indice.ventana
+    else:
+        # Los ya indexados se ignoran (agregar es idempotente)
+        desde = _ultimo_creado - timedelta(seconds=DEDUPE_SOLAPE)
+    try:
+        async with motor.connect() as conn:
+            filas = (await conn.execute(_abiertos_desde(desde))).all()
+    except Exception as e:
+        logger.warning("No se pudo cargar el índice de deduplicación: %s", e)
+        return len(_indice)
+    for id_, tipo, lat, lon, creado in filas:
+        _indice.agregar(id_, tipo, lat, lon, creado)
+    if filas:
+        _ultimo_creado = max(_ultimo_creado or filas[-1].created_at, filas[-1].created_at)
+    _indice.podar(ahora)
+    return len(_indice)
+
+
+async def _ciclo_refresco(motor):
+    while True:
+        await asyncio.sleep(DEDUPE_REFRESCO)
+        try:
+            await cargar(motor)
+        except Exception:
+            logger.exception("Error refrescando el índice de deduplicación")
+
+
+def iniciar_refresco(motor=async_engine) -> asyncio.Task | None:
+    """Lanzar el refresco periódico del índice (llamar en el arranque)"""
+    if DEDUPE_RADIO_M <= 0:
+        return None
+    return asyncio.create_task(_ciclo_refresco(motor), name="refresco-dedupe-reportes")
+
+
+def registrar(reporte: Report):
+    """Añadir al índice un reporte recién creado (llamar tras el commit)"""
+    if DEDUPE_RADIO_M > 0 and reporte.lat is not None and reporte.lon is not None:
+        _indice.agregar(reporte.id, reporte.type, reporte.lat, reporte.lon, reporte.created_at)
+
+
+async def vincular(db, tipo: str, lat: float, lon: float) -> Report | None:
+    """
+    Si hay un reporte abierto que coincide, sumarle uno a ``duplicates`` y devolverlo.
+    El que llama guarda el nuevo con ``duplicate_of`` en la misma transacción.
+
+    Un solo ``UPDATE ... RETURNING`` por candidato, que además comprueba que
+    siga abierto; los que ya no lo están salen del índice.
+    """
+    if DEDUPE_RADIO_M <= 0:
+        return None
+    for id_ in _indice.candidatos(tipo, lat, lon, datetime.utcnow()):
+        reporte = (await db.execute(
+            update(Report)
+            .where(Report.id == id_, Report.status.in_(ESTADOS_ABIERTOS), Report.duplicate_of.is_(None))
+            .values(duplicates=Report.duplicates + 1, updated_at=datetime.utcnow(), version=Report.version + 1)
+            .returning(Report)
+        )).scalars().first()
+        if reporte is not None:
+            return reporte
+        _indice.quitar(id_)
+    return None
+
+
+async def deduplicar_historico(lote: int = 1000, radio_m: float = DEDUPE_RADIO_M, horas: float = DEDUPE_HORAS) -> dict:
+    """
+    Marcar con ``duplicate_of`` los reportes abiertos que repiten a otro anterior.
+
+    Recorre la tabla por ``created_at`` en bloques de ``lote`` con un índice
+    deslizante (solo los reportes de la ventana quedan en memoria). El
+    primero de cada grupo queda como original y su ``duplicates`` se
+    incrementa. Los ya marcados se saltan, así que se puede repetir.
+    """
+    indice = IndiceDedupe(radio_m, horas, _LAT_REFERENCIA)
+    base_duplicates: dict = {}  # original en la ventana → duplicates al leerlo
+    sumados: dict = defaultdict(int)
+    resumen = {"revisados": 0, "duplicados": 0}
+    clave = None
+    async with AsyncSessionLocal() as db:
+        while True:
+            query = (
+                select(Report.id, Report.type, Report.lat, Report.lon, Report.created_at, Report.duplicates)
+                .where(
+                    Report.status.in_(ESTADOS_ABIERTOS),
+                    Report.duplicate_of.is_(None),
+                    Report.lat.is_not(None),
+                    Report.lon.is_not(None),
+                )
+                .order_by(Report.created_at, Report.id)
+                .limit(lote)
+            )
+            if clave is not None:
+                query = query.where(tuple_(Report.created_at, Report.id) > tuple_(*clave))
+            filas = (await db.execute(query)).all()
+            if not filas:
+                break
+            marcas = []
+            for id_, tipo, lat, lon, creado, duplicates in filas:
+                original = next(iter(indice.candidatos(tipo, lat, lon, creado)), None)
+                if original is None:
+                    indice.agregar(id_, tipo, lat, lon, creado)
+                    base_duplicates[id_] = duplicates or 0
+                else:
+                    marcas.append({"id": id_, "duplicate_of": original})
+                    sumados[original] += 1
+            if marcas:
+                await db.execute(update(Report), marcas)
+            if sumados:
+                await db.execute(update(Report), [
+                    {"id": id_, "duplicates": base_duplicates[id_] + n} for id_, n in sumados.items()
+                ])
+                for id_, n in sumados.items():
+                    base_duplicates[id_] += n
+                sumados.clear()
+            await db.commit()
+            resumen["revisados"] += len(filas)
+            resumen["duplicados"] += len(marcas)
+            clave = (filas[-1].created_at, filas[-1].id)
+            indice.podar(filas[-1].created_at)
+            for id_ in [i for i in base_duplicates if i not in indice]:
+                del base_duplicates[id_]
+    return resumen
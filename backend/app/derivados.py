@@ -0,0 +1,152 @@
+"""
+Derivados de las fotos de evidencia (miniatura, mediana, WebP)
+
+Tras cada subida se generan, fuera del request y en un
+``ProcessPoolExecutor`` (decodificar y reescalar es CPU pura y no debe
+bloquear el event loop ni competir por el GIL), tres versiones WebP del
+original:
+
+    derivados/ab/cd/<sha256>_miniatura.webp   320 px de lado mayor
+    derivados/ab/cd/<sha256>_mediana.webp    1280 px
+    derivados/ab/cd/<sha256>_webp.webp       tamaño original
+
+El nombre depende solo del hash del original, así que cada derivado se
+genera una vez por contenido y sirve para todos los adjuntos que lo
+comparten. Si falta alguno (p. ej. tras un reinicio), ``asegurar`` lo
+genera al pedirlo. Requiere Pillow; sin él solo se sirven los originales.
+"""
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from os import getenv
+from pathlib import Path
+
+from app.media import MEDIA_ROOT, MEDIA_URL
+
+logger = logging.getLogger(__name__)
+
+DERIVADOS_PROCESOS = int(getenv("DERIVADOS_PROCESOS", "2"))
+
+# variante → (lado mayor en px o None para conservarlo, calidad WebP); de mayor a menor
+VARIANTES = {
+    "webp": (None, 85),
+    "mediana": (1280, 80),
+    "miniatura": (320, 75),
+}
+
+DISPONIBLE = importlib.util.find_spec("PIL") is not None
+
+_RUTA_DERIVADO = re.compile(r"^derivados/([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})_([a-z]+)\.webp$")
+
+_ejecutor: ProcessPoolExecutor | None = None
+_en_curso: dict[str, asyncio.Future] = {}
+_tareas: set[asyncio.Task] = set()
+
+
+def ruta(sha256: str, variante: str) -> str:
+    """Ruta del derivado relativa a ``MEDIA_ROOT``"""
+    return f"derivados/{sha256[:2]}/{sha256[2:4]}/{sha256}_{variante}.webp"
+
+
+def urls(sha256: str | None) -> dict[str, str]:
+    if not sha256 or not DISPONIBLE:
+        return {}
+    return {variante: f"{MEDIA_URL}/{ruta(sha256, variante)}" for variante in VARIANTES}
+
+
+def _generar(original: str, base: str) -> list[str]:
+    """En el proceso hijo: escribir los derivados que falten; devuelve los generados"""
+    from PIL import Image, ImageOps  # type: ignore[import]
+
+    generados = []
+    with Image.open(original) as abierta:
+        imagen = ImageOps.exif_transpose(abierta)
+        if imagen.mode not in ("RGB", "RGBA"):
+            imagen = imagen.convert("RGBA" if "transparency" in imagen.info else "RGB")
+        # Cada variante se reduce desde la anterior (más rápido que desde el original)
+        for variante, (lado, calidad) in VARIANTES.items():
+            if lado:
+                imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            destino = f"{base}_{variante}.webp"
+            if os.path.exists(destino):
+                continue
+            temporal = f"{destino}.{os.getpid()}.parcial"
+            imagen.save(temporal, "WEBP", quality=calidad, method=4)
+            os.replace(temporal, destino)
+            generados.append(variante)
+    return generados
+
+
+def iniciar():
+    """Crear el pool de procesos (llamar en el arranque)"""
+    global _ejecutor
+    if DISPONIBLE and _ejecutor is None:
+        # spawn: no heredar del padre el event loop ni las conexiones abiertas
+        _ejecutor = ProcessPoolExecutor(
+            max_workers=DERIVADOS_PROCESOS, mp_context=multiprocessing.get_context("spawn")
+        )
+
+
+def detener():
+    global _ejecutor
+    if _ejecutor is not None:
+        _ejecutor.shutdown(wait=False, cancel_futures=True)
+        _ejecutor = None
+
+
+async def generar(sha256: str, original: Path) -> list[str]:
+    """Generar los derivados de ``original``; peticiones simultáneas del mismo hash comparten el trabajo"""
+    futuro = _en_curso.get(sha256)
+    if futuro is None:
+        iniciar()
+        base = MEDIA_ROOT / f"derivados/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+        await asyncio.to_thread(base.parent.mkdir, parents=True, exist_ok=True)
+        futuro = asyncio.get_running_loop().run_in_executor(_ejecutor, _generar, str(original), str(base))
+        _en_curso[sha256] = futuro
+        futuro.add_done_callback(lambda _: _en_curso.pop(sha256, None))
+    try:
+        return await asyncio.shield(futuro)
+    except BrokenProcessPool:
+        # Un hijo murió (p. ej. sin memoria): el pool ya no sirve, se recrea en la próxima llamada
+        detener()
+        raise
+
+
+async def _generar_en_segundo_plano(sha256: str, original: Path):
+    try:
+        await generar(sha256, original)
+    except Exception as e:
+        logger.warning("No se pudieron generar los derivados de %s: %s", sha256, e)
+
+
+def programar(archivo) -> None:
+    """Encolar los derivados de un ``media.Archivo`` recién subido, sin esperar"""
+    if not DISPONIBLE:
+        return
+    tarea = asyncio.create_task(_generar_en_segundo_plano(archivo.sha256, MEDIA_ROOT / archivo.ruta))
+    _tareas.add(tarea)
+    tarea.add_done_callback(_tareas.discard)
+
+
+async def asegurar(relativa: str) -> bool:
+    """Si ``relativa`` es un derivado que falta y existe su original, generarlo; True si queda disponible"""
+    coincidencia = _RUTA_DERIVADO.match(relativa)
+    if not DISPONIBLE or not coincidencia or coincidencia.group(4) not in VARIANTES:
+        return False
+    sha256 = coincidencia.group(3)
+    originales = await asyncio.to_thread(
+        lambda: list((MEDIA_ROOT / "originales" / sha256[:2] / sha256[2:4]).glob(f"{sha256}.*"))
+    )
+    if not originales:
+        return False
+    try:
+        await generar(sha256, originales[0])
+    except Exception as e:
+        logger.warning("No se pudieron generar los derivados de %s: %s", sha256, e)
+        return False
+    return (MEDIA_ROOT / relativa).exists()
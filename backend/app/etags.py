@@ -0,0 +1,182 @@
+"""
+Peticiones condicionales (ETag / If-None-Match)
+
+La versión de cada tabla la mantienen en la base triggers por sentencia en
+cada INSERT/UPDATE/DELETE (migraciones 017 y 023), así que todos los
+workers ven el mismo valor; los contadores de ``app.versiones`` son por
+proceso y podrían dar un 304 con datos que otro worker ya cambió. Los
+triggers solo insertan en ``table_version_log``, sin fila compartida que
+serialice a los escritores; ``iniciar_compactacion`` vacía ese log cada
+``TABLE_VERSIONS_COMPACTAR`` s.
+
+El ETag de un GET es un hash de la versión y de la URL (ruta y query:
+filtros, cursor, id del detalle). Si coincide con ``If-None-Match`` se
+responde ``304`` antes de ejecutar el endpoint: una respuesta no
+modificada cuesta una lectura de la versión, sin cargar ni serializar
+filas. En los detalles de modelos con columna ``version`` (migraciones 016,
+022 y 025) se usa la de la fila, así que escribir en otras filas no
+invalida su ETag.
+
+La versión se lee con la misma sesión del endpoint. Si esa sesión va a la
+réplica y su versión de la tabla es menor que la del primario, el request
+entero se sirve desde el primario, para no dar un 304 (ni un ETag nuevo)
+con datos atrasados. La del primario se guarda ``ETAGS_PRIMARIO_TTL`` s
+por proceso: un retraso de la réplica menor que eso no se detecta. Se usa
+como dependencia de la ruta::
+
+    @router.get("/", dependencies=[etags.condicional("incidencias")])
+    @router.get("/{incidencia_id}", dependencies=[etags.condicional("incidencias", Incidencia, "incidencia_id")])
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from os import getenv
+from typing import Annotated
+
+from fastapi import Depends, Request, Response  # type: ignore[import]
+from sqlalchemy import bindparam, func, select, text  # type: ignore[import]
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
+
+from app.database import async_engine, get_read_db
+
+logger = logging.getLogger(__name__)
+
+# El cliente puede guardar la respuesta pero debe revalidarla siempre
+CACHE_CONTROL = "private, no-cache"
+
+TABLE_VERSIONS_COMPACTAR = float(getenv("TABLE_VERSIONS_COMPACTAR", "60"))
+ETAGS_PRIMARIO_TTL = float(getenv("ETAGS_PRIMARIO_TTL", "1"))
+
+_SQL_VERSION = text("SELECT table_version(:tabla)")
+
+# tabla → (leída en, versión en el primario)
+_primario: dict[str, tuple[float, int]] = {}
+# modelo → SELECT de la versión de la fila y de la tabla
+_por_fila: dict = {}
+
+# None hasta comprobar en el arranque que existe table_version() (migración 023)
+_disponible: bool | None = None
+
+
+class NoModificado(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+async def respuesta_no_modificado(request: Request, exc: NoModificado) -> Response:
+    """Manejador de ``NoModificado``: 304 sin cuerpo"""
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": CACHE_CONTROL})
+
+
+async def comprobar_disponible(motor=async_engine) -> bool:
+    """Activar los ETags solo si existe ``table_version()`` (llamar en el arranque)"""
+    global _disponible
+    try:
+        async with motor.connect() as conn:
+            await conn.execute(_SQL_VERSION, {"tabla": "incidencias"})
+        _disponible = True
+    except Exception as e:
+        logger.warning("ETags desactivados: falta table_version() (migraciones 017 y 023): %s", e)
+        _disponible = False
+    return _disponible
+
+
+def _coincide(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    propio = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == propio for candidato in if_none_match.split(","))
+
+
+def calcular_etag(tabla: str, version: int, request: Request) -> str:
+    clave = f"{tabla}:{version}:{request.url.path}?{request.url.query}"
+    return f'W/"{hashlib.blake2b(clave.encode(), digest_size=12).hexdigest()}"'
+
+
+def _sentencia_fila(modelo):
+    stmt = _por_fila.get(modelo)
+    if stmt is None:
+        pk = modelo.__mapper__.primary_key[0]
+        # La de la tabla aunque la fila no exista: puede que la réplica aún no la tenga
+        stmt = _por_fila[modelo] = select(
+            select(modelo.version).where(pk == bindparam("pk")).scalar_subquery(),
+            func.table_version(bindparam("tabla")),
+        )
+    return stmt
+
+
+async def _leer(db, tabla: str, modelo, pk) -> tuple[int | None, int]:
+    """``(validador, versión de la tabla)``; validador None si la fila no existe"""
+    if modelo is None:
+        version = await db.scalar(_SQL_VERSION, {"tabla": tabla}) or 0
+        return version, version
+    validador, version = (await db.execute(_sentencia_fila(modelo), {"tabla": tabla, "pk": pk})).one()
+    return validador, version or 0
+
+
+async def _version_primario(tabla: str) -> int:
+    entrada = _primario.get(tabla)
+    if entrada is not None and time.monotonic() - entrada[0] < ETAGS_PRIMARIO_TTL:
+        return entrada[1]
+    async with async_engine.connect() as conn:
+        version = await conn.scalar(_SQL_VERSION, {"tabla": tabla}) or 0
+    _primario[tabla] = (time.monotonic(), version)
+    return version
+
+
+def condicional(tabla: str, modelo=None, parametro: str | None = None):
+    """
+    Dependencia que añade ``ETag`` a la respuesta o corta con 304.
+
+    Con ``modelo`` (que debe tener columna ``version``), el validador es la
+    versión de la fila cuya clave primaria viene en el parámetro de ruta
+    ``parametro``; si no existe no se pone ETag y el endpoint responde 404.
+    """
+    tipo_pk = modelo.__mapper__.primary_key[0].type.python_type if modelo is not None else None
+
+    async def comprobar_etag(
+        request: Request,
+        response: Response,
+        db: Annotated[AsyncSession, Depends(get_read_db)],
+    ):
+        if not _disponible:
+            return
+        pk = None
+        if modelo is not None:
+            try:
+                pk = tipo_pk(request.path_params[parametro])
+            except ValueError:
+                return
+        validador, version = await _leer(db, tabla, modelo, pk)
+        if db.en_replica and version < await _version_primario(tabla):
+            await db.usar_primario()
+            validador, version = await _leer(db, tabla, modelo, pk)
+        if validador is None:
+            return
+        etag = calcular_etag(tabla, validador, request)
+        if _coincide(request.headers.get("if-none-match"), etag):
+            raise NoModificado(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+
+    return Depends(comprobar_etag)
+
+
+async def _ciclo_compactacion(motor):
+    while True:
+        await asyncio.sleep(TABLE_VERSIONS_COMPACTAR)
+        try:
+            async with motor.begin() as conn:
+                await conn.execute(text("SELECT compactar_table_versions()"))
+        except Exception:
+            logger.exception("Error compactando table_version_log")
+
+
+def iniciar_compactacion(motor=async_engine) -> asyncio.Task | None:
+    """Lanzar la compactación periódica del log de versiones (llamar tras ``comprobar_disponible``)"""
+    if not _disponible:
+        return None
+    return asyncio.create_task(_ciclo_compactacion(motor), name="compactacion-table-versions")
@@ -0,0 +1,78 @@
+"""
+Consultas espaciales sobre columnas ``lat``/``lon`` (PostGIS)
+
+Los modelos guardan la posición como dos ``Float``; en lugar de añadir una
+columna de geometría se indexa la expresión ``geography(ST_SetSRID(
+ST_MakePoint(lon, lat), 4326))`` con GiST (migración 014). Las consultas
+usan exactamente esa expresión, con el SRID como literal, para que el
+planificador reconozca el índice.
+
+Ambas búsquedas devuelven los resultados por distancia en metros al punto
+de referencia (el centro del recuadro en ``bbox``), paginados con un cursor
+``(distancia, id)`` en la cabecera ``X-Next-Cursor``.
+"""
+from fastapi import HTTPException, Response  # type: ignore[import]
+from sqlalchemy import func, literal_column, tuple_  # type: ignore[import]
+
+from app.paginacion import CABECERA_CURSOR, codificar_valores, decodificar_valores
+
+_SRID = literal_column("4326")
+
+# Radio máximo admitido en /near (metros)
+RADIO_MAXIMO = 50_000
+
+
+def punto_de(modelo):
+    """Expresión indexada con la posición de cada fila del modelo"""
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(modelo.lon, modelo.lat), _SRID))
+
+
+def punto(lat: float, lon: float):
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(lon, lat), _SRID))
+
+
+def _paginar_por_distancia(query, modelo, distancia, cursor: str | None, limit: int):
+    if cursor:
+        d, id_ = decodificar_valores(cursor, 2)
+        try:
+            clave = (float(d), modelo.id.type.python_type(id_))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        query = query.where(tuple_(distancia, modelo.id) > tuple_(*clave))
+    # ``<->`` en el ORDER BY permite recorrer el índice GiST por cercanía (KNN)
+    return query.order_by(distancia, modelo.id).limit(limit + 1)
+
+
+def cercanos(query, modelo, lat: float, lon: float, radio: float, cursor: str | None, limit: int):
+    """
+    Filas de ``query`` a menos de ``radio`` metros, de la más cercana a la más lejana.
+
+    Añade la columna ``distancia`` (metros) a ``query``, que debe ser un
+    ``select(modelo)``.
+    """
+    centro = punto(lat, lon)
+    distancia = punto_de(modelo).op("<->")(centro)
+    query = query.add_columns(distancia.label("distancia")).where(
+        func.ST_DWithin(punto_de(modelo), centro, radio)
+    )
+    return _paginar_por_distancia(query, modelo, distancia, cursor, limit)
+
+
+def en_recuadro(query, modelo, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                cursor: str | None, limit: int):
+    """Filas de ``query`` dentro del recuadro, ordenadas por distancia a su centro"""
+    if min_lat >= max_lat or min_lon >= max_lon:
+        raise HTTPException(status_code=400, detail="Recuadro inválido: min_* debe ser menor que max_*")
+    recuadro = func.geography(func.ST_MakeEnvelope(min_lon, min_lat, max_lon, max_lat, _SRID))
+    distancia = punto_de(modelo).op("<->")(punto((min_lat + max_lat) / 2, (min_lon + max_lon) / 2))
+    query = query.add_columns(distancia.label("distancia")).where(punto_de(modelo).op("&&")(recuadro))
+    return _paginar_por_distancia(query, modelo, distancia, cursor, limit)
+
+
+def recortar_pagina(filas: list, limit: int, response: Response) -> list:
+    """Como ``paginacion.recortar_pagina`` para filas ``(objeto, distancia)``"""
+    if len(filas) > limit:
+        filas = filas[:limit]
+        objeto, distancia = filas[-1]
+        response.headers[CABECERA_CURSOR] = codificar_valores([distancia, str(objeto.id)])
+    return filas
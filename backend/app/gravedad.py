@@ -0,0 +1,226 @@
+"""
+Ajuste de gravedad por palabras clave
+
+El diccionario de palabras → bonificación se compila una vez en un
+autómata Aho–Corasick, de modo que puntuar una descripción es una sola
+pasada por el texto sin importar cuántas palabras haya. Texto y palabras
+se normalizan igual (minúsculas y sin tildes: "CRÍTICO" == "critico") y
+una palabra solo cuenta si empieza al inicio de una palabra del texto
+("urgentemente" suma como "urgente", "insurgente" no). Cada palabra suma
+una sola vez por descripción.
+
+El diccionario por defecto se puede sustituir con un JSON
+``{"palabra": bonificación}`` en ``GRAVEDAD_REGLAS``; tras cambiarlo,
+``recalcular_gravedades`` vuelve a puntuar las filas existentes.
+"""
+import json
+import logging
+import unicodedata
+from collections import deque
+from os import getenv
+
+from sqlalchemy import select, update  # type: ignore[import]
+
+from app.database import AsyncSessionLocal
+from app.models import Incidencia, Report
+
+logger = logging.getLogger(__name__)
+
+GRAVEDAD_MIN = 1
+GRAVEDAD_MAX = 10
+
+REGLAS_POR_DEFECTO = {
+    "urgente": 2,
+    "critico": 3,
+    "emergencia": 3,
+    "peligro": 2,
+    "incendio": 3,
+    "fuego": 3,
+    "toxico": 3,
+    "desbord": 2,  # desbordado, desbordamiento, se desborda
+    "escuela": 1,
+    "hospital": 1,
+    "ratas": 1,
+    "plaga": 1,
+}
+
+
+def _sin_marcas(c: str) -> str:
+    return "".join(d for d in unicodedata.normalize("NFKD", c) if not unicodedata.combining(d))
+
+
+# Letras latinas con tilde/diéresis → base, precalculado para usar str.translate
+_SIN_TILDES = str.maketrans({chr(i): _sin_marcas(chr(i)) for i in range(0xC0, 0x250)})
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin marcas diacríticas (la ñ pasa a n)"""
+    if texto.isascii():
+        return texto.lower()
+    return texto.casefold().translate(_SIN_TILDES)
+
+
+class Automata:
+    """Autómata Aho–Corasick sobre un diccionario ``{palabra: bonificación}``"""
+
+    def __init__(self, reglas: dict[str, int]):
+        self.reglas = {normalizar(p): b for p, b in reglas.items() if p.strip()}
+        self._ir: list[dict[str, int]] = [{}]
+        self._fallo: list[int] = [0]
+        self._salidas: list[list[tuple[str, int]]] = [[]]
+
+        for palabra in self.reglas:
+            estado = 0
+            for c in palabra:
+                siguiente = self._ir[estado].get(c)
+                if siguiente is None:
+                    siguiente = len(self._ir)
+                    self._ir[estado][c] = siguiente
+                    self._ir.append({})
+                    self._fallo.append(0)
+                    self._salidas.append([])
+                estado = siguiente
+            self._salidas[estado].append((palabra, len(palabra)))
+
+        # Enlaces de fallo por anchura: las salidas de un estado incluyen las de su fallo
+        cola = deque(self._ir[0].values())
+        while cola:
+            estado = cola.popleft()
+            for c, hijo in self._ir[estado].items():
+                cola.append(hijo)
+                if estado == 0:
+                    continue  # los hijos de la raíz fallan a la raíz
+                fallo = self._fallo[estado]
+                while fallo and c not in self._ir[fallo]:
+                    fallo = self._fallo[fallo]
+                self._fallo[hijo] = self._ir[fallo].get(c, 0)
+                self._salidas[hijo] = self._salidas[hijo] + self._salidas[self._fallo[hijo]]
+
+        # Transiciones ya resueltas (sin seguir fallos al puntuar): δ(s) = δ(fallo(s)) + ir(s)
+        self._delta: list[dict[str, int]] = [{} for _ in self._ir]
+        self._delta[0] = dict(self._ir[0])
+        cola = deque(self._ir[0].values())
+        while cola:
+            estado = cola.popleft()
+            self._delta[estado] = {**self._delta[self._fallo[estado]], **self._ir[estado]}
+            cola.extend(self._ir[estado].values())
+
+    def coincidencias(self, texto: str) -> set[str]:
+        """Palabras del diccionario que aparecen en ``texto`` al inicio de una palabra"""
+        texto = normalizar(texto)
+        encontradas = set()
+        estado = 0
+        delta, salidas = self._delta, self._salidas
+        for i, c in enumerate(texto):
+            estado = delta[estado].get(c, 0)
+            if salidas[estado]:
+                for palabra, largo in salidas[estado]:
+                    inicio = i - largo + 1
+                    if inicio == 0 or not texto[inicio - 1].isalnum():
+                        encontradas.add(palabra)
+        return encontradas
+
+    def bonificacion(self, texto: str | None) -> int:
+        if not texto:
+            return 0
+        return sum(self.reglas[p] for p in self.coincidencias(texto))
+
+    def bonificaciones(self, textos: list[str | None]) -> list[int]:
+        """
+        Bonificación de cada texto, en el mismo orden.
+
+        Es un bucle de ``bonificacion`` por texto, no un cálculo vectorizado:
+        recorrer los textos unidos por un separador en una sola pasada resultó
+        más lento en CPython (un ~25 % con 5000 descripciones).
+        """
+        bonificacion = self.bonificacion
+        return [bonificacion(t) for t in textos]
+
+
+def _cargar_reglas() -> dict[str, int]:
+    ruta = getenv("GRAVEDAD_REGLAS")
+    if not ruta:
+        return REGLAS_POR_DEFECTO
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return {str(p): int(b) for p, b in json.load(f).items()}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning("No se pudo leer GRAVEDAD_REGLAS=%s, se usan las reglas por defecto: %s", ruta, e)
+        return REGLAS_POR_DEFECTO
+
+
+_automata = Automata(_cargar_reglas())
+
+
+def recargar_reglas() -> int:
+    """Volver a leer ``GRAVEDAD_REGLAS`` y recompilar el autómata"""
+    global _automata
+    _automata = Automata(_cargar_reglas())
+    return len(_automata.reglas)
+
+
+def bonificacion(descripcion: str | None) -> int:
+    """Suma de las bonificaciones de las palabras clave presentes"""
+    return _automata.bonificacion(descripcion)
+
+
+def ajustar(gravedad_base: int, descripcion: str | None) -> int:
+    """Gravedad final: la base más las bonificaciones, acotada a [1, 10]"""
+    return max(GRAVEDAD_MIN, min(GRAVEDAD_MAX, gravedad_base + bonificacion(descripcion)))
+
+
+def puntuar(descripcion: str | None) -> float:
+    """Puntuación de prioridad de un reporte (suma de bonificaciones, sin base)"""
+    return float(bonificacion(descripcion))
+
+
+async def recalcular_gravedades(lote: int = 1000) -> dict:
+    """
+    Volver a puntuar incidencias y reportes con las reglas actuales.
+
+    Recorre cada tabla por bloques de ``id``, puntúa las descripciones del
+    bloque y actualiza en un solo ``UPDATE`` masivo las filas que cambian.
+    """
+    resumen = {"incidencias": 0, "reportes": 0}
+    async with AsyncSessionLocal() as db:
+        ultimo_id = 0
+        while True:
+            filas = (await db.execute(
+                select(Incidencia.id, Incidencia.gravedad_base, Incidencia.gravedad, Incidencia.descripcion)
+                .where(Incidencia.id > ultimo_id).order_by(Incidencia.id).limit(lote)
+            )).all()
+            if not filas:
+                break
+            bonos = _automata.bonificaciones([f.descripcion for f in filas])
+            cambios = []
+            for fila, bono in zip(filas, bonos):
+                base = fila.gravedad_base if fila.gravedad_base is not None else fila.gravedad
+                nueva = max(GRAVEDAD_MIN, min(GRAVEDAD_MAX, base + bono))
+                if nueva != fila.gravedad or fila.gravedad_base is None:
+                    cambios.append({"id": fila.id, "gravedad": nueva, "gravedad_base": base})
+            if cambios:
+                await db.execute(update(Incidencia), cambios)
+            await db.commit()
+            resumen["incidencias"] += len(cambios)
+            ultimo_id = filas[-1].id
+
+        ultimo_id = None
+        while True:
+            query = select(Report.id, Report.priority_score, Report.description).order_by(Report.id).limit(lote)
+            if ultimo_id is not None:
+                query = query.where(Report.id > ultimo_id)
+            filas = (await db.execute(query)).all()
+            if not filas:
+                break
+            bonos = _automata.bonificaciones([f.description for f in filas])
+            cambios = [
+                {"id": fila.id, "priority_score": float(bono)}
+                for fila, bono in zip(filas, bonos)
+                if fila.priority_score != bono
+            ]
+            if cambios:
+                await db.execute(update(Report), cambios)
+            await db.commit()
+            resumen["reportes"] += len(cambios)
+            ultimo_id = filas[-1].id
+    return resumen
@@ -2,10 +2,29 @@
 Aplicación principal FastAPI
 Sistema de Gestión de Incidencias - EPAGAL Latacunga
 """
-from fastapi import FastAPI  # type: ignore[import]
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request  # type: ignore[import]
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore[import]
 
-from app.database import engine, Base
+from app.database import (
+    engine,
+    async_engine,
+    async_read_engine,
+    Base,
+    DB_POOL_WARM,
+    clave_cliente,
+    iniciar_estadisticas_request,
+    marcar_escritura,
+)
+from app import clusters, db_metrics, deduplicacion, derivados, etags, posiciones, slow_queries, teselas, zonas
+from app.db_pool import (
+    calentar_pool,
+    detener_tarea,
+    iniciar_monitor_pool,
+    iniciar_monitor_replica,
+    medir_lag_replica,
+)
 from app.routers import (
     incidencias,
     rutas,
@@ -18,17 +37,55 @@ from app.routers import (
     reportes,
     operadores,
     tracking,
+    internal,
+    mapa,
+    tiles,
+    media,
 )
 
 # Crear tablas (comentado para usar esquema existente en Neon)
 # Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y parada: precalentar el pool y vigilar sus conexiones"""
+    await calentar_pool(DB_POOL_WARM)
+    if async_read_engine is not None:
+        await calentar_pool(DB_POOL_WARM, async_read_engine)
+        await medir_lag_replica()
+    await zonas.cargar_zonas()
+    await etags.comprobar_disponible()
+    await clusters.cargar()
+    await teselas.comprobar_disponibles()
+    derivados.iniciar()
+    await deduplicacion.cargar()
+    posiciones.iniciar()
+    tareas = [
+        iniciar_monitor_pool(),
+        iniciar_monitor_replica(),
+        slow_queries.iniciar_explicador(),
+        etags.iniciar_compactacion(),
+        clusters.iniciar_refresco(),
+        deduplicacion.iniciar_refresco(),
+    ]
+    yield
+    for tarea in tareas:
+        await detener_tarea(tarea)
+    await posiciones.detener()
+    derivados.detener()
+    await async_engine.dispose()
+    if async_read_engine is not None:
+        await async_read_engine.dispose()
+
+
 app = FastAPI(
     title="Sistema de Gestión de Incidencias - EPAGAL Latacunga",
     description="API para gestión de reportes ciudadanos y optimización de rutas de recolección",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Configuración CORS - Orígenes permitidos (hardcoded para producción)
@@ -59,12 +116,37 @@ app.add_middleware(
         "User-Agent",
         "DNT",
         "Cache-Control",
-        "X-Requested-With"
+        "X-Requested-With",
+        "If-None-Match",
     ],
-    expose_headers=["Content-Length", "X-Total-Count", "Content-Disposition"],
+    expose_headers=["Content-Length", "X-Total-Count", "Content-Disposition", "X-DB-Checkouts", "Server-Timing", "X-Next-Cursor", "ETag"],
     max_age=600,  # Cache preflight requests por 10 minutos
 )
 
+
+@app.middleware("http")
+async def instrumentar_db(request: Request, call_next):
+    """Mide checkouts, sentencias y tiempo de BD de cada request"""
+    stats = iniciar_estadisticas_request(request.scope)
+    response = await call_next(request)
+    repetidas = db_metrics.registrar_request(stats.ruta() or "(sin ruta)", stats)
+    response.headers["X-DB-Checkouts"] = str(stats.checkouts)
+    response.headers.append("Server-Timing", db_metrics.cabecera_server_timing(stats, repetidas))
+    return response
+
+
+@app.middleware("http")
+async def lecturas_tras_escritura(request: Request, call_next):
+    """Tras una escritura, las lecturas del mismo cliente van al primario"""
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        marcar_escritura(clave_cliente(request))
+    return response
+
+
+# GET condicionales: la dependencia etags.condicional corta con 304
+app.add_exception_handler(etags.NoModificado, etags.respuesta_no_modificado)
+
 # Incluir routers - todos con prefijo /api para unificar
 app.include_router(auth.router, prefix="/api")
 app.include_router(conductores.router, prefix="/api")
@@ -77,6 +159,11 @@ app.include_router(reports.router, prefix="/api")
 app.include_router(reportes.router, prefix="/api")
 app.include_router(operadores.router, prefix="/api")
 app.include_router(tracking.router, prefix="/api")
+app.include_router(mapa.router, prefix="/api")
+app.include_router(tiles.router, prefix="/api")
+app.include_router(internal.router, prefix="/api")
+# Sin /api: mismas rutas que el alias /media/ de nginx
+app.include_router(media.router)
 
 
 @app.get("/")
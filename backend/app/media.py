@@ -0,0 +1,192 @@
+"""
+Fotos de evidencia: subida en streaming y almacenamiento por contenido
+
+El cuerpo multipart se procesa a medida que llega: cada fragmento se suma
+al SHA-256 y se escribe en un temporal dentro de ``MEDIA_ROOT``, sin juntar
+el archivo en memoria (por subida solo se retiene un fragmento de red).
+Al terminar, el temporal se renombra a ``originales/ab/cd/<sha256>.<ext>``;
+si ese archivo ya existía se descarta el temporal, así que una misma foto
+se guarda una sola vez aunque se suba muchas veces.
+
+El tipo se decide por los primeros bytes (JPEG, PNG o WebP), no por el
+``Content-Type`` que declara el cliente. Los archivos se publican bajo
+``MEDIA_URL`` (alias ``/media/`` de nginx).
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from os import getenv
+from pathlib import Path
+
+from fastapi import HTTPException, Request  # type: ignore[import]
+from multipart.multipart import MultipartParser, parse_options_header  # type: ignore[import]
+
+MEDIA_ROOT = Path(getenv("MEDIA_ROOT", "media"))
+MEDIA_URL = getenv("MEDIA_URL", "/media").rstrip("/")
+MEDIA_MAX_BYTES = int(getenv("MEDIA_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Campos de texto que acompañan al archivo (p. ej. "tipo"): tamaño máximo
+_MAX_CAMPO = 1024
+
+
+def _tipo_imagen(cabecera: bytes) -> tuple[str, str] | None:
+    """``(mime, extensión)`` según la firma de los primeros bytes"""
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", "jpg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", "png"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    return None
+
+
+class Archivo:
+    """Imagen guardada: ``nuevo`` es False si el contenido ya estaba almacenado"""
+
+    __slots__ = ("sha256", "tamano", "mime", "extension", "nombre", "nuevo")
+
+    def __init__(self, sha256: str, tamano: int, mime: str, extension: str, nombre: str | None, nuevo: bool):
+        self.sha256 = sha256
+        self.tamano = tamano
+        self.mime = mime
+        self.extension = extension
+        self.nombre = nombre
+        self.nuevo = nuevo
+
+    @property
+    def ruta(self) -> str:
+        """Ruta relativa a ``MEDIA_ROOT``"""
+        return f"originales/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}.{self.extension}"
+
+    @property
+    def url(self) -> str:
+        return f"{MEDIA_URL}/{self.ruta}"
+
+
+class _Recepcion:
+    """Callbacks del parser multipart: separa el archivo de ``campo`` y los campos de texto"""
+
+    def __init__(self, campo: str):
+        self.campo = campo
+        self.campos: dict[str, str] = {}
+        self.nombre_archivo: str | None = None
+        self.hay_archivo = False
+        self.pendientes: list[bytes] = []  # datos del archivo aún por escribir
+        self._cabecera_nombre = b""
+        self._cabecera_valor = b""
+        self._disposicion = b""
+        self._parte: str | None = None  # "archivo", nombre de un campo o None (ignorar)
+        self._texto = bytearray()
+
+    def on_part_begin(self):
+        self._disposicion = b""
+        self._parte = None
+        self._texto.clear()
+
+    def on_header_field(self, datos: bytes, inicio: int, fin: int):
+        self._cabecera_nombre += datos[inicio:fin]
+
+    def on_header_value(self, datos: bytes, inicio: int, fin: int):
+        self._cabecera_valor += datos[inicio:fin]
+
+    def on_header_end(self):
+        if self._cabecera_nombre.lower() == b"content-disposition":
+            self._disposicion = self._cabecera_valor
+        self._cabecera_nombre = b""
+        self._cabecera_valor = b""
+
+    def on_headers_finished(self):
+        _, opciones = parse_options_header(self._disposicion)
+        nombre = opciones.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in opciones:
+            if nombre == self.campo and not self.hay_archivo:
+                self.hay_archivo = True
+                self.nombre_archivo = opciones[b"filename"].decode("utf-8", "replace")[:255] or None
+                self._parte = "archivo"
+        elif nombre:
+            self._parte = nombre
+
+    def on_part_data(self, datos: bytes, inicio: int, fin: int):
+        if self._parte == "archivo":
+            self.pendientes.append(datos[inicio:fin])
+        elif self._parte is not None:
+            self._texto += datos[inicio:fin]
+            if len(self._texto) > _MAX_CAMPO:
+                raise HTTPException(status_code=413, detail=f"Campo '{self._parte}' demasiado largo")
+
+    def on_part_end(self):
+        if self._parte not in (None, "archivo"):
+            self.campos[self._parte] = self._texto.decode("utf-8", "replace")
+
+    def callbacks(self) -> dict:
+        return {nombre: getattr(self, nombre) for nombre in (
+            "on_part_begin", "on_header_field", "on_header_value", "on_header_end",
+            "on_headers_finished", "on_part_data", "on_part_end",
+        )}
+
+
+def _mover(temporal: Path, destino: Path) -> bool:
+    """Renombrar el temporal a su ruta definitiva; False si el contenido ya existía"""
+    if destino.exists():
+        temporal.unlink()
+        return False
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(temporal, destino)
+    return True
+
+
+async def recibir_imagen(request: Request, campo: str = "foto") -> tuple[Archivo, dict[str, str]]:
+    """
+    Leer un ``multipart/form-data`` con una imagen en ``campo`` y guardarla.
+
+    Devuelve el archivo y los campos de texto del formulario. Responde 413
+    si pasa de ``MEDIA_MAX_BYTES``, 415 si no es una imagen admitida y 422
+    si falta el archivo.
+    """
+    tipo, opciones = parse_options_header(request.headers.get("content-type", ""))
+    if tipo != b"multipart/form-data" or b"boundary" not in opciones:
+        raise HTTPException(status_code=415, detail="Se espera multipart/form-data")
+
+    recepcion = _Recepcion(campo)
+    parser = MultipartParser(opciones[b"boundary"], recepcion.callbacks())
+    directorio_tmp = MEDIA_ROOT / "tmp"
+    await asyncio.to_thread(directorio_tmp.mkdir, parents=True, exist_ok=True)
+    temporal = directorio_tmp / f"{uuid.uuid4().hex}.parcial"
+    hash_ = hashlib.sha256()
+    tamano = 0
+    cabecera = b""
+    destino_archivo = None
+    try:
+        async for fragmento in request.stream():
+            parser.write(fragmento)
+            if not recepcion.pendientes:
+                continue
+            datos = b"".join(recepcion.pendientes)
+            recepcion.pendientes.clear()
+            tamano += len(datos)
+            if tamano > MEDIA_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"La imagen supera {MEDIA_MAX_BYTES} bytes")
+            if len(cabecera) < 12:
+                cabecera += datos[:12 - len(cabecera)]
+            hash_.update(datos)
+            if destino_archivo is None:
+                destino_archivo = await asyncio.to_thread(open, temporal, "wb")
+            await asyncio.to_thread(destino_archivo.write, datos)
+        parser.finalize()
+
+        if not recepcion.hay_archivo or destino_archivo is None:
+            raise HTTPException(status_code=422, detail=f"Falta el archivo '{campo}'")
+        await asyncio.to_thread(destino_archivo.close)
+        tipo_imagen = _tipo_imagen(cabecera)
+        if tipo_imagen is None:
+            raise HTTPException(status_code=415, detail="Formato no admitido: use JPEG, PNG o WebP")
+
+        archivo = Archivo(hash_.hexdigest(), tamano, *tipo_imagen, recepcion.nombre_archivo, nuevo=False)
+        archivo.nuevo = await asyncio.to_thread(_mover, temporal, MEDIA_ROOT / archivo.ruta)
+        return archivo, recepcion.campos
+    finally:
+        if destino_archivo is not None and not destino_archivo.closed:
+            await asyncio.to_thread(destino_archivo.close)
+        if temporal.exists():
+            await asyncio.to_thread(temporal.unlink, True)
@@ -89,6 +89,7 @@ class Incidencia(Base):
     id = Column(Integer, primary_key=True, index=True)
     tipo = Column(String(20), nullable=False)
     gravedad = Column(Integer, nullable=False)
+    gravedad_base = Column(Integer)  # La indicada al reportar, antes de sumar palabras clave
     descripcion = Column(Text)
     foto_url = Column(String(255))
     lat = Column(Float, nullable=False)
@@ -101,7 +102,7 @@ class Incidencia(Base):
     usuario_id = Column(Integer)  # Sin FK (users.id es UUID)
     created_at = Column(DateTime)
     updated_at = Column(DateTime)
-
+    version = Column(Integer, nullable=False, default=1)  # Concurrencia optimista
 
 
 # Modelo de Tarea
@@ -146,11 +147,31 @@ class Report(Base):
     photo_url = Column(Text)
     description = Column(Text)
     status = Column(String(20))
+    priority_score = Column(Float, default=0.0)  # Suma de bonificaciones por palabras clave
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     synced = Column(Boolean, default=False)
     report_location_id = Column(UUID(as_uuid=True))
     deleted_at = Column(DateTime)
+    version = Column(Integer, nullable=False, default=1)  # Concurrencia optimista
+    duplicate_of = Column(UUID(as_uuid=True), ForeignKey("reports.id", ondelete="SET NULL"))  # Reporte original
+    duplicates = Column(Integer, nullable=False, default=0)  # Reportes repetidos vinculados a este
+
+
+class ReportAttachment(Base):
+    """Adjunto de un reporte (fotos de evidencia); el archivo se guarda por su SHA-256"""
+    __tablename__ = "report_attachments"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    report_id = Column(UUID(as_uuid=True), ForeignKey("reports.id", ondelete="CASCADE"), index=True)
+    attachment_id = Column(UUID(as_uuid=True))
+    filename = Column(Text)
+    mime_type = Column(Text)
+    size_bytes = Column(Integer)
+    remote_url = Column(Text)
+    hash = Column(Text, index=True)
+    type = Column(Text, default="EVIDENCE")  # BEFORE | AFTER | EVIDENCE
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 
 class Asignacion(Base):
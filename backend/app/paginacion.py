@@ -0,0 +1,71 @@
+"""
+Paginación por cursor (keyset) sobre ``(created_at, id)``
+
+El cursor es opaco para el cliente: ``(created_at, id)`` de la última fila
+devuelta, codificado en base64. La página siguiente se pide con
+``WHERE (created_at, id) < (:c, :id)`` usando el índice compuesto, así que
+su coste no depende de lo profunda que esté la página (al contrario que
+``OFFSET``). Los listados devuelven el cursor en la cabecera
+``X-Next-Cursor`` para no cambiar el cuerpo (sigue siendo una lista); no
+hay cabecera cuando no quedan más filas.
+"""
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Response  # type: ignore[import]
+from sqlalchemy import tuple_  # type: ignore[import]
+
+CABECERA_CURSOR = "X-Next-Cursor"
+
+
+def codificar_valores(valores: list) -> str:
+    """Cursor opaco a partir de una lista de valores serializables en JSON"""
+    crudo = json.dumps(valores, separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+
+def decodificar_valores(cursor: str, n: int) -> list:
+    """Inverso de ``codificar_valores``; 400 si el cursor no tiene ``n`` valores"""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        valores = None
+    if not isinstance(valores, list) or len(valores) != n:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return valores
+
+
+def codificar_cursor(created_at: datetime, id_) -> str:
+    return codificar_valores([created_at.isoformat(), str(id_)])
+
+
+def decodificar_cursor(cursor: str, modelo) -> tuple[datetime, object]:
+    """Devolver ``(created_at, id)`` del cursor, con el id en el tipo de la PK del modelo"""
+    created_at, id_ = decodificar_valores(cursor, 2)
+    try:
+        return datetime.fromisoformat(created_at), modelo.id.type.python_type(id_)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def paginar(query, modelo, cursor: str | None, limit: int):
+    """
+    Ordenar ``query`` por ``(created_at, id)`` descendente y aplicar el cursor.
+
+    Pide ``limit + 1`` filas: la sobrante solo indica que hay página siguiente
+    (ver ``recortar_pagina``), así no hace falta un ``COUNT(*)``.
+    """
+    clave = tuple_(modelo.created_at, modelo.id)
+    if cursor:
+        query = query.where(clave < tuple_(*decodificar_cursor(cursor, modelo)))
+    return query.order_by(modelo.created_at.desc(), modelo.id.desc()).limit(limit + 1)
+
+
+def recortar_pagina(filas: list, limit: int, response: Response) -> list:
+    """Quitar la fila sobrante y publicar el cursor de la página siguiente"""
+    if len(filas) > limit:
+        filas = filas[:limit]
+        ultima = filas[-1]
+        response.headers[CABECERA_CURSOR] = codificar_cursor(ultima.created_at, ultima.id)
+    return filas
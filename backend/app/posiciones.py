@@ -0,0 +1,303 @@
+"""
+Persistencia diferida (write-behind) de las posiciones GPS del tracking
+
+``/tracking/actualizar`` no espera a la base: cada posición se añade a un
+buffer en memoria y una tarea de fondo la escribe en ``actor_locations``
+cada ``GPS_FLUSH_MS`` ms, o antes si se juntan ``GPS_FLUSH_FILAS``. Cada
+escritura es un único ``INSERT ... SELECT FROM unnest(...)`` con un array
+por columna: un solo viaje a la base y un plan fijo sea cual sea el lote.
+
+Si la base no da abasto (o no responde) el buffer se llena hasta
+``GPS_BUFFER_MAX`` filas; entonces ``agregar`` espera hasta
+``GPS_ESPERA_MAX`` segundos a que haya sitio y después responde 503 con
+``Retry-After``, para que el conductor reintente en lugar de perder
+posiciones. Al apagar se escriben las pendientes.
+
+``decodificar_lote`` lee el formato binario de ``/tracking/actualizar/batch``
+(ver su docstring), pensado para que un móvil sin cobertura reenvíe minutos
+de posiciones en un solo POST.
+"""
+import asyncio
+import logging
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from os import getenv
+from typing import NamedTuple
+
+from fastapi import HTTPException  # type: ignore[import]
+from sqlalchemy import text  # type: ignore[import]
+
+from app.database import async_engine
+
+logger = logging.getLogger(__name__)
+
+GPS_FLUSH_MS = int(getenv("GPS_FLUSH_MS", "500"))
+GPS_FLUSH_FILAS = int(getenv("GPS_FLUSH_FILAS", "1000"))
+GPS_BUFFER_MAX = int(getenv("GPS_BUFFER_MAX", "20000"))
+GPS_ESPERA_MAX = float(getenv("GPS_ESPERA_MAX", "2"))
+
+GPS_LOTE_MAX = int(getenv("GPS_LOTE_MAX", "10000"))  # posiciones por POST de lote
+
+_SQL_INSERTAR = text("""
+    INSERT INTO actor_locations (ejecucion_id, location, speed, reported_at)
+    SELECT e, geography(ST_SetSRID(ST_MakePoint(lon, lat), 4326)), v, t
+    FROM unnest(
+        CAST(:ejecuciones AS integer[]), CAST(:lats AS float8[]), CAST(:lons AS float8[]),
+        CAST(:velocidades AS real[]), CAST(:instantes AS timestamptz[])
+    ) AS p(e, lat, lon, v, t)
+""")
+
+
+class Posicion(NamedTuple):
+    ejecucion_id: int
+    lat: float
+    lon: float
+    velocidad: float | None
+    instante: datetime
+
+
+class BufferPosiciones:
+    """Posiciones pendientes de escribir y la tarea que las vuelca a la base"""
+
+    def __init__(self, motor=async_engine, max_filas: int = GPS_BUFFER_MAX,
+                 lote: int = GPS_FLUSH_FILAS, intervalo_ms: int = GPS_FLUSH_MS):
+        self.motor = motor
+        self.max_filas = max_filas
+        self.lote = lote
+        self.intervalo = intervalo_ms / 1000
+        self._filas: list[Posicion] = []
+        self._en_vuelo = 0  # filas del lote que se está escribiendo (siguen ocupando sitio)
+        self._despertar = asyncio.Event()
+        self._hay_sitio = asyncio.Event()
+        self._hay_sitio.set()
+        self._tarea: asyncio.Task | None = None
+        self._detenido = False
+        self.escritas = 0
+        self.rechazadas = 0
+        self.errores = 0
+        self.perdidas = 0
+
+    def __len__(self) -> int:
+        return len(self._filas) + self._en_vuelo
+
+    def _ocupar(self, n: int) -> bool:
+        # Un lote mayor que el buffer entero se admite si está vacío
+        return not len(self) or len(self) + n <= self.max_filas
+
+    async def agregar(self, posiciones: list[Posicion]):
+        """Encolar posiciones; con el buffer lleno espera a que se vacíe o responde 503"""
+        if not self._ocupar(len(posiciones)):
+            self._despertar.set()
+            limite = asyncio.get_running_loop().time() + GPS_ESPERA_MAX
+            while not self._ocupar(len(posiciones)):
+                self._hay_sitio.clear()
+                restante = limite - asyncio.get_running_loop().time()
+                try:
+                    await asyncio.wait_for(self._hay_sitio.wait(), max(restante, 0))
+                except asyncio.TimeoutError:
+                    self.rechazadas += len(posiciones)
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Demasiadas posiciones pendientes de guardar",
+                        headers={"Retry-After": "1"},
+                    )
+        self._filas.extend(posiciones)
+        if len(self._filas) >= self.lote:
+            self._despertar.set()
+
+    async def _escribir(self, filas: list[Posicion]):
+        ejecuciones, lats, lons, velocidades, instantes = zip(*filas)
+        async with self.motor.begin() as conn:
+            await conn.execute(_SQL_INSERTAR, {
+                "ejecuciones": list(ejecuciones),
+                "lats": list(lats),
+                "lons": list(lons),
+                "velocidades": list(velocidades),
+                "instantes": list(instantes),
+            })
+
+    async def vaciar(self) -> bool:
+        """Escribir lo pendiente en lotes de ``lote``; False si falló (las filas vuelven al buffer)"""
+        while self._filas:
+            filas = self._filas[:self.lote]
+            del self._filas[:self.lote]
+            self._en_vuelo = len(filas)
+            try:
+                await self._escribir(filas)
+                self.escritas += len(filas)
+            except Exception as e:
+                self.errores += 1
+                logger.warning("No se pudieron guardar %d posiciones GPS: %s", len(filas), e)
+                self._filas[:0] = filas
+                return False
+            finally:
+                self._en_vuelo = 0
+                self._hay_sitio.set()
+        return True
+
+    async def _ciclo(self):
+        while not self._detenido:
+            try:
+                await asyncio.wait_for(self._despertar.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._despertar.clear()
+            if not await self.vaciar():
+                # Base caída: esperar un ciclo sin reintentar de inmediato
+                await asyncio.sleep(self.intervalo)
+        if not await self.vaciar():
+            self.perdidas += len(self._filas)
+            logger.error("Se descartan %d posiciones GPS sin guardar al apagar", len(self._filas))
+            self._filas.clear()
+
+    def iniciar(self):
+        if self._tarea is None:
+            self._detenido = False
+            self._tarea = asyncio.create_task(self._ciclo(), name="escritura-posiciones-gps")
+
+    async def detener(self):
+        """Parar la tarea tras escribir lo pendiente"""
+        if self._tarea is None:
+            return
+        self._detenido = True
+        self._despertar.set()
+        await self._tarea
+        self._tarea = None
+
+    def estadisticas(self) -> dict:
+        return {
+            "pendientes": len(self),
+            "max_filas": self.max_filas,
+            "escritas": self.escritas,
+            "rechazadas": self.rechazadas,
+            "errores": self.errores,
+            "perdidas": self.perdidas,
+        }
+
+
+buffer = BufferPosiciones()
+
+
+def iniciar():
+    """Lanzar la escritura diferida (llamar en el arranque)"""
+    buffer.iniciar()
+
+
+async def detener():
+    await buffer.detener()
+
+
+async def agregar(posiciones: list[Posicion]):
+    await buffer.agregar(posiciones)
+
+
+# ============================================
+# LOTES BINARIOS (/tracking/actualizar/batch)
+# ============================================
+
+_CABECERA = struct.Struct("<4sHIiiq")
+_MAGIA = b"TRK1"
+_VELOCIDAD_NULA = 0xFFFF
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_FUTURO_MAX = timedelta(minutes=5)
+
+
+def _columna(datos: memoryview, inicio: int, tipo: str, n: int) -> tuple:
+    # "<": little-endian con tamaños estándar (i = 4 bytes, H = 2) en cualquier plataforma,
+    # al contrario que array("i"), cuyo itemsize depende del int de C
+    return struct.unpack_from(f"<{n}{tipo}", datos, inicio)
+
+
+def tamano_maximo() -> int:
+    """Bytes de un lote de ``GPS_LOTE_MAX`` posiciones"""
+    return _CABECERA.size + GPS_LOTE_MAX * 14
+
+
+async def leer_cuerpo(flujo) -> bytes:
+    """
+    Juntar los trozos del cuerpo (``request.stream()``) cortando con 413 al
+    pasar de ``tamano_maximo()``: no hace falta ``Content-Length`` (cuerpos
+    ``chunked``) ni se acumula más de un lote. Con gzip el tope se aplica
+    al cuerpo comprimido; ``descomprimir`` acota el descomprimido.
+    """
+    maximo = tamano_maximo()
+    trozos = []
+    leidos = 0
+    async for trozo in flujo:
+        leidos += len(trozo)
+        if leidos > maximo:
+            raise HTTPException(status_code=413, detail=f"El lote supera {GPS_LOTE_MAX} posiciones")
+        trozos.append(trozo)
+    return b"".join(trozos)
+
+
+def descomprimir(datos: bytes) -> bytes:
+    """gunzip con tope de tamaño (un lote comprimido no puede expandirse sin límite)"""
+    maximo = tamano_maximo()
+    descompresor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        salida = descompresor.decompress(datos, maximo)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Cuerpo gzip inválido")
+    if descompresor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail=f"El lote supera {GPS_LOTE_MAX} posiciones")
+    return salida
+
+
+def decodificar_lote(datos: bytes) -> list[Posicion]:
+    """
+    Decodificar un lote binario de posiciones de una ejecución.
+
+    Little-endian: cabecera ``"TRK1", n: u16, ejecucion_id: u32,
+    lat0: i32, lon0: i32, t0: i64`` seguida de cuatro columnas de ``n``
+    valores: ``dlat: i32[n], dlon: i32[n], dt: i32[n], velocidad: u16[n]``.
+    Coordenadas en millonésimas de grado y tiempos en ms desde epoch; cada
+    posición es la anterior más su delta (la primera, la base más el suyo).
+    Velocidad en décimas de km/h, ``0xFFFF`` si no hay. Son 14 bytes por
+    posición, y los deltas pequeños comprimen bien con gzip.
+
+    Los instantes deben ser estrictamente crecientes y no estar en el
+    futuro; si no, 422 indicando la posición.
+    """
+    if len(datos) < _CABECERA.size:
+        raise HTTPException(status_code=400, detail="Lote incompleto")
+    magia, n, ejecucion_id, lat0, lon0, t0 = _CABECERA.unpack_from(datos)
+    if magia != _MAGIA:
+        raise HTTPException(status_code=400, detail="Formato de lote desconocido")
+    if n == 0:
+        return []
+    if n > GPS_LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"El lote supera {GPS_LOTE_MAX} posiciones")
+    if len(datos) != _CABECERA.size + n * 14:
+        raise HTTPException(status_code=400, detail=f"Se esperaban {_CABECERA.size + n * 14} bytes para {n} posiciones")
+
+    vista = memoryview(datos)
+    inicio = _CABECERA.size
+    dlat = _columna(vista, inicio, "i", n)
+    dlon = _columna(vista, inicio + 4 * n, "i", n)
+    dt = _columna(vista, inicio + 8 * n, "i", n)
+    velocidades = _columna(vista, inicio + 12 * n, "H", n)
+
+    if n > 1 and min(dt[1:]) <= 0:
+        i = next(i for i in range(1, n) if dt[i] <= 0)
+        raise HTTPException(status_code=422, detail=f"Instantes no crecientes en la posición {i}")
+    lats = list(accumulate(dlat, initial=lat0))[1:]
+    lons = list(accumulate(dlon, initial=lon0))[1:]
+    instantes = list(accumulate(dt, initial=t0))[1:]
+    if min(lats) < -90_000_000 or max(lats) > 90_000_000 or min(lons) < -180_000_000 or max(lons) > 180_000_000:
+        raise HTTPException(status_code=422, detail="Coordenadas fuera de rango")
+    if _EPOCH + timedelta(milliseconds=instantes[-1]) > datetime.now(timezone.utc) + _FUTURO_MAX:
+        raise HTTPException(status_code=422, detail="Instantes en el futuro")
+
+    return [
+        Posicion(
+            ejecucion_id,
+            lat / 1e6,
+            lon / 1e6,
+            None if v == _VELOCIDAD_NULA else v / 10,
+            _EPOCH + timedelta(milliseconds=t),
+        )
+        for lat, lon, t, v in zip(lats, lons, instantes, velocidades)
+    ]
@@ -0,0 +1,76 @@
+"""
+Lecturas y actualizaciones por clave primaria
+
+Los endpoints de detalle construían ``select(Model).filter(Model.id == x)``
+en cada llamada. Aquí la sentencia se construye una sola vez por modelo con
+un ``bindparam``: SQLAlchemy reutiliza su compilación en caché y asyncpg la
+sentencia preparada de la conexión (salvo detrás de pgbouncer, ver
+``app.database``).
+
+Las ediciones (``actualizar_por_id``) son un único ``UPDATE ... RETURNING``
+en lugar de SELECT + UPDATE + SELECT del ``refresh``.
+"""
+from fastapi import HTTPException  # type: ignore[import]
+from sqlalchemy import bindparam, select, update  # type: ignore[import]
+from sqlalchemy.sql import Select  # type: ignore[import]
+
+_por_id: dict[type, Select] = {}
+
+
+def sentencia_por_id(modelo) -> Select:
+    """SELECT del modelo filtrado por su clave primaria (parámetro ``pk``)"""
+    stmt = _por_id.get(modelo)
+    if stmt is None:
+        pk = modelo.__mapper__.primary_key[0]
+        stmt = _por_id[modelo] = select(modelo).where(pk == bindparam("pk"))
+    return stmt
+
+
+async def obtener_por_id(db, modelo, pk, bloquear: bool = False):
+    """Instancia con esa clave primaria, o None (con ``bloquear``, ``FOR UPDATE`` hasta el commit)"""
+    stmt = sentencia_por_id(modelo)
+    if bloquear:
+        stmt = stmt.with_for_update()
+    resultado = await db.execute(stmt, {"pk": pk})
+    return resultado.scalars().first()
+
+
+def solo_columnas(payload: dict, permitidas) -> dict:
+    """Quedarse con las claves de ``payload`` que están en la lista blanca"""
+    return {k: v for k, v in payload.items() if k in permitidas}
+
+
+async def actualizar_por_id(db, modelo, pk, valores: dict, version: int | None = None):
+    """
+    Actualizar una fila en un solo viaje y devolver la instancia actualizada, o None si no existe.
+
+    ``valores`` va tal cual al ``SET`` (admite expresiones SQL), así que debe
+    venir ya filtrado con ``solo_columnas``. Si el modelo tiene columna
+    ``version`` se incrementa en cada escritura; si además se pasa
+    ``version``, la fila solo se actualiza si sigue en esa versión y, si otro
+    la cambió antes, se responde 409. Con ``valores`` vacío no se escribe nada
+    (ni se sube la versión): se devuelve la fila tal cual.
+    """
+    pk_col = modelo.__mapper__.primary_key[0]
+    stmt = update(modelo).where(pk_col == pk)
+    if not valores:
+        # Nada que cambiar: sin UPDATE, para no subir la versión en falso
+        return await obtener_por_id(db, modelo, pk)
+    tiene_version = "version" in modelo.__table__.c
+    if tiene_version:
+        valores = {**valores, "version": modelo.version + 1}
+        if version is not None:
+            stmt = stmt.where(modelo.version == version)
+
+    # Con RETURNING, la sincronización por defecto refresca la instancia si ya estaba en la sesión
+    stmt = stmt.values(valores).returning(modelo)
+    instancia = (await db.execute(stmt)).scalars().first()
+    if instancia is None and tiene_version and version is not None:
+        # Solo en el caso de fallo: distinguir "no existe" de "versión obsoleta"
+        actual = await db.scalar(select(modelo.version).where(pk_col == pk))
+        if actual is not None:
+            raise HTTPException(
+                status_code=409,
+                detail={"mensaje": "El registro fue modificado por otro usuario", "version_actual": actual},
+            )
+    return instancia
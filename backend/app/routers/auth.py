@@ -2,13 +2,14 @@
 Router de autenticación para FastAPI
 """
 from fastapi import APIRouter, Depends, HTTPException, status  # type: ignore[import]
-from sqlalchemy.orm import Session  # type: ignore[import]
+from sqlalchemy import select  # type: ignore[import]
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
 from pydantic import BaseModel  # type: ignore[import]
 from typing import Annotated, Optional
 from datetime import datetime, timedelta
 import hashlib
 import os
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
@@ -67,7 +68,7 @@ def create_dummy_token(user_id: int, email: str) -> str:
 
 
 @router.post("/login", response_model=LoginResponse)
-async def login(credentials: LoginRequest, db: Annotated[Session, Depends(get_db)]):
+async def login(credentials: LoginRequest, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """
     Endpoint de login
     Acepta identifier (email o teléfono) y password
@@ -81,7 +82,8 @@ async def login(credentials: LoginRequest, db: Annotated[Session, Depends(get_db
             )
 
         # Buscar usuario por email
-        user = db.query(User).filter(User.email == credentials.identifier).first()
+        result = await db.execute(select(User).where(User.email == credentials.identifier))
+        user = result.scalars().first()
 
         if not user:
             # Crear usuario de prueba si no existe
@@ -93,12 +95,12 @@ async def login(credentials: LoginRequest, db: Annotated[Session, Depends(get_db
                 is_active=True,
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
 
         # Actualizar último login
         user.last_login_at = datetime.utcnow()
-        db.commit()
+        await db.commit()
 
         # Generar token
         access_token = create_dummy_token(user.id, user.email)
@@ -123,7 +125,7 @@ async def login(credentials: LoginRequest, db: Annotated[Session, Depends(get_db
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user(db: Annotated[Session, Depends(get_db)]):
+async def get_current_user():
     """Obtener información del usuario actual"""
     # TODO: Implementar con JWT verification
     return UserResponse(
@@ -136,13 +138,13 @@ async def get_current_user(db: Annotated[Session, Depends(get_db)]):
 
 
 @router.post("/refresh")
-async def refresh_token(db: Annotated[Session, Depends(get_db)]):
+async def refresh_token():
     """Refrescar token JWT"""
     # TODO: Implementar refresh token
     return {"access_token": "new_token", "token_type": "bearer"}
 
 
 @router.post("/logout")
-async def logout(db: Annotated[Session, Depends(get_db)]):
+async def logout():
     """Logout del usuario"""
     return {"message": "Logout exitoso"}
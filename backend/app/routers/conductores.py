@@ -2,12 +2,15 @@
 Router de conductores para FastAPI
 """
 from fastapi import APIRouter, Depends, HTTPException, status  # type: ignore[import]
-from sqlalchemy.orm import Session  # type: ignore[import]
+from sqlalchemy import select  # type: ignore[import]
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
 from pydantic import BaseModel  # type: ignore[import]
 from typing import Annotated, List, Optional
 from datetime import datetime
-from app.database import get_db
+from app import etags
+from app.database import get_async_db, get_read_db
 from app.models import Conductor
+from app.repositorio import actualizar_por_id, obtener_por_id, solo_columnas
 
 router = APIRouter(prefix="/conductores", tags=["conductores"])
 
@@ -40,24 +43,25 @@ class ConductorCreate(BaseModel):
     zona_preferida: Optional[str] = None
 
 
-@router.get("/", response_model=List[ConductorResponse])
-async def listar_conductores(db: Annotated[Session, Depends(get_db)]):
+@router.get("/", response_model=List[ConductorResponse], dependencies=[etags.condicional("conductores")])
+async def listar_conductores(db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Listar todos los conductores"""
-    return db.query(Conductor).all()
+    result = await db.execute(select(Conductor))
+    return result.scalars().all()
 
 
 @router.post("/", response_model=ConductorResponse, status_code=status.HTTP_201_CREATED)
 async def crear_conductor(
     conductor: ConductorCreate,
-    db: Annotated[Session, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_async_db)]
 ):
     """Crear nuevo conductor"""
     # Verificar si ya existe
-    existing = db.query(Conductor).filter(
+    existing = (await db.execute(select(Conductor).where(
         (Conductor.cedula == conductor.cedula) |
         (Conductor.email == conductor.email) |
         (Conductor.username == conductor.username)
-    ).first()
+    ))).scalars().first()
 
     if existing:
         raise HTTPException(
@@ -76,61 +80,64 @@ async def crear_conductor(
         estado="disponible"
     )
     db.add(new_conductor)
-    db.commit()
-    db.refresh(new_conductor)
+    await db.commit()
+    await db.refresh(new_conductor)
     return new_conductor
 
 
-@router.get("/{conductor_id}", response_model=ConductorResponse)
-async def obtener_conductor(conductor_id: int, db: Annotated[Session, Depends(get_db)]):
+@router.get("/{conductor_id}", response_model=ConductorResponse, dependencies=[etags.condicional("conductores")])
+async def obtener_conductor(conductor_id: int, db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Obtener un conductor específico"""
-    conductor = db.query(Conductor).filter(Conductor.id == conductor_id).first()
+    conductor = await obtener_por_id(db, Conductor, conductor_id)
     if not conductor:
         raise HTTPException(status_code=404, detail="Conductor no encontrado")
     return conductor
 
 
+_CONDUCTOR_EDITABLES = frozenset({
+    "cedula", "nombre_completo", "email", "telefono", "username", "licencia_tipo",
+    "zona_preferida", "estado", "usuario_id", "fecha_contratacion",
+})
+
+
 @router.patch("/{conductor_id}", response_model=ConductorResponse)
 async def actualizar_conductor(
     conductor_id: int,
     payload: dict,
-    db: Annotated[Session, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_async_db)]
 ):
-    """Actualizar un conductor"""
-    conductor = db.query(Conductor).filter(Conductor.id == conductor_id).first()
+    """Actualizar un conductor (solo los campos editables presentes en el payload)"""
+    conductor = await actualizar_por_id(
+        db, Conductor, conductor_id, solo_columnas(payload, _CONDUCTOR_EDITABLES)
+    )
     if not conductor:
         raise HTTPException(status_code=404, detail="Conductor no encontrado")
 
-    for key, value in payload.items():
-        if hasattr(conductor, key) and key != "id":
-            setattr(conductor, key, value)
-
-    db.commit()
-    db.refresh(conductor)
+    await db.commit()
     return conductor
 
 
 @router.delete("/{conductor_id}")
-async def eliminar_conductor(conductor_id: int, db: Annotated[Session, Depends(get_db)]):
+async def eliminar_conductor(conductor_id: int, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Eliminar un conductor"""
-    conductor = db.query(Conductor).filter(Conductor.id == conductor_id).first()
+    conductor = await obtener_por_id(db, Conductor, conductor_id)
     if not conductor:
         raise HTTPException(status_code=404, detail="Conductor no encontrado")
 
-    db.delete(conductor)
-    db.commit()
+    await db.delete(conductor)
+    await db.commit()
     return {"mensaje": "Conductor eliminado"}
 
 
 @router.get("/mis-rutas/todas", response_model=List[dict])
-async def mis_rutas_todas(db: Annotated[Session, Depends(get_db)], conductor_id: int = 1):
+async def mis_rutas_todas(conductor_id: int = 1):
     """Obtener todas las rutas asignadas al conductor"""
     # TODO: Implementar lógica real cuando exista tabla de asignaciones
     return []
 
 
 @router.get("/mis-rutas/actual", response_model=Optional[dict])
-async def mis_rutas_actual(db: Annotated[Session, Depends(get_db)], conductor_id: int = 1):
+async def mis_rutas_actual(conductor_id: int = 1):
     """Obtener la ruta actual del conductor"""
     # TODO: Implementar lógica real
     return
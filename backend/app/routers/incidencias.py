@@ -1,13 +1,19 @@
 """
 Router de incidencias para FastAPI
 """
-from fastapi import APIRouter, Depends, HTTPException, status  # type: ignore[import]
-from sqlalchemy.orm import Session  # type: ignore[import]
-from pydantic import BaseModel  # type: ignore[import]
-from typing import Annotated, List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status  # type: ignore[import]
+from sqlalchemy import func, insert, select, tuple_  # type: ignore[import]
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
+from pydantic import BaseModel, ValidationError  # type: ignore[import]
+from typing import Annotated, List, Literal, Optional
 from datetime import datetime
-from app.database import get_db
+import os
+from app import clusters, derivados, etags, exportacion, geo, gravedad, media, teselas, zonas
+from app.database import fabrica_lectura, get_async_db, get_read_db
 from app.models import Incidencia
+from app.paginacion import paginar, recortar_pagina
+from app.repositorio import actualizar_por_id, obtener_por_id, solo_columnas
+from app.versiones import CacheVersionada, version
 
 router = APIRouter(prefix="/incidencias", tags=["incidencias"])
 
@@ -27,11 +33,16 @@ class IncidenciaResponse(BaseModel):
     reportado_en: datetime
     usuario_id: Optional[int] = None
     created_at: datetime
+    version: Optional[int] = None
 
     class Config:
         from_attributes = True
 
 
+class IncidenciaCercana(IncidenciaResponse):
+    distancia_m: float
+
+
 class IncidenciaCreate(BaseModel):
     tipo: str
     gravedad: int = 1
@@ -39,71 +50,174 @@ class IncidenciaCreate(BaseModel):
     foto_url: Optional[str] = None
     lat: Optional[float] = None
     lon: Optional[float] = None
-    zona: str
+    zona: Optional[str] = None  # Se calcula desde lat/lon si el punto cae en una zona conocida
     usuario_id: int = 1  # Default para testing
 
 
-@router.get("/stats")
-async def estadisticas(db: Annotated[Session, Depends(get_db)]):
-    """Estadísticas de incidencias"""
-    total = db.query(Incidencia).count()
-    
-    # Contar por estado
-    estados = db.query(Incidencia.estado).distinct().all()
+class IncidenciaLote(IncidenciaCreate):
+    """Elemento de ``POST /incidencias/bulk``: la posición es obligatoria (NOT NULL en la tabla)"""
+    lat: float
+    lon: float
+
+
+# Bits de GROUPING(estado, zona): 1 = zona agregada, 2 = estado agregado
+_POR_ESTADO, _POR_ZONA, _TOTAL, _CRUCE = 1, 2, 3, 0
+
+_cache_stats = CacheVersionada("incidencias", float(os.getenv("INCIDENCIAS_STATS_TTL", "15")))
+
+
+def _consulta_estadisticas(cruce: bool):
+    """Totales, por estado, por zona (y opcionalmente estado×zona) en una sola consulta"""
+    conjuntos = [tuple_(), tuple_(Incidencia.estado), tuple_(Incidencia.zona)]
+    if cruce:
+        conjuntos.append(tuple_(Incidencia.estado, Incidencia.zona))
+    return select(
+        Incidencia.estado,
+        Incidencia.zona,
+        func.grouping(Incidencia.estado, Incidencia.zona).label("agrupacion"),
+        func.count().label("total"),
+    ).group_by(func.grouping_sets(*conjuntos))
+
+
+@router.get("/stats", dependencies=[etags.condicional("incidencias")])
+async def estadisticas(db: Annotated[AsyncSession, Depends(get_read_db)], cruce: bool = False):
+    """Estadísticas de incidencias (con ``cruce=true`` incluye la tabla estado×zona)"""
+    cacheado = _cache_stats.obtener(cruce)
+    if cacheado is not None:
+        return cacheado
+
+    version_leida = version("incidencias")
+    filas = (await db.execute(_consulta_estadisticas(cruce))).all()
+
+    total = 0
     por_estado = {}
-    for (estado_val,) in estados:
-        if estado_val:
-            count = db.query(Incidencia).filter(Incidencia.estado == estado_val).count()
-            por_estado[estado_val] = count
-    
-    # Contar por zona
-    zonas = db.query(Incidencia.zona).distinct().all()
     por_zona = {}
-    for (zona_val,) in zonas:
-        if zona_val:
-            count = db.query(Incidencia).filter(Incidencia.zona == zona_val).count()
+    tabla_cruce = {}
+    for estado_val, zona_val, agrupacion, count in filas:
+        if agrupacion == _TOTAL:
+            total = count
+        elif agrupacion == _POR_ESTADO and estado_val:
+            por_estado[estado_val] = count
+        elif agrupacion == _POR_ZONA and zona_val:
             por_zona[zona_val] = count
+        elif agrupacion == _CRUCE and estado_val and zona_val:
+            tabla_cruce.setdefault(estado_val, {})[zona_val] = count
 
-    return {
+    resultado = {
         "total": total,
         "por_estado": por_estado,
         "por_zona": por_zona,
     }
+    if cruce:
+        resultado["cruce"] = tabla_cruce
+    _cache_stats.guardar(cruce, resultado, version_leida)
+    return resultado
 
 
-@router.get("/", response_model=List[IncidenciaResponse])
+@router.get("/", response_model=List[IncidenciaResponse], dependencies=[etags.condicional("incidencias")])
 async def listar_incidencias(
-    db: Annotated[Session, Depends(get_db)],
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
     estado: Optional[str] = None,
     zona: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True, description="Obsoleto: usar cursor"),
+    limit: int = Query(100, ge=1, le=1000),
 ):
-    """Listar todas las incidencias"""
-    query = db.query(Incidencia)
+    """
+    Listar incidencias, de la más reciente a la más antigua.
+
+    Paginar con ``cursor`` (cabecera ``X-Next-Cursor`` de la respuesta
+    anterior). ``skip`` es el parámetro antiguo: se mantiene por
+    compatibilidad, recorre las filas saltadas y no se puede combinar con
+    ``cursor`` (400).
+    """
+    if cursor and skip:
+        raise HTTPException(status_code=400, detail="skip y cursor no se pueden combinar: usar solo cursor")
+    query = select(Incidencia)
 
     if estado:
-        query = query.filter(Incidencia.estado == estado)
+        query = query.where(Incidencia.estado == estado)
     if zona:
-        query = query.filter(Incidencia.zona == zona)
+        query = query.where(Incidencia.zona == zona)
+
+    query = paginar(query, Incidencia, cursor, limit)
+    if skip:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return recortar_pagina(result.scalars().all(), limit, response)
+
+
+def _con_distancia(filas) -> list[IncidenciaCercana]:
+    return [
+        IncidenciaCercana(**IncidenciaResponse.model_validate(i).model_dump(), distancia_m=round(d, 1))
+        for i, d in filas
+    ]
+
+
+@router.get("/near", response_model=List[IncidenciaCercana], dependencies=[etags.condicional("incidencias")])
+async def incidencias_cercanas(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radio: float = Query(500, gt=0, le=geo.RADIO_MAXIMO, description="Metros"),
+    estado: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Incidencias a menos de ``radio`` metros de un punto, de la más cercana a la más lejana"""
+    query = select(Incidencia)
+    if estado:
+        query = query.where(Incidencia.estado == estado)
+    filas = (await db.execute(geo.cercanos(query, Incidencia, lat, lon, radio, cursor, limit))).all()
+    return _con_distancia(geo.recortar_pagina(filas, limit, response))
+
+
+@router.get("/bbox", response_model=List[IncidenciaCercana], dependencies=[etags.condicional("incidencias")])
+async def incidencias_en_recuadro(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    estado: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Incidencias dentro de un recuadro (vista del mapa), ordenadas desde su centro"""
+    query = select(Incidencia)
+    if estado:
+        query = query.where(Incidencia.estado == estado)
+    query = geo.en_recuadro(query, Incidencia, min_lat, min_lon, max_lat, max_lon, cursor, limit)
+    filas = (await db.execute(query)).all()
+    return _con_distancia(geo.recortar_pagina(filas, limit, response))
+
 
-    return query.offset(skip).limit(limit).all()
+def _zona_para(incidencia: IncidenciaCreate) -> Optional[str]:
+    """Zona calculada desde las coordenadas; si no cae en ninguna, la enviada por el cliente"""
+    return zonas.zona_de(incidencia.lat, incidencia.lon) or incidencia.zona
 
 
 @router.post("/", response_model=IncidenciaResponse, status_code=status.HTTP_201_CREATED)
 async def crear_incidencia(
     incidencia: IncidenciaCreate,
-    db: Annotated[Session, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_async_db)]
 ):
     """Crear nueva incidencia"""
+    zona = _zona_para(incidencia)
+    if not zona:
+        raise HTTPException(status_code=422, detail="No se pudo determinar la zona: indique 'zona'")
     new_incident = Incidencia(
         tipo=incidencia.tipo,
-        gravedad=incidencia.gravedad,
+        gravedad=gravedad.ajustar(incidencia.gravedad, incidencia.descripcion),
+        gravedad_base=incidencia.gravedad,
         descripcion=incidencia.descripcion,
         foto_url=incidencia.foto_url,
         lat=incidencia.lat,
         lon=incidencia.lon,
-        zona=incidencia.zona,
+        zona=zona,
         usuario_id=incidencia.usuario_id,
         estado="pendiente",
         reportado_en=datetime.utcnow(),
@@ -111,47 +225,211 @@ async def crear_incidencia(
         updated_at=datetime.utcnow(),
     )
     db.add(new_incident)
-    db.commit()
-    db.refresh(new_incident)
+    await db.commit()
+    await db.refresh(new_incident)
+    clusters.agregar("incidencias", new_incident.id, new_incident.lat, new_incident.lon)
+    teselas.invalidar_punto("incidencias", new_incident.lat, new_incident.lon)
     return new_incident
 
 
-@router.get("/{incidencia_id}", response_model=IncidenciaResponse)
-async def obtener_incidencia(incidencia_id: int, db: Annotated[Session, Depends(get_db)]):
+INCIDENCIAS_BULK_MAX = int(os.getenv("INCIDENCIAS_BULK_MAX", "10000"))
+
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def crear_incidencias_lote(
+    incidencias: Annotated[List[dict], Body()],
+    db: Annotated[AsyncSession, Depends(get_async_db)]
+):
+    """
+    Crear muchas incidencias en una sola transacción.
+
+    Cada elemento se valida por separado: los inválidos se devuelven en
+    ``errores`` (con su posición en la lista) y el resto se inserta con un
+    ``INSERT ... VALUES (...), (...) RETURNING id`` por cada bloque de filas.
+    Los ``ids`` siguen el orden de los elementos válidos.
+    """
+    if len(incidencias) > INCIDENCIAS_BULK_MAX:
+        raise HTTPException(
+            status_code=413, detail=f"Máximo {INCIDENCIAS_BULK_MAX} incidencias por petición"
+        )
+
+    ahora = datetime.utcnow()
+    filas = []
+    errores = []
+    for indice, crudo in enumerate(incidencias):
+        try:
+            item = IncidenciaLote.model_validate(crudo)
+        except ValidationError as e:
+            errores.append({
+                "indice": indice,
+                "errores": e.errors(include_url=False, include_context=False, include_input=False),
+            })
+            continue
+        zona = _zona_para(item)
+        if not zona:
+            errores.append({
+                "indice": indice,
+                "errores": [{"type": "missing", "loc": ["zona"], "msg": "No se pudo determinar la zona"}],
+            })
+            continue
+        filas.append({
+            **item.model_dump(),
+            "zona": zona,
+            "gravedad": gravedad.ajustar(item.gravedad, item.descripcion),
+            "gravedad_base": item.gravedad,
+            "estado": "pendiente",
+            "reportado_en": ahora,
+            "created_at": ahora,
+            "updated_at": ahora,
+        })
+
+    if not filas:
+        raise HTTPException(status_code=422, detail={"mensaje": "Ninguna incidencia válida", "errores": errores})
+
+    resultado = await db.execute(
+        insert(Incidencia).returning(Incidencia.id, sort_by_parameter_order=True), filas
+    )
+    ids = resultado.scalars().all()
+    await db.commit()
+    for pk, fila in zip(ids, filas):
+        clusters.agregar("incidencias", pk, fila["lat"], fila["lon"])
+    lats = [fila["lat"] for fila in filas]
+    lons = [fila["lon"] for fila in filas]
+    teselas.cache.invalidar("incidencias", (min(lats), min(lons), max(lats), max(lons)))
+    return {"creadas": len(ids), "ids": ids, "errores": errores}
+
+
+@router.get("/export")
+async def exportar_incidencias(
+    request: Request,
+    formato: Literal["ndjson", "csv"] = "ndjson",
+    estado: Optional[str] = None,
+    zona: Optional[str] = None,
+):
+    """Todas las incidencias (con los filtros de ``listar``) en NDJSON o CSV, en streaming"""
+    query = select(*Incidencia.__table__.c).order_by(Incidencia.created_at, Incidencia.id)
+    if estado:
+        query = query.where(Incidencia.estado == estado)
+    if zona:
+        query = query.where(Incidencia.zona == zona)
+    return exportacion.exportar(fabrica_lectura(request), query, formato, "incidencias")
+
+
+@router.get(
+    "/{incidencia_id}",
+    response_model=IncidenciaResponse,
+    dependencies=[etags.condicional("incidencias", Incidencia, "incidencia_id")],
+)
+async def obtener_incidencia(incidencia_id: int, db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Obtener una incidencia específica"""
-    incidencia = db.query(Incidencia).filter(Incidencia.id == incidencia_id).first()
+    incidencia = await obtener_por_id(db, Incidencia, incidencia_id)
     if not incidencia:
         raise HTTPException(status_code=404, detail="Incidencia no encontrada")
     return incidencia
 
 
+_INCIDENCIA_EDITABLES = frozenset({
+    "tipo", "gravedad", "descripcion", "foto_url", "lat", "lon", "zona", "estado",
+    "ventana_inicio", "ventana_fin", "usuario_id",
+})
+
+
 @router.patch("/{incidencia_id}", response_model=IncidenciaResponse)
 async def actualizar_incidencia(
     incidencia_id: int,
     payload: dict,
-    db: Annotated[Session, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_async_db)]
 ):
-    """Actualizar una incidencia"""
-    incidencia = db.query(Incidencia).filter(Incidencia.id == incidencia_id).first()
+    """
+    Actualizar una incidencia con un solo ``UPDATE ... RETURNING``.
+
+    ``gravedad`` y ``zona`` se recalculan a partir de otros campos; solo si
+    el payload no trae todos los que intervienen se lee antes la fila.
+    Con ``version`` en el cuerpo, concurrencia optimista: 409 si la
+    incidencia cambió desde esa versión. Si cambia ``lat``/``lon`` la fila
+    se lee bloqueada, para mover el punto en los clusters desde su
+    posición real.
+    """
+    version = payload.get("version")
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        raise HTTPException(status_code=400, detail="version debe ser un entero")
+    valores = solo_columnas(payload, _INCIDENCIA_EDITABLES)
+    mueve = "lat" in valores or "lon" in valores
+    actual = None
+    if mueve or ("gravedad" in valores and "descripcion" not in valores):
+        actual = await obtener_por_id(db, Incidencia, incidencia_id, bloquear=mueve)
+        if not actual:
+            raise HTTPException(status_code=404, detail="Incidencia no encontrada")
+    # Antes del UPDATE: su RETURNING refresca ``actual``
+    antes = (actual.lat, actual.lon) if mueve else None
+
+    if "gravedad" in valores:
+        valores["gravedad_base"] = valores["gravedad"]
+        descripcion = valores["descripcion"] if "descripcion" in valores else actual.descripcion
+        valores["gravedad"] = gravedad.ajustar(valores["gravedad_base"], descripcion)
+    elif "descripcion" in valores:
+        # La base queda en la fila: se ajusta en el propio UPDATE
+        base = func.coalesce(Incidencia.gravedad_base, Incidencia.gravedad)
+        valores["gravedad"] = func.least(
+            gravedad.GRAVEDAD_MAX,
+            func.greatest(gravedad.GRAVEDAD_MIN, base + gravedad.bonificacion(valores["descripcion"])),
+        )
+    if ("lat" in valores or "lon" in valores) and "zona" not in valores:
+        zona = zonas.zona_de(
+            valores.get("lat", actual.lat if actual else None),
+            valores.get("lon", actual.lon if actual else None),
+        )
+        if zona:
+            valores["zona"] = zona
+    if valores:
+        valores["updated_at"] = datetime.utcnow()
+
+    incidencia = await actualizar_por_id(db, Incidencia, incidencia_id, valores, version)
     if not incidencia:
         raise HTTPException(status_code=404, detail="Incidencia no encontrada")
+    await db.commit()
+    if mueve:
+        clusters.mover("incidencias", incidencia.id, antes, incidencia.lat, incidencia.lon)
+        teselas.invalidar_punto("incidencias", *antes)
+    teselas.invalidar_punto("incidencias", incidencia.lat, incidencia.lon)
+    return incidencia
 
-    for key, value in payload.items():
-        if hasattr(incidencia, key):
-            setattr(incidencia, key, value)
 
-    db.commit()
-    db.refresh(incidencia)
+@router.post("/{incidencia_id}/foto", response_model=IncidenciaResponse)
+async def subir_foto(
+    incidencia_id: int,
+    request: Request,
+    db: Annotated[AsyncSession, Depends(get_async_db)]
+):
+    """Subir la foto de evidencia (``multipart/form-data``, campo ``foto``) y usarla como ``foto_url``"""
+    if not await obtener_por_id(db, Incidencia, incidencia_id):
+        raise HTTPException(status_code=404, detail="Incidencia no encontrada")
+    # No retener una conexión del pool mientras llega el archivo
+    await db.rollback()
+
+    archivo, _ = await media.recibir_imagen(request)
+    if archivo.nuevo:
+        derivados.programar(archivo)
+    incidencia = await actualizar_por_id(db, Incidencia, incidencia_id, {
+        "foto_url": archivo.url,
+        "updated_at": datetime.utcnow(),
+    })
+    if not incidencia:
+        raise HTTPException(status_code=404, detail="Incidencia no encontrada")
+    await db.commit()
     return incidencia
 
 
 @router.delete("/{incidencia_id}")
-async def eliminar_incidencia(incidencia_id: int, db: Annotated[Session, Depends(get_db)]):
+async def eliminar_incidencia(incidencia_id: int, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Eliminar una incidencia"""
-    incidencia = db.query(Incidencia).filter(Incidencia.id == incidencia_id).first()
+    # Bloqueada: un PATCH concurrente no puede moverla entre la lectura y el borrado
+    incidencia = await obtener_por_id(db, Incidencia, incidencia_id, bloquear=True)
     if not incidencia:
         raise HTTPException(status_code=404, detail="Incidencia no encontrada")
 
-    db.delete(incidencia)
-    db.commit()
+    await db.delete(incidencia)
+    await db.commit()
+    clusters.quitar("incidencias", incidencia.id, incidencia.lat, incidencia.lon)
+    teselas.invalidar_punto("incidencias", incidencia.lat, incidencia.lon)
     return {"mensaje": "Incidencia eliminada"}
@@ -0,0 +1,110 @@
+"""
+Router interno de diagnóstico (/api/internal)
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status  # type: ignore[import]
+from typing import Optional
+import hmac
+import os
+
+from app import clusters, db_metrics, deduplicacion, gravedad, posiciones, slow_queries, teselas, zonas
+from app.routers.tracking import manager as tracking_manager
+
+# Se exige en la cabecera X-Internal-Token; sin INTERNAL_TOKEN el router queda cerrado
+INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN")
+
+
+def verificar_token_interno(x_internal_token: Optional[str] = Header(default=None)):
+    """Proteger los endpoints internos: 503 si no hay token configurado, 403 si no coincide"""
+    if not INTERNAL_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Endpoints internos desactivados: defina INTERNAL_TOKEN",
+        )
+    if x_internal_token is None or not hmac.compare_digest(
+        x_internal_token.encode(), INTERNAL_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token interno inválido")
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["internal"],
+    dependencies=[Depends(verificar_token_interno)],
+)
+
+
+@router.get("/db-stats")
+async def db_stats():
+    """Sentencias, tiempo de BD y sospechas de N+1 acumulados por ruta"""
+    return db_metrics.resumen()
+
+
+@router.delete("/db-stats")
+async def reiniciar_db_stats():
+    """Reiniciar el acumulado de estadísticas de BD"""
+    db_metrics.reiniciar()
+    return {"message": "Estadísticas reiniciadas"}
+
+
+@router.get("/slow-queries")
+async def listar_consultas_lentas():
+    """Últimas consultas lentas con parámetros redactados y plan EXPLAIN"""
+    return {
+        "umbral_ms": slow_queries.DB_SLOW_QUERY_MS,
+        "consultas": slow_queries.consultas_lentas(),
+    }
+
+
+@router.delete("/slow-queries")
+async def limpiar_consultas_lentas():
+    """Vaciar el buffer de consultas lentas"""
+    slow_queries.limpiar()
+    return {"message": "Consultas lentas eliminadas"}
+
+
+@router.post("/zonas/recargar")
+async def recargar_zonas():
+    """Volver a leer los polígonos de cleaning_zones"""
+    return {"zonas": await zonas.cargar_zonas()}
+
+
+@router.post("/zonas/reclasificar")
+async def reclasificar_zonas(lote: int = Query(1000, ge=1, le=10000)):
+    """Recalcular la zona de las incidencias existentes con los polígonos cargados"""
+    return await zonas.reclasificar_incidencias(lote)
+
+
+@router.post("/gravedad/recalcular")
+async def recalcular_gravedad(lote: int = Query(1000, ge=1, le=10000)):
+    """Recargar el diccionario de palabras clave y volver a puntuar incidencias y reportes"""
+    reglas = gravedad.recargar_reglas()
+    return {"reglas": reglas, "actualizadas": await gravedad.recalcular_gravedades(lote)}
+
+
+@router.post("/mapa/recargar")
+async def recargar_clusters():
+    """Reconstruir los índices de clusters del mapa desde la base"""
+    return {"puntos": await clusters.cargar()}
+
+
+@router.post("/reportes/deduplicar")
+async def deduplicar_reportes(lote: int = Query(1000, ge=1, le=10000)):
+    """Marcar los reportes ya guardados que repiten a otro anterior (mismo tipo, cerca y en la ventana)"""
+    resumen = await deduplicacion.deduplicar_historico(lote)
+    if resumen["duplicados"]:
+        # Los marcados dejan de pintarse en el mapa
+        await clusters.cargar()
+        teselas.invalidar_capa("reportes")
+    return resumen
+
+
+@router.get("/tracking/buffer")
+async def estado_buffer_gps():
+    """Posiciones GPS pendientes de escribir y contadores de la escritura diferida"""
+    return posiciones.buffer.estadisticas()
+
+
+@router.get("/tracking/conexiones")
+async def estado_conexiones_tracking():
+    """WebSockets de tracking abiertos: mensajes en cola, enviados y descartados por conexión"""
+    return tracking_manager.estadisticas()
@@ -0,0 +1,46 @@
+"""
+Router del mapa: marcadores agrupados por zoom (/api/mapa)
+"""
+from fastapi import APIRouter, HTTPException, Query  # type: ignore[import]
+from typing import Literal, Optional
+
+from app import clusters
+
+router = APIRouter(prefix="/mapa", tags=["mapa"])
+
+
+def _leer_bbox(bbox: str) -> tuple[float, float, float, float]:
+    """``min_lon,min_lat,max_lon,max_lat`` → ``(min_lat, min_lon, max_lat, max_lon)``"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser 'min_lon,min_lat,max_lon,max_lat'")
+    if min_lat >= max_lat or min_lon >= max_lon:
+        raise HTTPException(status_code=400, detail="Recuadro inválido: min_* debe ser menor que max_*")
+    if not (-90 <= min_lat and max_lat <= 90 and -180 <= min_lon and max_lon <= 180):
+        raise HTTPException(status_code=400, detail="Recuadro fuera de rango")
+    return min_lat, min_lon, max_lat, max_lon
+
+
+@router.get("/clusters")
+async def clusters_del_mapa(
+    bbox: str,
+    zoom: int = Query(..., ge=0, le=24),
+    fuente: Optional[Literal["incidencias", "reportes"]] = None,
+):
+    """
+    Marcadores agrupados del recuadro ``bbox`` para el nivel de ``zoom``.
+
+    Cada cluster trae su centroide y cuántos puntos agrupa. ``zoom`` en la
+    respuesta es el nivel usado: por encima de ``MAPA_ZOOM_MAX``, o si el
+    recuadro abarca demasiadas celdas, se agrupa a un nivel menor.
+    """
+    recuadro = _leer_bbox(bbox)
+    fuentes = [fuente] if fuente else list(clusters.FUENTES)
+    zoom_efectivo = min(clusters.indice(f).zoom_para(*recuadro, zoom) for f in fuentes)
+    resultado = []
+    for f in fuentes:
+        for cluster in clusters.indice(f).consultar(*recuadro, zoom_efectivo):
+            cluster["fuente"] = f
+            resultado.append(cluster)
+    return {"zoom": zoom_efectivo, "clusters": resultado}
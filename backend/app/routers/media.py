@@ -0,0 +1,101 @@
+"""
+Router de archivos de evidencia (/media)
+
+Sirve lo mismo que el alias ``/media/`` de nginx (originales y derivados
+bajo ``MEDIA_ROOT``) para los despliegues sin nginx delante y como destino
+de nginx cuando un derivado aún no existe. Los nombres son hashes del
+contenido, así que un archivo nunca cambia: ``ETag`` fuerte a partir del
+nombre, caché de un año ``immutable`` y soporte de ``Range`` (un solo
+rango) para que los visores descarguen por partes.
+"""
+import mimetypes
+
+import anyio  # type: ignore[import]
+from fastapi import APIRouter, HTTPException, Request, Response  # type: ignore[import]
+from fastapi.responses import StreamingResponse  # type: ignore[import]
+
+from app import derivados
+from app.media import MEDIA_ROOT
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+_FRAGMENTO = 64 * 1024
+_DIRECTORIOS = ("originales/", "derivados/")
+
+
+def _no_satisfacible(tamano: int) -> HTTPException:
+    return HTTPException(
+        status_code=416, detail="Rango no satisfacible", headers={"Content-Range": f"bytes */{tamano}"}
+    )
+
+
+def _rango(cabecera: str | None, tamano: int) -> tuple[int, int] | None:
+    """
+    ``(inicio, fin)`` inclusivo de un ``Range: bytes=...`` simple; None para servir el archivo entero.
+    Un rango mal formado (también ``inicio > fin``) se ignora; 416 solo si cae fuera del archivo.
+    """
+    if not cabecera or not cabecera.startswith("bytes=") or "," in cabecera:
+        return None
+    primero, _, ultimo = cabecera[6:].strip().partition("-")
+    try:
+        inicio = int(primero) if primero else None
+        fin = int(ultimo) if ultimo else None
+    except ValueError:
+        return None
+    if inicio is None:
+        # bytes=-N: los últimos N bytes
+        if fin is None or fin <= 0:
+            return None
+        if tamano == 0:
+            raise _no_satisfacible(tamano)
+        return max(0, tamano - fin), tamano - 1
+    if fin is not None and inicio > fin:
+        return None
+    if inicio >= tamano:
+        raise _no_satisfacible(tamano)
+    return inicio, tamano - 1 if fin is None else min(fin, tamano - 1)
+
+
+async def _leer(ruta, inicio: int, largo: int):
+    async with await anyio.open_file(ruta, "rb") as archivo:
+        await archivo.seek(inicio)
+        while largo > 0:
+            bloque = await archivo.read(min(_FRAGMENTO, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+
+
+@router.get("/{relativa:path}")
+async def servir_archivo(relativa: str, request: Request):
+    """Original o derivado; los derivados que faltan se generan al pedirlos"""
+    base = MEDIA_ROOT.resolve()
+    ruta = (base / relativa).resolve()
+    if not relativa.startswith(_DIRECTORIOS) or not ruta.is_relative_to(base):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+    if not await anyio.Path(ruta).is_file() and not await derivados.asegurar(relativa):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado")
+
+    tamano = (await anyio.Path(ruta).stat()).st_size
+    etag = f'"{ruta.stem}"'
+    cabeceras = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cabeceras)
+
+    tipo = mimetypes.guess_type(ruta.name)[0] or "application/octet-stream"
+    if_range = request.headers.get("if-range")
+    rango = _rango(request.headers.get("range"), tamano) if if_range in (None, etag) else None
+    if rango is None:
+        cabeceras["Content-Length"] = str(tamano)
+        return StreamingResponse(_leer(ruta, 0, tamano), media_type=tipo, headers=cabeceras)
+
+    inicio, fin = rango
+    cabeceras["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+    cabeceras["Content-Length"] = str(fin - inicio + 1)
+    return StreamingResponse(_leer(ruta, inicio, fin - inicio + 1), status_code=206, media_type=tipo, headers=cabeceras)
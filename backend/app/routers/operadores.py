@@ -2,12 +2,15 @@
 Router para gestión de operadores
 """
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated, List
 from pydantic import BaseModel
 from datetime import datetime
-from app.database import get_db
+from app.database import get_async_db, get_read_db
 from app.models import User
+from app.repositorio import actualizar_por_id, obtener_por_id
+import uuid
 
 router = APIRouter(prefix="/operadores", tags=["operadores"])
 
@@ -34,10 +37,22 @@ class OperadorResponse(BaseModel):
         from_attributes = True
 
 
+async def _obtener_operador_o_404(db: AsyncSession, operador_id: str) -> User:
+    """Buscar un operador por su UUID (en texto) o responder 404"""
+    try:
+        operador = await obtener_por_id(db, User, uuid.UUID(operador_id))
+    except ValueError:
+        operador = None
+    if not operador:
+        raise HTTPException(status_code=404, detail="Operador no encontrado")
+    return operador
+
+
 @router.get("/", response_model=List[OperadorResponse])
-async def listar_operadores(db: Annotated[Session, Depends(get_db)]):
+async def listar_operadores(db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Listar todos los operadores"""
-    operadores = db.query(User).filter(User.role == "operador").all()
+    result = await db.execute(select(User).where(User.role == "operador"))
+    operadores = result.scalars().all()
     # Convertir UUID a string para compatibilidad con Pydantic
     return [{
         "id": str(op.id),
@@ -51,10 +66,10 @@ async def listar_operadores(db: Annotated[Session, Depends(get_db)]):
 
 
 @router.post("/", response_model=OperadorResponse)
-async def crear_operador(operador: OperadorCreate, db: Annotated[Session, Depends(get_db)]):
+async def crear_operador(operador: OperadorCreate, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Crear nuevo operador"""
     # Verificar si el email ya existe
-    if db.query(User).filter(User.email == operador.email).first():
+    if (await db.execute(select(User).where(User.email == operador.email))).scalars().first():
         raise HTTPException(status_code=400, detail="El email ya existe")
     
     # Hash de la contraseña (simplificado)
@@ -75,8 +90,8 @@ async def crear_operador(operador: OperadorCreate, db: Annotated[Session, Depend
     )
     
     db.add(nuevo_operador)
-    db.commit()
-    db.refresh(nuevo_operador)
+    await db.commit()
+    await db.refresh(nuevo_operador)
     
     return {
         "id": str(nuevo_operador.id),
@@ -90,11 +105,9 @@ async def crear_operador(operador: OperadorCreate, db: Annotated[Session, Depend
 
 
 @router.get("/{operador_id}", response_model=OperadorResponse)
-async def obtener_operador(operador_id: str, db: Annotated[Session, Depends(get_db)]):
+async def obtener_operador(operador_id: str, db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Obtener operador por ID"""
-    operador = db.query(User).filter(User.id == operador_id).first()
-    if not operador:
-        raise HTTPException(status_code=404, detail="Operador no encontrado")
+    operador = await _obtener_operador_o_404(db, operador_id)
     return {
         "id": str(operador.id),
         "email": operador.email,
@@ -107,20 +120,22 @@ async def obtener_operador(operador_id: str, db: Annotated[Session, Depends(get_
 
 
 @router.put("/{operador_id}", response_model=OperadorResponse)
-async def actualizar_operador(operador_id: str, operador: OperadorCreate, db: Annotated[Session, Depends(get_db)]):
+async def actualizar_operador(operador_id: str, operador: OperadorCreate, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Actualizar operador"""
-    op_actual = db.query(User).filter(User.id == operador_id).first()
+    try:
+        op_actual = await actualizar_por_id(db, User, uuid.UUID(operador_id), {
+            "email": operador.email,
+            "username": operador.username,
+            "phone": operador.phone,
+            "display_name": operador.display_name,
+            "updated_at": datetime.utcnow(),
+        })
+    except ValueError:
+        op_actual = None
     if not op_actual:
         raise HTTPException(status_code=404, detail="Operador no encontrado")
-    
-    op_actual.email = operador.email
-    op_actual.username = operador.username
-    op_actual.phone = operador.phone
-    op_actual.display_name = operador.display_name
-    op_actual.updated_at = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(op_actual)
+
+    await db.commit()
     return {
         "id": str(op_actual.id),
         "email": op_actual.email,
@@ -133,12 +148,10 @@ async def actualizar_operador(operador_id: str, operador: OperadorCreate, db: An
 
 
 @router.delete("/{operador_id}")
-async def eliminar_operador(operador_id: str, db: Annotated[Session, Depends(get_db)]):
+async def eliminar_operador(operador_id: str, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Eliminar operador"""
-    operador = db.query(User).filter(User.id == operador_id).first()
-    if not operador:
-        raise HTTPException(status_code=404, detail="Operador no encontrado")
+    operador = await _obtener_operador_o_404(db, operador_id)
     
-    db.delete(operador)
-    db.commit()
+    await db.delete(operador)
+    await db.commit()
     return {"message": "Operador eliminado"}
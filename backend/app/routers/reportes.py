@@ -1,13 +1,17 @@
 """
 Router para reportes desde APK
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Annotated, List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, List, Literal
 from pydantic import BaseModel
 from datetime import datetime
-from app.database import get_db
-from app.models import Report
+from app import clusters, deduplicacion, derivados, etags, exportacion, geo, gravedad, media, teselas
+from app.database import fabrica_lectura, get_async_db, get_read_db
+from app.models import Report, ReportAttachment
+from app.paginacion import paginar, recortar_pagina
+from app.repositorio import actualizar_por_id, obtener_por_id
 import uuid
 
 router = APIRouter(prefix="/reportes", tags=["reportes"])
@@ -26,6 +30,7 @@ class ReporteUpdate(BaseModel):
     description: str | None = None
     type: str | None = None
     status: str | None = None  # ENVIADO, EN_PROCESO, COMPLETADO
+    version: int | None = None  # Si se envía, 409 cuando el reporte cambió desde esa versión
 
 
 class ReporteResponse(BaseModel):
@@ -36,6 +41,10 @@ class ReporteResponse(BaseModel):
     location_lat: float | None = None
     location_lon: float | None = None
     photo_url: str | None = None
+    priority_score: float | None = None
+    version: int | None = None
+    duplicates: int | None = None  # Reportes repetidos vinculados a este
+    duplicado: bool = False  # En POST: el reporte ya existía y se vinculó a él
     created_at: datetime
     updated_at: datetime
 
@@ -43,14 +52,72 @@ class ReporteResponse(BaseModel):
         from_attributes = True
 
 
-@router.get("/", response_model=List[ReporteResponse])
-async def listar_reportes(db: Annotated[Session, Depends(get_db)], status: str | None = None):
-    """Listar reportes (incidencias de APK)"""
-    query = db.query(Report)
+class ReporteCercano(ReporteResponse):
+    distancia_m: float
+
+
+class AdjuntoResponse(BaseModel):
+    id: str
+    report_id: str
+    filename: str | None = None
+    mime_type: str | None = None
+    size_bytes: int | None = None
+    url: str | None = None
+    hash: str | None = None
+    type: str | None = None
+    derivados: dict[str, str] = {}  # variante → URL (miniatura, mediana, webp)
+    created_at: datetime
+
+    @classmethod
+    def desde(cls, adjunto: ReportAttachment) -> "AdjuntoResponse":
+        return cls(
+            id=str(adjunto.id),
+            report_id=str(adjunto.report_id),
+            filename=adjunto.filename,
+            mime_type=adjunto.mime_type,
+            size_bytes=adjunto.size_bytes,
+            url=adjunto.remote_url,
+            hash=adjunto.hash,
+            type=adjunto.type,
+            derivados=derivados.urls(adjunto.hash),
+            created_at=adjunto.created_at,
+        )
+
+
+async def _obtener_reporte_o_404(db: AsyncSession, reporte_id: str) -> Report:
+    """Buscar un reporte por su UUID (en texto) o responder 404"""
+    try:
+        reporte = await obtener_por_id(db, Report, uuid.UUID(reporte_id))
+    except ValueError:
+        reporte = None
+    if not reporte:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    return reporte
+
+
+@router.get("/", response_model=List[ReporteResponse], dependencies=[etags.condicional("reports")])
+async def listar_reportes(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    incluir_duplicados: bool = False,
+):
+    """
+    Listar reportes (incidencias de APK), paginados con ``cursor`` / ``X-Next-Cursor``.
+
+    Los marcados como repetidos de otro (``duplicate_of``) se omiten salvo
+    con ``incluir_duplicados``.
+    """
+    query = select(Report)
     if status:
-        query = query.filter(Report.status == status)
+        query = query.where(Report.status == status)
+    if not incluir_duplicados:
+        query = query.where(Report.duplicate_of.is_(None))
     
-    reportes = query.all()
+    reportes = (await db.execute(paginar(query, Report, cursor, limit))).scalars().all()
+    reportes = recortar_pagina(reportes, limit, response)
     result = []
     for r in reportes:
         reporte_dict = {
@@ -61,6 +128,9 @@ async def listar_reportes(db: Annotated[Session, Depends(get_db)], status: str |
             "location_lat": r.lat,
             "location_lon": r.lon,
             "photo_url": r.photo_url,
+            "priority_score": r.priority_score,
+            "version": r.version,
+            "duplicates": r.duplicates,
             "created_at": r.created_at,
             "updated_at": r.updated_at,
         }
@@ -69,9 +139,70 @@ async def listar_reportes(db: Annotated[Session, Depends(get_db)], status: str |
     return result
 
 
+def _con_distancia(filas) -> list[ReporteCercano]:
+    return [
+        ReporteCercano(
+            id=str(r.id),
+            description=r.description,
+            type=r.type,
+            status=r.status,
+            location_lat=r.lat,
+            location_lon=r.lon,
+            photo_url=r.photo_url,
+            priority_score=r.priority_score,
+            version=r.version,
+            duplicates=r.duplicates,
+            created_at=r.created_at,
+            updated_at=r.updated_at,
+            distancia_m=round(d, 1),
+        )
+        for r, d in filas
+    ]
+
+
+@router.get("/near", response_model=List[ReporteCercano], dependencies=[etags.condicional("reports")])
+async def reportes_cercanos(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radio: float = Query(500, gt=0, le=geo.RADIO_MAXIMO, description="Metros"),
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Reportes a menos de ``radio`` metros de un punto, del más cercano al más lejano"""
+    query = select(Report)
+    if status:
+        query = query.where(Report.status == status)
+    filas = (await db.execute(geo.cercanos(query, Report, lat, lon, radio, cursor, limit))).all()
+    return _con_distancia(geo.recortar_pagina(filas, limit, response))
+
+
+@router.get("/bbox", response_model=List[ReporteCercano], dependencies=[etags.condicional("reports")])
+async def reportes_en_recuadro(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Reportes dentro de un recuadro (vista del mapa), ordenados desde su centro"""
+    query = select(Report)
+    if status:
+        query = query.where(Report.status == status)
+    query = geo.en_recuadro(query, Report, min_lat, min_lon, max_lat, max_lon, cursor, limit)
+    filas = (await db.execute(query)).all()
+    return _con_distancia(geo.recortar_pagina(filas, limit, response))
+
+
 @router.post("/", response_model=ReporteResponse)
-async def crear_reporte(reporte: ReporteCreate, db: Annotated[Session, Depends(get_db)]):
-    """Crear nuevo reporte desde APK"""
+async def crear_reporte(reporte: ReporteCreate, db: Annotated[AsyncSession, Depends(get_async_db)]):
+    """Crear nuevo reporte desde APK (si repite a uno abierto cercano, se guarda vinculado y se responde con ese)"""
     # Validar tipo de reporte según constraint de BD: 'acopio' o 'critico'
     if reporte.type not in ["acopio", "critico"]:
         raise HTTPException(status_code=400, detail="Tipo de reporte inválido. Use 'acopio' o 'critico'")
@@ -82,7 +213,7 @@ async def crear_reporte(reporte: ReporteCreate, db: Annotated[Session, Depends(g
     else:
         # Obtener cualquier usuario existente como default
         from app.models import User
-        first_user = db.query(User).first()
+        first_user = (await db.execute(select(User).limit(1))).scalars().first()
         if not first_user:
             raise HTTPException(status_code=400, detail="No hay usuarios disponibles. Proporcione un user_id.")
         user_id = first_user.id
@@ -95,15 +226,41 @@ async def crear_reporte(reporte: ReporteCreate, db: Annotated[Session, Depends(g
         lat=reporte.location_lat,
         lon=reporte.location_lon,
         photo_url=reporte.photo_url,
+        priority_score=gravedad.puntuar(reporte.description),
         status="ENVIADO",
         synced=False,
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
     
+    # Si ya hay uno abierto igual y cerca, se vincula a él: el nuevo se guarda como repetido
+    existente = await deduplicacion.vincular(db, reporte.type, reporte.location_lat, reporte.location_lon)
+    if existente:
+        nuevo_reporte.duplicate_of = existente.id
+    
     db.add(nuevo_reporte)
-    db.commit()
-    db.refresh(nuevo_reporte)
+    await db.commit()
+    await db.refresh(nuevo_reporte)
+    if existente:
+        # El repetido no se pinta: ni clusters ni teselas cambian
+        return ReporteResponse(
+            id=str(existente.id),
+            description=existente.description,
+            type=existente.type,
+            status=existente.status,
+            location_lat=existente.lat,
+            location_lon=existente.lon,
+            photo_url=existente.photo_url,
+            priority_score=existente.priority_score,
+            version=existente.version,
+            duplicates=existente.duplicates,
+            duplicado=True,
+            created_at=existente.created_at,
+            updated_at=existente.updated_at,
+        )
+    clusters.agregar("reportes", nuevo_reporte.id, nuevo_reporte.lat, nuevo_reporte.lon)
+    teselas.invalidar_punto("reportes", nuevo_reporte.lat, nuevo_reporte.lon)
+    deduplicacion.registrar(nuevo_reporte)
     
     # Convertir para respuesta
     response_dict = {
@@ -114,6 +271,9 @@ async def crear_reporte(reporte: ReporteCreate, db: Annotated[Session, Depends(g
         "location_lat": nuevo_reporte.lat,
         "location_lon": nuevo_reporte.lon,
         "photo_url": nuevo_reporte.photo_url,
+        "priority_score": nuevo_reporte.priority_score,
+        "version": nuevo_reporte.version,
+        "duplicates": nuevo_reporte.duplicates,
         "created_at": nuevo_reporte.created_at,
         "updated_at": nuevo_reporte.updated_at
     }
@@ -121,12 +281,37 @@ async def crear_reporte(reporte: ReporteCreate, db: Annotated[Session, Depends(g
     return ReporteResponse(**response_dict)
 
 
-@router.get("/{reporte_id}", response_model=ReporteResponse)
-async def obtener_reporte(reporte_id: str, db: Annotated[Session, Depends(get_db)]):
+@router.get("/export")
+async def exportar_reportes(
+    request: Request,
+    formato: Literal["ndjson", "csv"] = "ndjson",
+    status: str | None = None,
+):
+    """Todos los reportes (campos de ``ReporteResponse``) en NDJSON o CSV, en streaming"""
+    query = select(
+        Report.id,
+        Report.description,
+        Report.type,
+        Report.status,
+        Report.lat.label("location_lat"),
+        Report.lon.label("location_lon"),
+        Report.photo_url,
+        Report.priority_score,
+        Report.version,
+        Report.duplicates,
+        Report.duplicate_of,
+        Report.created_at,
+        Report.updated_at,
+    ).order_by(Report.created_at, Report.id)
+    if status:
+        query = query.where(Report.status == status)
+    return exportacion.exportar(fabrica_lectura(request), query, formato, "reportes")
+
+
+@router.get("/{reporte_id}", response_model=ReporteResponse, dependencies=[etags.condicional("reports", Report, "reporte_id")])
+async def obtener_reporte(reporte_id: str, db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Obtener reporte por ID"""
-    reporte = db.query(Report).filter(Report.id == reporte_id).first()
-    if not reporte:
-        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    reporte = await _obtener_reporte_o_404(db, reporte_id)
     
     response_dict = {
         "id": str(reporte.id),
@@ -136,6 +321,9 @@ async def obtener_reporte(reporte_id: str, db: Annotated[Session, Depends(get_db
         "location_lat": reporte.lat,
         "location_lon": reporte.lon,
         "photo_url": reporte.photo_url,
+        "priority_score": reporte.priority_score,
+        "version": reporte.version,
+        "duplicates": reporte.duplicates,
         "created_at": reporte.created_at,
         "updated_at": reporte.updated_at
     }
@@ -144,24 +332,29 @@ async def obtener_reporte(reporte_id: str, db: Annotated[Session, Depends(get_db
 
 
 @router.put("/{reporte_id}", response_model=ReporteResponse)
-async def actualizar_reporte(reporte_id: str, reporte: ReporteUpdate, db: Annotated[Session, Depends(get_db)]):
-    """Actualizar reporte"""
-    reporte_actual = db.query(Report).filter(Report.id == reporte_id).first()
-    if not reporte_actual:
-        raise HTTPException(status_code=404, detail="Reporte no encontrado")
-    
+async def actualizar_reporte(reporte_id: str, reporte: ReporteUpdate, db: Annotated[AsyncSession, Depends(get_async_db)]):
+    """Actualizar reporte (con ``version`` en el cuerpo, control de concurrencia optimista)"""
+    valores = {"updated_at": datetime.utcnow()}
     if reporte.description:
-        reporte_actual.description = reporte.description
+        valores["description"] = reporte.description
+        valores["priority_score"] = gravedad.puntuar(reporte.description)
     if reporte.type:
         if reporte.type not in ["acopio", "critico"]:
             raise HTTPException(status_code=400, detail="Tipo de reporte inválido. Use 'acopio' o 'critico'")
-        reporte_actual.type = reporte.type
+        valores["type"] = reporte.type
     if reporte.status:
-        reporte_actual.status = reporte.status
-    
-    reporte_actual.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(reporte_actual)
+        valores["status"] = reporte.status
+
+    try:
+        reporte_actual = await actualizar_por_id(
+            db, Report, uuid.UUID(reporte_id), valores, version=reporte.version
+        )
+    except ValueError:
+        reporte_actual = None
+    if not reporte_actual:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    await db.commit()
+    teselas.invalidar_punto("reportes", reporte_actual.lat, reporte_actual.lon)
     
     response_dict = {
         "id": str(reporte_actual.id),
@@ -171,6 +364,9 @@ async def actualizar_reporte(reporte_id: str, reporte: ReporteUpdate, db: Annota
         "location_lat": reporte_actual.lat,
         "location_lon": reporte_actual.lon,
         "photo_url": reporte_actual.photo_url,
+        "priority_score": reporte_actual.priority_score,
+        "version": reporte_actual.version,
+        "duplicates": reporte_actual.duplicates,
         "created_at": reporte_actual.created_at,
         "updated_at": reporte_actual.updated_at
     }
@@ -179,28 +375,100 @@ async def actualizar_reporte(reporte_id: str, reporte: ReporteUpdate, db: Annota
 
 
 @router.delete("/{reporte_id}")
-async def eliminar_reporte(reporte_id: str, db: Annotated[Session, Depends(get_db)]):
+async def eliminar_reporte(reporte_id: str, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Eliminar reporte"""
-    reporte = db.query(Report).filter(Report.id == reporte_id).first()
-    if not reporte:
-        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    reporte = await _obtener_reporte_o_404(db, reporte_id)
     
-    db.delete(reporte)
-    db.commit()
+    await db.delete(reporte)
+    await db.commit()
+    clusters.quitar("reportes", reporte.id, reporte.lat, reporte.lon)
+    teselas.invalidar_punto("reportes", reporte.lat, reporte.lon)
     return {"message": "Reporte eliminado"}
 
 
 @router.post("/{reporte_id}/asignar-operador")
-async def asignar_operador(reporte_id: str, operador_id: str, db: Annotated[Session, Depends(get_db)]):
+async def asignar_operador(reporte_id: str, operador_id: str, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Asignar operador a un reporte"""
-    reporte = db.query(Report).filter(Report.id == reporte_id).first()
+    try:
+        operador_uuid = uuid.UUID(operador_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="operador_id inválido")
+    try:
+        # Actualizar el user_id con el operador asignado
+        reporte = await actualizar_por_id(db, Report, uuid.UUID(reporte_id), {
+            "user_id": operador_uuid,
+            "status": "EN_PROCESO",
+            "updated_at": datetime.utcnow(),
+        })
+    except ValueError:
+        reporte = None
     if not reporte:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
-    
-    # Actualizar el user_id con el operador asignado
-    reporte.user_id = uuid.UUID(operador_id)
-    reporte.status = "EN_PROCESO"
-    reporte.updated_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {"message": "Operador asignado", "reporte_id": reporte_id, "operador_id": operador_id}
+
+
+_TIPOS_ADJUNTO = ("BEFORE", "AFTER", "EVIDENCE")
+
+
+@router.post("/{reporte_id}/fotos", response_model=AdjuntoResponse, status_code=201)
+async def subir_foto(reporte_id: str, request: Request, db: Annotated[AsyncSession, Depends(get_async_db)]):
+    """
+    Subir una foto de evidencia (``multipart/form-data``, campo ``foto``;
+    ``tipo`` opcional: BEFORE, AFTER o EVIDENCE).
+
+    El archivo se guarda por su SHA-256; subir la misma foto al mismo
+    reporte devuelve el adjunto existente. La primera foto pasa a ser
+    ``photo_url`` del reporte si no tenía.
+    """
+    reporte_uuid = (await _obtener_reporte_o_404(db, reporte_id)).id
+    # No retener una conexión del pool mientras llega el archivo
+    await db.rollback()
+
+    archivo, campos = await media.recibir_imagen(request)
+    if archivo.nuevo:
+        derivados.programar(archivo)
+    tipo = campos.get("tipo", "EVIDENCE").upper()
+    if tipo not in _TIPOS_ADJUNTO:
+        raise HTTPException(status_code=400, detail=f"tipo inválido. Use: {', '.join(_TIPOS_ADJUNTO)}")
+
+    existente = (await db.execute(
+        select(ReportAttachment).where(
+            ReportAttachment.report_id == reporte_uuid, ReportAttachment.hash == archivo.sha256
+        ).limit(1)
+    )).scalar_one_or_none()
+    if existente:
+        return AdjuntoResponse.desde(existente)
+
+    adjunto = ReportAttachment(
+        id=uuid.uuid4(),
+        report_id=reporte_uuid,
+        filename=archivo.nombre,
+        mime_type=archivo.mime,
+        size_bytes=archivo.tamano,
+        remote_url=archivo.url,
+        hash=archivo.sha256,
+        type=tipo,
+        created_at=datetime.utcnow(),
+    )
+    db.add(adjunto)
+    await db.execute(
+        update(Report)
+        .where(Report.id == reporte_uuid, Report.photo_url.is_(None))
+        .values(photo_url=archivo.url)
+    )
+    await db.commit()
+    return AdjuntoResponse.desde(adjunto)
+
+
+@router.get("/{reporte_id}/fotos", response_model=List[AdjuntoResponse])
+async def listar_fotos(reporte_id: str, db: Annotated[AsyncSession, Depends(get_read_db)]):
+    """Fotos adjuntas a un reporte, de la más antigua a la más reciente"""
+    reporte_uuid = (await _obtener_reporte_o_404(db, reporte_id)).id
+    adjuntos = (await db.execute(
+        select(ReportAttachment)
+        .where(ReportAttachment.report_id == reporte_uuid)
+        .order_by(ReportAttachment.created_at, ReportAttachment.id)
+    )).scalars().all()
+    return [AdjuntoResponse.desde(a) for a in adjuntos]
@@ -1,16 +1,13 @@
 """
 Router para reportes (/api/reports)
 """
-from fastapi import APIRouter, Depends  # type: ignore[import]
-from sqlalchemy.orm import Session  # type: ignore[import]
-from typing import Annotated
-from app.database import get_db
+from fastapi import APIRouter  # type: ignore[import]
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 
 @router.get("/statistics/")
-async def statistics(db: Annotated[Session, Depends(get_db)], start_date: str | None = None, end_date: str | None = None):
+async def statistics(start_date: str | None = None, end_date: str | None = None):
     """Estadísticas de reportes (dummy)"""
     return {
         "period": f"{start_date or 'N/A'} - {end_date or 'N/A'}",
@@ -25,5 +22,5 @@ async def statistics(db: Annotated[Session, Depends(get_db)], start_date: str |
 
 
 @router.post("/export/")
-async def export_report(db: Annotated[Session, Depends(get_db)], format: str = "pdf"):
+async def export_report(format: str = "pdf"):
     return {"url": "#", "message": f"Reporte en {format} no implementado"}
@@ -2,12 +2,15 @@
 Router de rutas para FastAPI
 """
 from fastapi import APIRouter, Depends, HTTPException, status  # type: ignore[import]
-from sqlalchemy.orm import Session  # type: ignore[import]
+from sqlalchemy import select  # type: ignore[import]
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
 from pydantic import BaseModel  # type: ignore[import]
 from typing import Annotated, List, Optional
 from datetime import datetime
-from app.database import get_db
+from app import etags
+from app.database import get_async_db, get_read_db
 from app.models import Ruta
+from app.repositorio import actualizar_por_id, obtener_por_id, solo_columnas
 
 router = APIRouter(prefix="/rutas", tags=["rutas"])
 
@@ -32,14 +35,15 @@ class RutaCreate(BaseModel):
     tiempo_estimado_minutos: int
 
 
-@router.get("/", response_model=List[RutaResponse])
-async def listar_rutas(db: Annotated[Session, Depends(get_db)]):
+@router.get("/", response_model=List[RutaResponse], dependencies=[etags.condicional("rutas")])
+async def listar_rutas(db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Listar todas las rutas"""
-    return db.query(Ruta).all()
+    result = await db.execute(select(Ruta))
+    return result.scalars().all()
 
 
 @router.post("/", response_model=RutaResponse, status_code=status.HTTP_201_CREATED)
-async def crear_ruta(ruta: RutaCreate, db: Annotated[Session, Depends(get_db)]):
+async def crear_ruta(ruta: RutaCreate, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Crear nueva ruta"""
     new_ruta = Ruta(
         nombre=ruta.nombre,
@@ -49,54 +53,53 @@ async def crear_ruta(ruta: RutaCreate, db: Annotated[Session, Depends(get_db)]):
         estado="activa"
     )
     db.add(new_ruta)
-    db.commit()
-    db.refresh(new_ruta)
+    await db.commit()
+    await db.refresh(new_ruta)
     return new_ruta
 
 
-@router.get("/{ruta_id}", response_model=RutaResponse)
-async def obtener_ruta(ruta_id: int, db: Annotated[Session, Depends(get_db)]):
+@router.get("/{ruta_id}", response_model=RutaResponse, dependencies=[etags.condicional("rutas")])
+async def obtener_ruta(ruta_id: int, db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Obtener una ruta específica"""
-    ruta = db.query(Ruta).filter(Ruta.id == ruta_id).first()
+    ruta = await obtener_por_id(db, Ruta, ruta_id)
     if not ruta:
         raise HTTPException(status_code=404, detail="Ruta no encontrada")
     return ruta
 
 
+_RUTA_EDITABLES = frozenset({"nombre", "descripcion", "distancia_km", "tiempo_estimado_minutos", "estado"})
+
+
 @router.patch("/{ruta_id}", response_model=RutaResponse)
 async def actualizar_ruta(
     ruta_id: int,
     payload: dict,
-    db: Annotated[Session, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_async_db)]
 ):
-    """Actualizar una ruta"""
-    ruta = db.query(Ruta).filter(Ruta.id == ruta_id).first()
+    """Actualizar una ruta (solo los campos editables presentes en el payload)"""
+    ruta = await actualizar_por_id(db, Ruta, ruta_id, solo_columnas(payload, _RUTA_EDITABLES))
     if not ruta:
         raise HTTPException(status_code=404, detail="Ruta no encontrada")
 
-    for key, value in payload.items():
-        if hasattr(ruta, key) and key != "id":
-            setattr(ruta, key, value)
-
-    db.commit()
-    db.refresh(ruta)
+    await db.commit()
     return ruta
 
 
 @router.delete("/{ruta_id}")
-async def eliminar_ruta(ruta_id: int, db: Annotated[Session, Depends(get_db)]):
+async def eliminar_ruta(ruta_id: int, db: Annotated[AsyncSession, Depends(get_async_db)]):
     """Eliminar una ruta"""
-    ruta = db.query(Ruta).filter(Ruta.id == ruta_id).first()
+    ruta = await obtener_por_id(db, Ruta, ruta_id)
     if not ruta:
         raise HTTPException(status_code=404, detail="Ruta no encontrada")
 
-    db.delete(ruta)
-    db.commit()
+    await db.delete(ruta)
+    await db.commit()
     return {"mensaje": "Ruta eliminada"}
 
 
-@router.get("/zona/{zona}", response_model=List[RutaResponse])
-async def obtener_rutas_por_zona(zona: str, db: Annotated[Session, Depends(get_db)]):
+@router.get("/zona/{zona}", response_model=List[RutaResponse], dependencies=[etags.condicional("rutas")])
+async def obtener_rutas_por_zona(zona: str, db: Annotated[AsyncSession, Depends(get_read_db)]):
     """Obtener rutas por zona"""
     # TODO: Cuando Ruta tenga campo 'zona'
-    return db.query(Ruta).all()
+    result = await db.execute(select(Ruta))
+    return result.scalars().all()
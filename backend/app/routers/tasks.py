@@ -1,12 +1,10 @@
 """
 Router para tareas (/api/tasks)
 """
-from fastapi import APIRouter, Depends  # type: ignore[import]
-from sqlalchemy.orm import Session  # type: ignore[import]
+from fastapi import APIRouter  # type: ignore[import]
 from pydantic import BaseModel  # type: ignore[import]
-from typing import Annotated, List, Optional
+from typing import List, Optional
 from datetime import datetime
-from app.database import get_db
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
@@ -26,12 +24,12 @@ class TaskList(BaseModel):
 
 
 @router.get("/", response_model=TaskList)
-async def list_tasks(db: Annotated[Session, Depends(get_db)]):
+async def list_tasks():
     return {"total": 0, "tasks": []}
 
 
 @router.post("/", response_model=Task)
-async def create_task(payload: dict, db: Annotated[Session, Depends(get_db)]):
+async def create_task(payload: dict):
     return Task(
         id=1,
         title=payload.get("title", "Nueva tarea"),
@@ -42,7 +40,7 @@ async def create_task(payload: dict, db: Annotated[Session, Depends(get_db)]):
 
 
 @router.patch("/{task_id}", response_model=Task)
-async def update_task(task_id: int, payload: dict, db: Annotated[Session, Depends(get_db)]):
+async def update_task(task_id: int, payload: dict):
     return Task(
         id=task_id,
         title=payload.get("title", "Tarea demo"),
@@ -53,7 +51,7 @@ async def update_task(task_id: int, payload: dict, db: Annotated[Session, Depend
 
 
 @router.post("/{task_id}/complete", response_model=Task)
-async def complete_task(task_id: int, db: Annotated[Session, Depends(get_db)]):
+async def complete_task(task_id: int):
     return Task(
         id=task_id,
         title="Tarea demo",
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Annotated
 from datetime import datetime
-from app.database import get_db
+from app.database import get_read_db
 from app.models import Task as TaskModel
+from app.paginacion import paginar, recortar_pagina
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -33,6 +35,12 @@ class TaskOut3(BaseModel):
         from_attributes = True
 
 @router.get("/tasks3", response_model=List[TaskOut3])
-async def list_tasks3(db: Annotated[Session, Depends(get_db)]):
-    tasks = db.query(TaskModel).all()
+async def list_tasks3(
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    tasks = (await db.execute(paginar(select(TaskModel), TaskModel, cursor, limit))).scalars().all()
+    tasks = recortar_pagina(tasks, limit, response)
     return [TaskOut3.from_orm(t) for t in tasks]
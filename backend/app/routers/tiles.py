@@ -0,0 +1,30 @@
+"""
+Router de teselas vectoriales para el mapa (/api/tiles)
+"""
+from fastapi import APIRouter, Depends, HTTPException, Path, Response  # type: ignore[import]
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
+from typing import Annotated
+
+from app import teselas
+from app.database import get_read_db
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+
+@router.get("/{capa}/{z}/{x}/{y}.mvt", response_class=Response)
+async def obtener_tesela(
+    capa: str,
+    db: Annotated[AsyncSession, Depends(get_read_db)],
+    z: int = Path(..., ge=0, le=teselas.TILES_ZOOM_MAX),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0),
+):
+    """Tesela MVT de ``incidencias``, ``reportes`` o ``rutas`` (vacía si no hay filas)"""
+    if capa not in teselas.CAPAS:
+        raise HTTPException(status_code=404, detail=f"Capa desconocida. Use: {', '.join(teselas.CAPAS)}")
+    if not teselas.disponible(capa):
+        raise HTTPException(status_code=404, detail="Capa no disponible en esta base de datos")
+    if x >= 1 << z or y >= 1 << z:
+        raise HTTPException(status_code=404, detail="Tesela fuera de rango")
+    mvt = await teselas.tesela(db, capa, z, x, y)
+    return Response(content=mvt, media_type=teselas.TIPO_MVT)
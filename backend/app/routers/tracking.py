@@ -2,17 +2,25 @@
 Router para tracking GPS en tiempo real de camiones recolectores
 Usa WebSocket para streaming de posiciones
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import Annotated, List, Dict, Optional
-from datetime import datetime
+from collections import deque
+from fastapi import APIRouter, Depends, Request, WebSocket, WebSocketDisconnect, HTTPException
+from sqlalchemy import func, text
+from typing import List, Dict, Optional
+from datetime import datetime, timezone
 from pydantic import BaseModel
+from os import getenv
+import asyncio
 import json
+import logging
 
-from app.database import get_db
+from app import posiciones, ultimas_posiciones
+from app.database import get_read_db
 
 router = APIRouter(prefix="/tracking", tags=["tracking"])
+logger = logging.getLogger(__name__)
+
+TRACKING_WS_COLA = int(getenv("TRACKING_WS_COLA", "32"))  # mensajes pendientes por conexión
+TRACKING_WS_TIMEOUT = float(getenv("TRACKING_WS_TIMEOUT", "10"))  # s por envío antes de cerrar
 
 
 # ============================================
@@ -29,11 +37,11 @@ class TrackingUpdate(BaseModel):
 
 
 class TrackingResponse(BaseModel):
-    """Respuesta de tracking activo"""
+    """Respuesta de tracking activo (datos de la asignación en None mientras se cargan o si no existe)"""
     ejecucion_id: int
-    conductor_nombre: str
-    camion_placa: str
-    sector: str
+    conductor_nombre: Optional[str]
+    camion_placa: Optional[str]
+    sector: Optional[str]
     lat: float
     lon: float
     velocidad: Optional[float]
@@ -45,34 +53,119 @@ class TrackingResponse(BaseModel):
 # GESTOR DE CONEXIONES WEBSOCKET
 # ============================================
 
+class Suscriptor:
+    """
+    Conexión WebSocket con su cola de salida
+    Las posiciones sueltas (``reemplazable``) no se acumulan: solo se guarda
+    la última sin enviar (latest-wins). El resto de mensajes, incluidos los
+    lotes con ``puntos``, va a una cola de ``TRACKING_WS_COLA`` que descarta
+    el más antiguo al llenarse.
+    """
+
+    def __init__(self, websocket: WebSocket, max_cola: int = TRACKING_WS_COLA):
+        self.websocket = websocket
+        self.cola: deque = deque(maxlen=max_cola)
+        self.posicion: Optional[str] = None
+        self.hay_mensajes = asyncio.Event()
+        self.tarea: Optional[asyncio.Task] = None
+        self.enviados = 0
+        self.descartados = 0
+
+    @property
+    def en_cola(self) -> int:
+        return len(self.cola) + (self.posicion is not None)
+
+    def encolar(self, texto: str, reemplazable: bool = False):
+        if reemplazable:
+            if self.posicion is not None:
+                self.descartados += 1
+            self.posicion = texto
+        else:
+            if len(self.cola) == self.cola.maxlen:
+                self.descartados += 1
+            self.cola.append(texto)
+        self.hay_mensajes.set()
+
+    async def escribir(self):
+        """Enviar lo encolado; falla si un envío tarda más de ``TRACKING_WS_TIMEOUT``"""
+        while True:
+            await self.hay_mensajes.wait()
+            self.hay_mensajes.clear()
+            while self.cola or self.posicion is not None:
+                if self.cola:
+                    texto = self.cola.popleft()
+                else:
+                    texto, self.posicion = self.posicion, None
+                await asyncio.wait_for(self.websocket.send_text(texto), TRACKING_WS_TIMEOUT)
+                self.enviados += 1
+
+
 class ConnectionManager:
-    """Administra conexiones WebSocket activas"""
+    """Administra conexiones WebSocket activas (cada una con su cola y su tarea de envío)"""
     
     def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+        self.active_connections: Dict[int, Dict[WebSocket, Suscriptor]] = {}
     
-    async def connect(self, websocket: WebSocket, ejecucion_id: int):
+    async def connect(self, websocket: WebSocket, ejecucion_id: int) -> Suscriptor:
         """Conectar cliente a una ejecución específica"""
         await websocket.accept()
-        if ejecucion_id not in self.active_connections:
-            self.active_connections[ejecucion_id] = []
-        self.active_connections[ejecucion_id].append(websocket)
+        suscriptor = Suscriptor(websocket)
+        suscriptor.tarea = asyncio.create_task(
+            self._escribir(suscriptor, ejecucion_id), name=f"ws-tracking-{ejecucion_id}"
+        )
+        self.active_connections.setdefault(ejecucion_id, {})[websocket] = suscriptor
+        return suscriptor
+    
+    async def _escribir(self, suscriptor: Suscriptor, ejecucion_id: int):
+        try:
+            await suscriptor.escribir()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Cliente lento o conexión rota: se cierra para no acumular más
+            logger.info("Cerrando WebSocket de tracking %s: %r", ejecucion_id, e)
+            self.disconnect(suscriptor.websocket, ejecucion_id)
+            try:
+                await suscriptor.websocket.close(code=1013)
+            except Exception:
+                pass
     
     def disconnect(self, websocket: WebSocket, ejecucion_id: int):
-        """Desconectar cliente"""
-        if ejecucion_id in self.active_connections:
-            self.active_connections[ejecucion_id].remove(websocket)
-            if not self.active_connections[ejecucion_id]:
-                del self.active_connections[ejecucion_id]
+        """Desconectar cliente (se puede llamar más de una vez)"""
+        conexiones = self.active_connections.get(ejecucion_id)
+        if conexiones is None:
+            return
+        suscriptor = conexiones.pop(websocket, None)
+        if not conexiones:
+            del self.active_connections[ejecucion_id]
+        if suscriptor and suscriptor.tarea and suscriptor.tarea is not asyncio.current_task():
+            suscriptor.tarea.cancel()
     
-    async def broadcast(self, ejecucion_id: int, message: dict):
-        """Enviar mensaje a todos los clientes conectados a una ejecución"""
-        if ejecucion_id in self.active_connections:
-            for connection in self.active_connections[ejecucion_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    pass
+    def broadcast(self, ejecucion_id: int, message: dict, reemplazable: bool = False):
+        """
+        Encolar un mensaje para los clientes de una ejecución, sin esperar a que se envíe
+        ``reemplazable``: una posición suelta que la siguiente puede sustituir si aún no salió
+        """
+        conexiones = self.active_connections.get(ejecucion_id)
+        if not conexiones:
+            return
+        texto = json.dumps(message)
+        for suscriptor in conexiones.values():
+            suscriptor.encolar(texto, reemplazable)
+    
+    def estadisticas(self) -> List[dict]:
+        """Profundidad de cola y contadores de cada conexión"""
+        return [
+            {
+                "ejecucion_id": ejecucion_id,
+                "cliente": f"{websocket.client.host}:{websocket.client.port}" if websocket.client else None,
+                "en_cola": suscriptor.en_cola,
+                "enviados": suscriptor.enviados,
+                "descartados": suscriptor.descartados,
+            }
+            for ejecucion_id, conexiones in self.active_connections.items()
+            for websocket, suscriptor in conexiones.items()
+        ]
 
 manager = ConnectionManager()
 
@@ -82,49 +175,102 @@ manager = ConnectionManager()
 # ============================================
 
 @router.get("/activos", response_model=List[TrackingResponse])
-async def obtener_trackings_activos(db: Annotated[Session, Depends(get_db)]):
+async def obtener_trackings_activos():
     """
     Obtener todas las ejecuciones actualmente en curso con última posición GPS
-    Mock endpoint - en producción conecta con la BD de horarios
+    Se sirve desde memoria (``app.ultimas_posiciones``), sin consultar la base:
+    en curso es haber recibido posiciones en los últimos ``TRACKING_INACTIVO`` s
     """
-    # Por ahora retornar lista vacía
-    # En producción, esto consultaría la tabla de ejecuciones_horario
-    return []
+    return ultimas_posiciones.listar()
 
 
 @router.post("/actualizar")
-async def actualizar_posicion(
-    update: TrackingUpdate,
-    db: Annotated[Session, Depends(get_db)]
-):
+async def actualizar_posicion(update: TrackingUpdate):
     """
     Endpoint REST para actualizar posición GPS (alternativa a WebSocket)
-    Usado por app móvil del conductor
+    Usado por app móvil del conductor. La posición se guarda en segundo
+    plano (``app.posiciones``); responde 503 si hay demasiadas pendientes.
     """
+    # Siempre con zona: asyncpg pasa las fechas naive por astimezone() (hora local del servidor)
+    instante = update.timestamp or datetime.now(timezone.utc)
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    await posiciones.agregar([posiciones.Posicion(
+        update.ejecucion_id, update.lat, update.lon, update.velocidad, instante
+    )])
+    ultimas_posiciones.actualizar(update.ejecucion_id, update.lat, update.lon, update.velocidad, instante)
+
     # Broadcast a clientes conectados vía WebSocket
-    await manager.broadcast(update.ejecucion_id, {
+    manager.broadcast(update.ejecucion_id, {
         "type": "position_update",
         "ejecucion_id": update.ejecucion_id,
         "lat": update.lat,
         "lon": update.lon,
         "velocidad": update.velocidad,
-        "timestamp": (update.timestamp or datetime.utcnow()).isoformat()
-    })
+        "timestamp": instante.isoformat()
+    }, reemplazable=True)
     
     return {"status": "ok", "message": "Posición actualizada"}
 
 
+@router.post("/actualizar/batch")
+async def actualizar_posiciones_lote(request: Request):
+    """
+    Subir de una vez las posiciones acumuladas sin cobertura
+    Cuerpo ``application/octet-stream`` en el formato de
+    ``posiciones.decodificar_lote`` (14 bytes por posición), opcionalmente
+    con ``Content-Encoding: gzip``. Todo el lote se guarda y se emite por
+    WebSocket en un solo mensaje: los campos de la última posición más
+    ``puntos`` con el recorrido completo.
+    """
+    largo = request.headers.get("content-length")
+    if largo and largo.isdigit() and int(largo) > posiciones.tamano_maximo():
+        raise HTTPException(status_code=413, detail=f"El lote supera {posiciones.GPS_LOTE_MAX} posiciones")
+    datos = await posiciones.leer_cuerpo(request.stream())
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        datos = posiciones.descomprimir(datos)
+    lote = posiciones.decodificar_lote(datos)
+    if not lote:
+        return {"status": "ok", "recibidas": 0}
+    await posiciones.agregar(lote)
+    ultimas_posiciones.actualizar(*lote[-1])
+
+    puntos = [
+        {"lat": p.lat, "lon": p.lon, "velocidad": p.velocidad, "timestamp": p.instante.isoformat()}
+        for p in lote
+    ]
+    manager.broadcast(lote[0].ejecucion_id, {
+        "type": "position_update",
+        "ejecucion_id": lote[0].ejecucion_id,
+        **puntos[-1],
+        "puntos": puntos,
+    })
+
+    return {"status": "ok", "recibidas": len(lote)}
+
+
+_SQL_RUTA = text("""
+    SELECT ST_Y(geometry(location)) AS lat, ST_X(geometry(location)) AS lon, speed, reported_at
+    FROM actor_locations
+    WHERE ejecucion_id = :ejecucion_id
+    ORDER BY reported_at, id
+""")
+
+
 @router.get("/ruta/{ejecucion_id}")
-async def obtener_ruta_recorrida(
-    ejecucion_id: int,
-    db: Annotated[Session, Depends(get_db)]
-):
+async def obtener_ruta_recorrida(ejecucion_id: int, db=Depends(get_read_db)):
     """
     Obtener todos los puntos GPS de una ejecución (ruta completa recorrida)
+    Las posiciones recién recibidas aparecen tras la siguiente escritura (``GPS_FLUSH_MS``)
     """
-    # Mock - retornar lista vacía
-    # En producción consultaría puntos_tracking_horario
-    return {"ejecucion_id": ejecucion_id, "puntos": []}
+    filas = (await db.execute(_SQL_RUTA, {"ejecucion_id": ejecucion_id})).all()
+    return {
+        "ejecucion_id": ejecucion_id,
+        "puntos": [
+            {"lat": f.lat, "lon": f.lon, "velocidad": f.speed, "timestamp": f.reported_at.isoformat()}
+            for f in filas
+        ],
+    }
 
 
 # ============================================
@@ -151,18 +297,19 @@ async def websocket_tracking(
         "timestamp": "2026-01-04T10:30:00"
     }
     """
-    await manager.connect(websocket, ejecucion_id)
+    suscriptor = await manager.connect(websocket, ejecucion_id)
     
     try:
         # Mantener conexión abierta y escuchar
         while True:
             data = await websocket.receive_text()
             # Cliente puede enviar "ping" para mantener viva la conexión
+            # (la respuesta va por la cola: solo la tarea de envío escribe en el socket)
             if data == "ping":
-                await websocket.send_text("pong")
+                suscriptor.encolar("pong")
     
     except WebSocketDisconnect:
         manager.disconnect(websocket, ejecucion_id)
-    except Exception as e:
+    except Exception:
         manager.disconnect(websocket, ejecucion_id)
-        print(f"Error WebSocket: {e}")
+        logger.exception("Error en el WebSocket de tracking de la ejecución %s", ejecucion_id)
@@ -0,0 +1,150 @@
+"""
+Registro de consultas lentas con captura de EXPLAIN
+
+Las sentencias que superan ``DB_SLOW_QUERY_MS`` se guardan en un buffer
+circular (las últimas ``DB_SLOW_QUERY_BUFFER``) con sus parámetros
+redactados y la ruta que las lanzó. El plan ``EXPLAIN (ANALYZE off, FORMAT
+JSON)`` se obtiene después, en una tarea de fondo, para no alargar el
+request que ya fue lento.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from os import getenv
+
+from app.database import async_engine, async_read_engine
+
+logger = logging.getLogger(__name__)
+
+DB_SLOW_QUERY_MS = float(getenv("DB_SLOW_QUERY_MS", "500"))
+DB_SLOW_QUERY_BUFFER = int(getenv("DB_SLOW_QUERY_BUFFER", "100"))
+# Un mismo SQL no se vuelve a explicar antes de este tiempo (segundos)
+DB_SLOW_QUERY_PLAN_TTL = float(getenv("DB_SLOW_QUERY_PLAN_TTL", "300"))
+
+_EXPLICABLES = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+_lentas: deque = deque(maxlen=DB_SLOW_QUERY_BUFFER)
+# SQL → (explicado en, plan); LRU con el mismo tope que el buffer
+_planes: OrderedDict[str, tuple[float, object]] = OrderedDict()
+_cola: asyncio.Queue | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _redactar(parametros):
+    """Sustituir los valores por su tipo: el log no debe contener datos"""
+    if isinstance(parametros, dict):
+        return {k: _redactar_valor(v) for k, v in parametros.items()}
+    if isinstance(parametros, (list, tuple)):
+        return [_redactar(p) if isinstance(p, (dict, list, tuple)) else _redactar_valor(p) for p in parametros]
+    return _redactar_valor(parametros)
+
+
+def _redactar_valor(valor):
+    if valor is None:
+        return None
+    return f"<{type(valor).__name__}>"
+
+
+def registrar(motor, sql: str, parametros, duracion: float, ruta: str | None, executemany: bool):
+    """Guardar una sentencia lenta y encolar la captura de su plan"""
+    if sql.lstrip()[:7].upper() == "EXPLAIN":
+        return
+    entrada = {
+        "momento": datetime.utcnow().isoformat(),
+        "duracion_ms": round(duracion * 1000, 2),
+        "ruta": ruta,
+        "sql": sql,
+        "parametros": (
+            {"filas": len(parametros), "primera": _redactar(parametros[0])}
+            if executemany and parametros else _redactar(parametros)
+        ),
+        "plan": None,
+    }
+    _lentas.append(entrada)
+    logger.warning(
+        "Consulta lenta (%.1f ms) en %s: %s %s",
+        entrada["duracion_ms"], ruta or "-", " ".join(sql.split())[:500], entrada["parametros"],
+    )
+
+    if not sql.lstrip().upper().startswith(_EXPLICABLES):
+        return
+    cacheado = _planes.get(sql)
+    if cacheado and time.monotonic() - cacheado[0] < DB_SLOW_QUERY_PLAN_TTL:
+        try:
+            _planes.move_to_end(sql)
+        except KeyError:
+            pass  # desalojado desde otro hilo
+        entrada["plan"] = cacheado[1]
+        return
+    if _cola is None or _loop is None:
+        return
+    # Para executemany basta con el plan del primer juego de parámetros
+    if executemany and parametros:
+        parametros = parametros[0]
+    # Los hooks pueden correr en otro hilo (engine síncrono)
+    try:
+        _loop.call_soon_threadsafe(_encolar, (motor, sql, parametros, entrada))
+    except RuntimeError:
+        pass  # loop cerrado durante la parada
+
+
+def _encolar(item):
+    try:
+        _cola.put_nowait(item)
+    except asyncio.QueueFull:
+        pass
+
+
+def _motor_async(motor):
+    for candidato in (async_engine, async_read_engine):
+        if candidato is not None and candidato.sync_engine is motor:
+            return candidato
+    return None
+
+
+async def _explicar(motor, sql: str, parametros):
+    consulta = "EXPLAIN (ANALYZE off, FORMAT JSON) " + sql
+    motor_async = _motor_async(motor)
+    if motor_async is not None:
+        async with motor_async.connect() as conn:
+            return (await conn.exec_driver_sql(consulta, parametros)).scalar()
+
+    def _explicar_sync():
+        with motor.connect() as conn:
+            return conn.exec_driver_sql(consulta, parametros).scalar()
+
+    return await asyncio.to_thread(_explicar_sync)
+
+
+async def _ciclo_explicador():
+    while True:
+        motor, sql, parametros, entrada = await _cola.get()
+        try:
+            plan = await _explicar(motor, sql, parametros)
+            _planes[sql] = (time.monotonic(), plan)
+            _planes.move_to_end(sql)
+            while len(_planes) > DB_SLOW_QUERY_BUFFER:
+                _planes.popitem(last=False)
+            entrada["plan"] = plan
+        except Exception as e:
+            entrada["plan"] = {"error": str(e)}
+
+
+def iniciar_explicador() -> asyncio.Task:
+    """Lanzar la tarea que captura los planes (llamar en el arranque)"""
+    global _cola, _loop
+    _loop = asyncio.get_running_loop()
+    _cola = asyncio.Queue(maxsize=DB_SLOW_QUERY_BUFFER)
+    return asyncio.create_task(_ciclo_explicador(), name="explain-consultas-lentas")
+
+
+def consultas_lentas() -> list[dict]:
+    """Últimas consultas lentas, de la más reciente a la más antigua"""
+    return list(reversed(_lentas))
+
+
+def limpiar():
+    _lentas.clear()
+    _planes.clear()
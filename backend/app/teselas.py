@@ -0,0 +1,198 @@
+"""
+Teselas vectoriales (Mapbox Vector Tile) generadas por PostGIS
+
+Cada capa es una consulta ``ST_AsMVT`` que filtra por el recuadro de la
+tesela en ``geometry`` 4326 con una expresión indexada (GiST de la
+migración 024; para ``routes.geometry`` la 018), así que la base solo lee
+las filas de la tesela y devuelve el binario ya codificado: el backend no
+construye ni serializa objetos. No se filtra en ``geography`` como
+``app.geo``: ahí los lados del recuadro son geodésicas y, en las teselas
+de zoom bajo (más de un hemisferio), el recuadro deja de ser el de la
+tesela.
+
+Las teselas generadas se guardan en una caché LRU por proceso. Al escribir
+una fila, ``invalidar`` descarta solo las teselas cuyo recuadro (con el
+margen de ``TILES_BUFFER``) contiene el punto; las escrituras de otros
+workers o hechas fuera de la API caducan a los ``TILES_TTL`` segundos.
+"""
+import logging
+import time
+from collections import OrderedDict
+from math import atan, degrees, pi, sinh
+from os import getenv
+
+from sqlalchemy import text  # type: ignore[import]
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
+
+from app.database import async_engine
+
+logger = logging.getLogger(__name__)
+
+TILES_CACHE = int(getenv("TILES_CACHE", "2048"))
+TILES_TTL = float(getenv("TILES_TTL", "60"))
+TILES_ZOOM_MAX = 22
+TILES_EXTENT = 4096
+TILES_BUFFER = 64  # en unidades de la tesela (de TILES_EXTENT)
+
+TIPO_MVT = "application/vnd.mapbox-vector-tile"
+
+# Recuadro de ``ST_TileEnvelope`` pasado a 4326 (más el margen), calculado en ``limites``
+_ENVOLTURA = "ST_MakeEnvelope(:min_lon, :min_lat, :max_lon, :max_lat, 4326)"
+_PUNTO = "ST_SetSRID(ST_MakePoint(lon, lat), 4326)"
+_MVT_GEOM = f"ST_AsMVTGeom({{geom}}, ST_TileEnvelope(:z, :x, :y), {TILES_EXTENT}, {TILES_BUFFER}, true)"
+
+_SQL_CAPAS = {
+    "incidencias": text(f"""
+        WITH filas AS (
+            SELECT {_MVT_GEOM.format(geom=f"ST_Transform({_PUNTO}, 3857)")} AS geom,
+                   id, tipo, gravedad, estado, zona
+            FROM incidencias
+            WHERE {_PUNTO} && {_ENVOLTURA}
+        )
+        SELECT ST_AsMVT(filas, 'incidencias', {TILES_EXTENT}, 'geom') FROM filas
+    """),
+    "reportes": text(f"""
+        WITH filas AS (
+            SELECT {_MVT_GEOM.format(geom=f"ST_Transform({_PUNTO}, 3857)")} AS geom,
+                   id::text AS id, type, status, priority_score
+            FROM reports
+            WHERE {_PUNTO} && {_ENVOLTURA} AND duplicate_of IS NULL
+        )
+        SELECT ST_AsMVT(filas, 'reportes', {TILES_EXTENT}, 'geom') FROM filas
+    """),
+    # Geometrías de rutas optimizadas (tabla routes de database/init.sql)
+    "rutas": text(f"""
+        WITH filas AS (
+            SELECT {_MVT_GEOM.format(geom="ST_Transform(geometry, 3857)")} AS geom,
+                   id::text AS id, total_distance_m, total_duration_s
+            FROM routes
+            WHERE geometry && {_ENVOLTURA}
+        )
+        SELECT ST_AsMVT(filas, 'rutas', {TILES_EXTENT}, 'geom') FROM filas
+    """),
+}
+
+CAPAS = tuple(_SQL_CAPAS)
+
+_SQL_DISPONIBLES = text("""
+SELECT EXISTS (SELECT 1 FROM pg_proc WHERE proname = 'st_tileenvelope'),
+       to_regclass('routes') IS NOT NULL
+""")
+
+# Capas que se pueden servir; se comprueba al arrancar
+_disponibles: frozenset[str] = frozenset()
+
+
+def _lon(x: float, n: int) -> float:
+    return x / n * 360.0 - 180.0
+
+
+def _lat(y: float, n: int) -> float:
+    return degrees(atan(sinh(pi * (1 - 2 * y / n))))
+
+
+def limites(z: int, x: int, y: int, margen: float = 0.0) -> tuple[float, float, float, float]:
+    """``(min_lat, min_lon, max_lat, max_lon)`` de la tesela, ampliada en ``margen`` teselas"""
+    n = 1 << z
+    return (
+        max(-90.0, _lat(y + 1 + margen, n)),
+        max(-180.0, _lon(x - margen, n)),
+        min(90.0, _lat(y - margen, n)),
+        min(180.0, _lon(x + 1 + margen, n)),
+    )
+
+
+class CacheTeselas:
+    """LRU ``(capa, z, x, y)`` → ``(generada_en, mvt)`` con invalidación por recuadro"""
+
+    def __init__(self, maximo: int = TILES_CACHE, ttl: float = TILES_TTL):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._teselas: OrderedDict[tuple, tuple[float, bytes]] = OrderedDict()
+
+    def obtener(self, clave: tuple) -> bytes | None:
+        entrada = self._teselas.get(clave)
+        if entrada is None:
+            return None
+        if time.monotonic() - entrada[0] > self.ttl:
+            del self._teselas[clave]
+            return None
+        self._teselas.move_to_end(clave)
+        return entrada[1]
+
+    def guardar(self, clave: tuple, mvt: bytes):
+        self._teselas[clave] = (time.monotonic(), mvt)
+        self._teselas.move_to_end(clave)
+        while len(self._teselas) > self.maximo:
+            self._teselas.popitem(last=False)
+
+    def invalidar(self, capa: str, recuadro: tuple[float, float, float, float] | None = None) -> int:
+        """Descartar las teselas de ``capa`` que tocan ``recuadro`` (todas si es ``None``)"""
+        margen = TILES_BUFFER / TILES_EXTENT
+        descartar = []
+        for clave in self._teselas:
+            if clave[0] != capa:
+                continue
+            if recuadro is not None:
+                min_lat, min_lon, max_lat, max_lon = limites(*clave[1:], margen=margen)
+                if (recuadro[2] < min_lat or recuadro[0] > max_lat
+                        or recuadro[3] < min_lon or recuadro[1] > max_lon):
+                    continue
+            descartar.append(clave)
+        for clave in descartar:
+            del self._teselas[clave]
+        return len(descartar)
+
+    def __len__(self) -> int:
+        return len(self._teselas)
+
+
+cache = CacheTeselas()
+
+
+def invalidar_punto(capa: str, lat: float | None, lon: float | None):
+    """Descartar las teselas de ``capa`` que muestran el punto (llamar tras el commit)"""
+    if lat is None or lon is None:
+        return
+    cache.invalidar(capa, (lat, lon, lat, lon))
+
+
+def invalidar_capa(capa: str):
+    cache.invalidar(capa)
+
+
+def disponible(capa: str) -> bool:
+    return capa in _disponibles
+
+
+async def comprobar_disponibles(motor=async_engine) -> frozenset[str]:
+    """Activar las capas cuyas funciones y tablas existen (llamar en el arranque)"""
+    global _disponibles
+    try:
+        async with motor.connect() as conn:
+            con_postgis, con_routes = (await conn.execute(_SQL_DISPONIBLES)).one()
+    except Exception as e:
+        logger.warning("Teselas vectoriales desactivadas: %s", e)
+        con_postgis = con_routes = False
+    if not con_postgis:
+        logger.warning("Teselas vectoriales desactivadas: PostGIS >= 3 no disponible")
+        _disponibles = frozenset()
+    else:
+        _disponibles = frozenset(c for c in CAPAS if c != "rutas" or con_routes)
+    return _disponibles
+
+
+async def tesela(db: AsyncSession, capa: str, z: int, x: int, y: int) -> bytes:
+    """Tesela MVT de ``capa`` (de la caché si está vigente)"""
+    clave = (capa, z, x, y)
+    mvt = cache.obtener(clave)
+    if mvt is not None:
+        return mvt
+    min_lat, min_lon, max_lat, max_lon = limites(z, x, y, margen=TILES_BUFFER / TILES_EXTENT)
+    mvt = await db.scalar(_SQL_CAPAS[capa], {
+        "z": z, "x": x, "y": y,
+        "min_lat": min_lat, "min_lon": min_lon, "max_lat": max_lat, "max_lon": max_lon,
+    })
+    mvt = bytes(mvt or b"")
+    cache.guardar(clave, mvt)
+    return mvt
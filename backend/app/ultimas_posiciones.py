@@ -0,0 +1,124 @@
+"""
+Última posición conocida de cada ejecución en curso, en memoria
+
+Cada posición que llega por ``/tracking/actualizar`` (o su variante por
+lotes) actualiza en O(1) la entrada de su ``ejecucion_id``. Los datos que
+no cambian durante el recorrido (conductor, placa, sector y estado de la
+asignación) se consultan una sola vez, en segundo plano, cuando aparece una
+ejecución nueva. ``/tracking/activos`` se sirve así sin tocar la base.
+
+Una ejecución deja de listarse (y sale del registro) si pasan
+``TRACKING_INACTIVO`` segundos sin recibir posiciones. El registro es por
+proceso: con varios workers cada uno conoce las ejecuciones cuyas
+posiciones recibió.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from os import getenv
+
+from sqlalchemy import select  # type: ignore[import]
+
+from app.database import async_engine
+from app.models import Asignacion, Conductor, Ruta, Vehiculo
+
+logger = logging.getLogger(__name__)
+
+TRACKING_INACTIVO = float(getenv("TRACKING_INACTIVO", "300"))
+_REINTENTO_DATOS = 30.0  # s entre intentos de cargar los datos de la asignación si la base falla
+
+
+class Activo:
+    """Última posición de una ejecución y los datos de su asignación"""
+
+    __slots__ = (
+        "ejecucion_id", "lat", "lon", "velocidad", "instante", "recibido",
+        "conductor_nombre", "camion_placa", "sector", "estado", "datos_cargados", "datos_intento",
+    )
+
+    def __init__(self, ejecucion_id: int):
+        self.ejecucion_id = ejecucion_id
+        self.lat = self.lon = self.velocidad = self.instante = None
+        self.recibido = 0.0  # time.monotonic() de la última posición recibida
+        self.conductor_nombre = self.camion_placa = self.sector = None
+        self.estado = "en_curso"
+        self.datos_cargados = False
+        self.datos_intento = float("-inf")
+
+    def como_dict(self) -> dict:
+        return {
+            "ejecucion_id": self.ejecucion_id,
+            "conductor_nombre": self.conductor_nombre,
+            "camion_placa": self.camion_placa,
+            "sector": self.sector,
+            "lat": self.lat,
+            "lon": self.lon,
+            "velocidad": self.velocidad,
+            "timestamp": self.instante,
+            "estado": self.estado,
+        }
+
+
+_activos: dict[int, Activo] = {}
+_cargando: set[int] = set()
+_tareas: set[asyncio.Task] = set()
+
+
+def _datos_asignacion(ejecucion_id: int):
+    return (
+        select(Conductor.nombre_completo, Vehiculo.placa, Ruta.nombre, Asignacion.estado)
+        .select_from(Asignacion)
+        .join(Conductor, Asignacion.conductor_id == Conductor.id)
+        .join(Vehiculo, Asignacion.vehiculo_id == Vehiculo.id)
+        .join(Ruta, Asignacion.ruta_id == Ruta.id)
+        .where(Asignacion.id == ejecucion_id)
+    )
+
+
+async def _cargar_datos(ejecucion_id: int, motor):
+    try:
+        async with motor.connect() as conn:
+            fila = (await conn.execute(_datos_asignacion(ejecucion_id))).first()
+    except Exception as e:
+        # Se reintenta con una posición posterior, pasado _REINTENTO_DATOS
+        logger.warning("No se pudieron cargar los datos de la ejecución %s: %s", ejecucion_id, e)
+        return
+    finally:
+        _cargando.discard(ejecucion_id)
+    activo = _activos.get(ejecucion_id)
+    if activo is None:
+        return
+    if fila is not None:
+        activo.conductor_nombre, activo.camion_placa, activo.sector, estado = fila
+        activo.estado = estado or activo.estado
+    activo.datos_cargados = True
+
+
+def actualizar(ejecucion_id: int, lat: float, lon: float, velocidad: float | None, instante: datetime,
+               motor=async_engine):
+    """Registrar una posición (la más reciente de un lote basta); ignora las anteriores a la guardada"""
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    activo = _activos.get(ejecucion_id)
+    if activo is None:
+        activo = _activos[ejecucion_id] = Activo(ejecucion_id)
+    ahora = activo.recibido = time.monotonic()
+    if activo.instante is None or instante >= activo.instante:
+        activo.lat, activo.lon, activo.velocidad, activo.instante = lat, lon, velocidad, instante
+    if (not activo.datos_cargados and ejecucion_id not in _cargando
+            and ahora - activo.datos_intento >= _REINTENTO_DATOS):
+        activo.datos_intento = ahora
+        _cargando.add(ejecucion_id)
+        tarea = asyncio.create_task(_cargar_datos(ejecucion_id, motor))
+        _tareas.add(tarea)
+        tarea.add_done_callback(_tareas.discard)
+
+
+def listar() -> list[dict]:
+    """Ejecuciones con posiciones recientes; las inactivas salen del registro"""
+    limite = time.monotonic() - TRACKING_INACTIVO
+    inactivas = [e for e, activo in _activos.items() if activo.recibido < limite]
+    for ejecucion_id in inactivas:
+        del _activos[ejecucion_id]
+    return [activo.como_dict() for activo in _activos.values()]
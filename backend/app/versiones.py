@@ -0,0 +1,76 @@
+"""
+Versiones por tabla para invalidar cachés
+
+Un contador por tabla que sube con cada INSERT/UPDATE/DELETE ejecutado por
+este proceso (hooks de SQLAlchemy sobre los engines) y otra vez al hacer
+commit, para que una lectura que se cruzó con la transacción no quede en
+caché con la versión nueva. Las escrituras de otros workers no se ven:
+por eso las cachés que lo usan llevan además un TTL corto.
+"""
+import time
+from collections import defaultdict
+
+from sqlalchemy import event  # type: ignore[import]
+
+from app.database import async_engine, async_read_engine, engine
+
+_versiones: dict[str, int] = defaultdict(int)
+
+
+def version(tabla: str) -> int:
+    return _versiones[tabla]
+
+
+def incrementar(tabla: str):
+    _versiones[tabla] += 1
+
+
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    if context is None or not (context.isinsert or context.isupdate or context.isdelete):
+        return
+    tabla = getattr(getattr(context.compiled, "statement", None), "table", None)
+    nombre = getattr(tabla, "name", None)
+    if nombre is None:
+        return
+    incrementar(nombre)
+    conn.info.setdefault("tablas_modificadas", set()).add(nombre)
+
+
+def _al_cerrar_transaccion(conn):
+    for nombre in conn.info.pop("tablas_modificadas", ()):
+        incrementar(nombre)
+
+
+for _motor in (engine, async_engine, async_read_engine):
+    if _motor is not None:
+        _sync = getattr(_motor, "sync_engine", _motor)
+        event.listen(_sync, "after_cursor_execute", _despues_de_ejecutar)
+        event.listen(_sync, "commit", _al_cerrar_transaccion)
+        event.listen(_sync, "rollback", _al_cerrar_transaccion)
+
+
+class CacheVersionada:
+    """
+    Caché en memoria con TTL que se invalida al cambiar la versión de una tabla.
+
+    Leer la versión *antes* de la consulta y guardarla con el resultado:
+    si hubo una escritura mientras tanto, la entrada nace ya invalidada.
+    """
+
+    def __init__(self, tabla: str, ttl: float):
+        self.tabla = tabla
+        self.ttl = ttl
+        self._entradas: dict = {}
+
+    def obtener(self, clave):
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        version_guardada, expira, valor = entrada
+        if version_guardada != version(self.tabla) or expira < time.monotonic():
+            self._entradas.pop(clave, None)
+            return None
+        return valor
+
+    def guardar(self, clave, valor, version_leida: int):
+        self._entradas[clave] = (version_leida, time.monotonic() + self.ttl, valor)
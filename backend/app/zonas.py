@@ -0,0 +1,177 @@
+"""
+Asignación de zona a partir de coordenadas
+
+Los polígonos activos de ``cleaning_zones`` se cargan en memoria al
+arrancar y se indexan en una rejilla de celdas de ``ZONAS_CELDA`` grados:
+cada celda guarda las zonas cuyo recuadro la toca, así que una consulta
+solo prueba punto-en-polígono (ray casting) contra los uno o dos
+candidatos de su celda. El resultado se cachea por coordenada redondeada
+a ``ZONAS_PRECISION`` decimales (4 ≈ 11 m).
+
+Si la tabla no existe o no tiene polígonos, ``zona_de`` devuelve ``None``
+y los routers conservan la zona que envía el cliente.
+"""
+import json
+import logging
+from collections import defaultdict
+from functools import lru_cache
+from math import floor
+from os import getenv
+
+from sqlalchemy import select, text, update  # type: ignore[import]
+
+from app.database import AsyncSessionLocal, async_engine
+from app.models import Incidencia
+
+logger = logging.getLogger(__name__)
+
+ZONAS_CELDA = float(getenv("ZONAS_CELDA", "0.01"))
+ZONAS_PRECISION = int(getenv("ZONAS_PRECISION", "4"))
+ZONAS_CACHE = int(getenv("ZONAS_CACHE", "100000"))
+
+# Con prioridades iguales gana la primera en orden alfabético
+_SQL_ZONAS = text("""
+SELECT zone_name, ST_AsGeoJSON(zone_polygon)
+FROM cleaning_zones
+WHERE zone_polygon IS NOT NULL AND COALESCE(status, 'active') = 'active'
+ORDER BY priority DESC, zone_name
+""")
+
+_LARGO_ZONA = Incidencia.__table__.c.zona.type.length
+
+
+def _dentro_de_anillo(x: float, y: float, anillo) -> bool:
+    dentro = False
+    xj, yj = anillo[-1][0], anillo[-1][1]
+    for punto in anillo:
+        xi, yi = punto[0], punto[1]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            dentro = not dentro
+        xj, yj = xi, yi
+    return dentro
+
+
+class Zona:
+    """Zona con sus polígonos GeoJSON (lista de anillos: exterior y huecos)"""
+
+    __slots__ = ("nombre", "poligonos", "recuadro")
+
+    def __init__(self, nombre: str, poligonos: list):
+        self.nombre = nombre
+        self.poligonos = poligonos
+        xs = [p[0] for anillos in poligonos for p in anillos[0]]
+        ys = [p[1] for anillos in poligonos for p in anillos[0]]
+        self.recuadro = (min(xs), min(ys), max(xs), max(ys))
+
+    @classmethod
+    def desde_geojson(cls, nombre: str, geojson: str) -> "Zona":
+        geometria = json.loads(geojson)
+        if geometria["type"] == "Polygon":
+            return cls(nombre, [geometria["coordinates"]])
+        if geometria["type"] == "MultiPolygon":
+            return cls(nombre, geometria["coordinates"])
+        raise ValueError(f"geometría no soportada: {geometria['type']}")
+
+    def contiene(self, lon: float, lat: float) -> bool:
+        x0, y0, x1, y1 = self.recuadro
+        if not (x0 <= lon <= x1 and y0 <= lat <= y1):
+            return False
+        return any(
+            _dentro_de_anillo(lon, lat, anillos[0])
+            and not any(_dentro_de_anillo(lon, lat, hueco) for hueco in anillos[1:])
+            for anillos in self.poligonos
+        )
+
+
+class IndiceZonas:
+    """Rejilla de celdas → zonas candidatas, con caché LRU por coordenada redondeada"""
+
+    def __init__(self, zonas: list[Zona], celda: float = ZONAS_CELDA):
+        self.zonas = zonas
+        self.celda = celda
+        celdas = defaultdict(list)
+        for zona in zonas:
+            x0, y0, x1, y1 = zona.recuadro
+            for cx in range(floor(x0 / celda), floor(x1 / celda) + 1):
+                for cy in range(floor(y0 / celda), floor(y1 / celda) + 1):
+                    celdas[(cx, cy)].append(zona)
+        self._celdas = dict(celdas)
+        self._buscar = lru_cache(maxsize=ZONAS_CACHE)(self._buscar_sin_cache)
+
+    def _buscar_sin_cache(self, lat: float, lon: float) -> str | None:
+        for zona in self._celdas.get((floor(lon / self.celda), floor(lat / self.celda)), ()):
+            if zona.contiene(lon, lat):
+                return zona.nombre
+        return None
+
+    def zona_de(self, lat: float, lon: float) -> str | None:
+        if not self.zonas:
+            return None
+        return self._buscar(round(lat, ZONAS_PRECISION), round(lon, ZONAS_PRECISION))
+
+
+_indice = IndiceZonas([])
+
+
+def zona_de(lat: float | None, lon: float | None) -> str | None:
+    """Nombre de la zona que contiene el punto, o ``None`` si no cae en ninguna"""
+    if lat is None or lon is None:
+        return None
+    return _indice.zona_de(lat, lon)
+
+
+async def cargar_zonas(motor=async_engine) -> int:
+    """(Re)cargar los polígonos de ``cleaning_zones``; devuelve cuántas zonas hay"""
+    global _indice
+    try:
+        async with motor.connect() as conn:
+            filas = (await conn.execute(_SQL_ZONAS)).all()
+    except Exception as e:
+        logger.warning("No se pudieron cargar las zonas (se usará la zona del cliente): %s", e)
+        return len(_indice.zonas)
+
+    zonas = []
+    for nombre, geojson in filas:
+        if _LARGO_ZONA and len(nombre) > _LARGO_ZONA:
+            logger.warning("Zona %r ignorada: incidencias.zona admite %d caracteres", nombre, _LARGO_ZONA)
+            continue
+        try:
+            zonas.append(Zona.desde_geojson(nombre, geojson))
+        except (ValueError, KeyError, IndexError) as e:
+            logger.warning("Zona %r ignorada: %s", nombre, e)
+    _indice = IndiceZonas(zonas)
+    return len(zonas)
+
+
+async def reclasificar_incidencias(lote: int = 1000) -> dict:
+    """
+    Recalcular la zona de las incidencias existentes.
+
+    Recorre la tabla por bloques de ``id`` y actualiza (un ``UPDATE`` por
+    lotes por bloque) solo las filas cuya zona calculada cambia. Las que no
+    caen en ninguna zona conservan la que tenían.
+    """
+    resumen = {"revisadas": 0, "actualizadas": 0}
+    ultimo_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            filas = (await db.execute(
+                select(Incidencia.id, Incidencia.lat, Incidencia.lon, Incidencia.zona)
+                .where(Incidencia.id > ultimo_id)
+                .order_by(Incidencia.id)
+                .limit(lote)
+            )).all()
+            if not filas:
+                break
+            cambios = []
+            for id_, lat, lon, zona in filas:
+                nueva = zona_de(lat, lon)
+                if nueva is not None and nueva != zona:
+                    cambios.append({"id": id_, "zona": nueva})
+            if cambios:
+                await db.execute(update(Incidencia), cambios)
+            await db.commit()
+            resumen["revisadas"] += len(filas)
+            resumen["actualizadas"] += len(cambios)
+            ultimo_id = filas[-1][0]
+    return resumen
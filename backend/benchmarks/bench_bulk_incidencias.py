@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Benchmark de alta masiva de incidencias: una a una frente a ``/bulk``.
+
+Para cada tamaño de lote crea N incidencias de dos formas contra la API:
+
+- ``individual``: N peticiones ``POST /api/incidencias/`` secuenciales (lo
+  que hacen hoy los scripts de carga)
+- ``bulk``: ``POST /api/incidencias/bulk`` en peticiones de ``--lote`` filas
+
+Las filas creadas se marcan con ``zona=--zona`` para poder borrarlas
+después; el script no las elimina.
+
+Uso:
+    python benchmarks/bench_bulk_incidencias.py --url http://localhost:8000 \\
+        --tamanos 100 1000 10000
+"""
+import argparse
+import time
+
+import httpx
+
+
+def _incidencia(i: int, zona: str) -> dict:
+    return {
+        "tipo": "basura",
+        "gravedad": 1 + i % 5,
+        "descripcion": f"bench {i}",
+        "lat": -0.93 + (i % 1000) * 1e-5,
+        "lon": -78.61 + (i // 1000) * 1e-5,
+        "zona": zona,
+    }
+
+
+def individual(client: httpx.Client, filas: list[dict]) -> float:
+    inicio = time.perf_counter()
+    for fila in filas:
+        client.post("/api/incidencias/", json=fila).raise_for_status()
+    return time.perf_counter() - inicio
+
+
+def bulk(client: httpx.Client, filas: list[dict], lote: int) -> float:
+    inicio = time.perf_counter()
+    for i in range(0, len(filas), lote):
+        resp = client.post("/api/incidencias/bulk", json=filas[i:i + lote])
+        resp.raise_for_status()
+        assert not resp.json()["errores"], resp.json()["errores"][:3]
+    return time.perf_counter() - inicio
+
+
+def main(args):
+    with httpx.Client(base_url=args.url, timeout=300) as client:
+        print(f"{'filas':>7} {'individual':>12} {'bulk':>10} {'filas/s bulk':>14} {'x':>7}")
+        for n in args.tamanos:
+            filas = [_incidencia(i, args.zona) for i in range(n)]
+            t_bulk = bulk(client, filas, args.lote)
+            if n <= args.max_individual:
+                t_ind = individual(client, filas)
+                texto_ind, factor = f"{t_ind:.2f} s", f"{t_ind / t_bulk:.1f}"
+            else:
+                texto_ind, factor = "-", "-"
+            print(f"{n:>7} {texto_ind:>12} {t_bulk:>8.2f} s {n / t_bulk:>14.0f} {factor:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--lote", type=int, default=10000, help="filas por petición a /bulk")
+    parser.add_argument("--zona", default="bench")
+    parser.add_argument("--max-individual", type=int, default=10000,
+                        help="no medir la vía individual por encima de este tamaño")
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Benchmark de throughput con peticiones concurrentes contra la API.
+
+Sirve para comparar el backend antes y después de migrar los routers a
+``AsyncSession``: se ejecuta contra el commit anterior y contra el actual
+apuntando a la misma base de datos y se comparan req/s y latencias.
+
+Uso:
+    python benchmarks/bench_concurrencia.py --url http://localhost:8000 \\
+        --path /api/incidencias/ --path /api/conductores/ \\
+        --concurrencia 50 --peticiones 2000
+
+Con ``--ws`` se mantiene además un WebSocket de tracking abierto y se mide
+la latencia de ping/pong mientras dura la carga: con sesiones síncronas el
+event loop se bloquea en cada consulta y esa latencia se dispara.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _worker(client, paths, cola, latencias, errores):
+    while True:
+        try:
+            i = cola.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        path = paths[i % len(paths)]
+        inicio = time.perf_counter()
+        try:
+            resp = await client.get(path)
+            if resp.status_code >= 500:
+                errores.append(resp.status_code)
+        except httpx.HTTPError as e:
+            errores.append(type(e).__name__)
+        latencias.append(time.perf_counter() - inicio)
+
+
+async def _ping_ws(url, ejecucion_id, detener, latencias):
+    import websockets  # opcional, solo con --ws
+
+    ws_url = url.replace("http", "ws", 1) + f"/api/tracking/ws/{ejecucion_id}"
+    async with websockets.connect(ws_url) as ws:
+        while not detener.is_set():
+            inicio = time.perf_counter()
+            await ws.send("ping")
+            await ws.recv()
+            latencias.append(time.perf_counter() - inicio)
+            await asyncio.sleep(0.05)
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+async def main(args):
+    cola = asyncio.Queue()
+    for i in range(args.peticiones):
+        cola.put_nowait(i)
+
+    latencias, errores, latencias_ws = [], [], []
+    detener = asyncio.Event()
+    limites = httpx.Limits(max_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=30) as client:
+        tarea_ws = None
+        if args.ws:
+            tarea_ws = asyncio.create_task(_ping_ws(args.url, 1, detener, latencias_ws))
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*[
+            _worker(client, args.path, cola, latencias, errores)
+            for _ in range(args.concurrencia)
+        ])
+        duracion = time.perf_counter() - inicio
+
+        detener.set()
+        if tarea_ws:
+            await tarea_ws
+
+    print(f"Peticiones:   {args.peticiones} (concurrencia {args.concurrencia})")
+    print(f"Duración:     {duracion:.2f} s")
+    print(f"Throughput:   {args.peticiones / duracion:.1f} req/s")
+    print(f"Latencia p50: {_percentil(latencias, 50) * 1000:.1f} ms")
+    print(f"Latencia p95: {_percentil(latencias, 95) * 1000:.1f} ms")
+    print(f"Latencia p99: {_percentil(latencias, 99) * 1000:.1f} ms")
+    print(f"Errores:      {len(errores)}")
+    if latencias_ws:
+        print(f"WS ping p50:  {statistics.median(latencias_ws) * 1000:.1f} ms")
+        print(f"WS ping max:  {max(latencias_ws) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", action="append", default=None)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--ws", action="store_true", help="medir ping/pong de WebSocket durante la carga")
+    args = parser.parse_args()
+    args.path = args.path or ["/api/incidencias/", "/api/reportes/", "/api/conductores/"]
+    asyncio.run(main(args))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Benchmark de la exportación en streaming de incidencias.
+
+Pide ``GET /api/incidencias/export`` contra la API y mide el tiempo hasta el
+primer byte, el tiempo total y el volumen descargado. Con ``--pid`` (el del
+worker de uvicorn, en la misma máquina) muestrea además su RSS durante la
+descarga, para comprobar que la memoria no crece con el tamaño de la tabla.
+
+Con ``--crear N`` primero da de alta N incidencias con ``zona=--zona`` por
+``/bulk``; la exportación se filtra por esa zona. El script no las elimina.
+
+Uso:
+    python benchmarks/bench_exportacion.py --url http://localhost:8000 \\
+        --crear 50000 --pid $(pgrep -f "uvicorn app.main") --formato ndjson csv
+"""
+import argparse
+import threading
+import time
+
+import httpx
+
+
+def _incidencia(i: int, zona: str) -> dict:
+    return {
+        "tipo": "basura",
+        "gravedad": 1 + i % 5,
+        "descripcion": f"bench export {i} " + "x" * (i % 200),
+        "lat": -0.93 + (i % 1000) * 1e-5,
+        "lon": -78.61 + (i // 1000) * 1e-5,
+        "zona": zona,
+    }
+
+
+def crear(client: httpx.Client, n: int, zona: str, lote: int = 10000):
+    for i in range(0, n, lote):
+        filas = [_incidencia(j, zona) for j in range(i, min(n, i + lote))]
+        client.post("/api/incidencias/bulk", json=filas).raise_for_status()
+
+
+def _rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1])
+    return 0
+
+
+class MuestreoRSS(threading.Thread):
+    """Máximo del RSS de ``pid`` mientras dura la descarga"""
+
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.inicial = _rss_kb(pid)
+        self.maximo = self.inicial
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(0.01):
+            self.maximo = max(self.maximo, _rss_kb(self.pid))
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+def exportar(client: httpx.Client, formato: str, zona: str, pid: int | None) -> dict:
+    muestreo = MuestreoRSS(pid) if pid else None
+    if muestreo:
+        muestreo.start()
+    inicio = time.perf_counter()
+    primer_byte = None
+    total = 0
+    with client.stream("GET", "/api/incidencias/export", params={"formato": formato, "zona": zona}) as resp:
+        resp.raise_for_status()
+        for bloque in resp.iter_raw():
+            if primer_byte is None:
+                primer_byte = time.perf_counter() - inicio
+            total += len(bloque)
+    duracion = time.perf_counter() - inicio
+    resultado = {"ttfb_ms": (primer_byte or duracion) * 1000, "total_s": duracion, "mb": total / 1e6}
+    if muestreo:
+        muestreo.parar()
+        resultado["rss_mb"] = (muestreo.maximo - muestreo.inicial) / 1024
+    return resultado
+
+
+def main(args):
+    with httpx.Client(base_url=args.url, timeout=600) as client:
+        if args.crear:
+            crear(client, args.crear, args.zona)
+        print(f"{'formato':>8} {'TTFB':>9} {'total':>8} {'MB':>7} {'RSS +MB':>8}")
+        for formato in args.formato:
+            r = exportar(client, formato, args.zona, args.pid)
+            rss = f"{r['rss_mb']:.1f}" if "rss_mb" in r else "-"
+            print(f"{formato:>8} {r['ttfb_ms']:>6.1f} ms {r['total_s']:>6.2f} s {r['mb']:>7.1f} {rss:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--crear", type=int, default=0, help="incidencias a crear antes de exportar")
+    parser.add_argument("--zona", default="bench")
+    parser.add_argument("--formato", nargs="+", default=["ndjson"], choices=["ndjson", "csv"])
+    parser.add_argument("--pid", type=int, help="PID del worker para muestrear su RSS (Linux)")
+    main(parser.parse_args())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Microbenchmark del coste en CPU (Python) de una lectura por clave primaria.
+
+Compara tres formas de leer una fila por id sobre SQLite en memoria, de modo
+que el tiempo medido es casi todo construcción de la sentencia, compilación
+(o acierto en caché) y procesado ORM:
+
+- ``query``: ``db.query(Model).filter(Model.id == x).first()`` (código anterior)
+- ``get``: ``Session.get(Model, x)`` con el mapa de identidad vacío
+- ``repositorio``: sentencia precompilada de ``app.repositorio``
+
+Uso:
+    python benchmarks/bench_lookup_pk.py --n 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import Incidencia  # noqa: E402
+from app.repositorio import sentencia_por_id  # noqa: E402
+
+
+def _preparar(filas: int):
+    motor = create_engine("sqlite://")
+    Base.metadata.create_all(motor, tables=[Incidencia.__table__])
+    with Session(motor) as db:
+        db.add_all([
+            Incidencia(id=i, tipo="basura", gravedad=1, descripcion="x", lat=0.0, lon=0.0,
+                       zona="centro", estado="pendiente")
+            for i in range(1, filas + 1)
+        ])
+        db.commit()
+    return motor
+
+
+def _query(db, pk):
+    return db.query(Incidencia).filter(Incidencia.id == pk).first()
+
+
+def _get(db, pk):
+    db.expunge_all()
+    return db.get(Incidencia, pk)
+
+
+def _repositorio(db, pk):
+    return db.execute(sentencia_por_id(Incidencia), {"pk": pk}).scalars().first()
+
+
+def main(args):
+    motor = _preparar(args.filas)
+    for nombre, fn in [("query", _query), ("get", _get), ("repositorio", _repositorio)]:
+        with Session(motor) as db:
+            for pk in range(1, 200):  # calentar cachés
+                fn(db, pk)
+            db.expunge_all()
+            inicio = time.process_time()
+            for i in range(args.n):
+                fn(db, i % args.filas + 1)
+                if i % 100 == 0:
+                    db.expunge_all()
+            cpu = time.process_time() - inicio
+        print(f"{nombre:12s} {cpu / args.n * 1e6:8.1f} µs CPU por lectura")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--filas", type=int, default=1000)
+    main(parser.parse_args())
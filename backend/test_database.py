@@ -0,0 +1,55 @@
+"""
+Pruebas del reintento ante conexiones caídas (app.database.SesionConReintento)
+"""
+import asyncio
+
+import pytest
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SesionConReintento
+
+
+def caida():
+    return DBAPIError("SELECT 1", {}, Exception("conexión cerrada"), connection_invalidated=True)
+
+
+@pytest.fixture
+def sesion(monkeypatch):
+    """Sesión sin base: ``llamadas`` cuenta las llamadas a cada método de AsyncSession"""
+    llamadas = {"execute": 0, "refresh": 0, "commit": 0, "rollback": 0}
+
+    def falso(nombre, fallos):
+        async def metodo(self, *args, **kwargs):
+            llamadas[nombre] += 1
+            if llamadas[nombre] <= fallos:
+                raise caida()
+            return nombre
+        return metodo
+
+    monkeypatch.setattr(AsyncSession, "execute", falso("execute", 1))
+    monkeypatch.setattr(AsyncSession, "refresh", falso("refresh", 1))
+    monkeypatch.setattr(AsyncSession, "commit", falso("commit", 1))
+    monkeypatch.setattr(AsyncSession, "rollback", falso("rollback", 0))
+    s = SesionConReintento()
+    s.llamadas = llamadas
+    return s
+
+
+def test_lectura_que_abre_la_transaccion_se_reintenta(sesion):
+    assert asyncio.run(sesion.execute("SELECT 1")) == "execute"
+    assert asyncio.run(sesion.refresh(object())) == "refresh"
+    assert sesion.llamadas == {"execute": 2, "refresh": 2, "commit": 0, "rollback": 2}
+
+
+def test_dentro_de_una_transaccion_no_se_reintenta(sesion, monkeypatch):
+    monkeypatch.setattr(SesionConReintento, "in_transaction", lambda self: True)
+    with pytest.raises(DBAPIError):
+        asyncio.run(sesion.execute("SELECT 1"))
+    assert sesion.llamadas["execute"] == 1 and sesion.llamadas["rollback"] == 0
+
+
+def test_commit_no_se_reintenta(sesion):
+    with pytest.raises(DBAPIError):
+        asyncio.run(sesion.commit())
+    assert sesion.llamadas["commit"] == 1 and sesion.llamadas["rollback"] == 0
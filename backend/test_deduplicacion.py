@@ -0,0 +1,78 @@
+"""
+Pruebas del índice geohash de deduplicación de reportes (app.deduplicacion)
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.deduplicacion import IndiceDedupe, _celda_grados, distancia_m, geohash, precision_para
+
+AHORA = datetime(2026, 1, 4, 12, 0)
+
+
+def test_geohash_conocido():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash(-0.93, -78.61, 5) == geohash(-0.93, -78.61, 7)[:5]
+
+
+@pytest.mark.parametrize("radio", [10, 50, 200, 1000, 5000])
+def test_precision_con_celda_mayor_que_el_radio(radio):
+    precision = precision_para(radio, -0.93)
+    alto, ancho = _celda_grados(precision)
+    assert alto * 111_320 >= radio and ancho * 111_320 >= radio
+    if precision < 9:
+        alto, ancho = _celda_grados(precision + 1)
+        assert alto * 111_320 < radio or ancho * 111_320 < radio
+
+
+def test_vecino_al_otro_lado_del_borde_de_celda():
+    indice = IndiceDedupe(radio_m=50, horas=24, lat_referencia=-0.93)
+    alto, ancho = _celda_grados(indice.precision)
+    # Borde de celda en longitud: dos puntos a ~10 m, cada uno en una cubeta
+    borde = -78.61 - (-78.61 % ancho)
+    lat, izq, der = -0.93, borde - 0.00005, borde + 0.00004
+    assert geohash(lat, izq, indice.precision) != geohash(lat, der, indice.precision)
+    indice.agregar("a", "acopio", lat, izq, AHORA)
+    assert indice.candidatos("acopio", lat, der, AHORA) == ["a"]
+
+
+def test_filtra_por_tipo_ventana_y_radio_y_ordena_por_distancia():
+    indice = IndiceDedupe(radio_m=50, horas=24)
+    indice.agregar("lejos", "acopio", -0.93, -78.6104, AHORA)      # ~44 m
+    indice.agregar("cerca", "acopio", -0.93, -78.6101, AHORA)      # ~11 m
+    indice.agregar("fuera", "acopio", -0.93, -78.6106, AHORA)      # ~67 m
+    indice.agregar("otro_tipo", "critico", -0.93, -78.61, AHORA)
+    indice.agregar("viejo", "acopio", -0.93, -78.61, AHORA - timedelta(hours=25))
+    assert indice.candidatos("acopio", -0.93, -78.61, AHORA) == ["cerca", "lejos"]
+
+
+def test_agregar_es_idempotente_y_quitar_vacia_la_cubeta():
+    indice = IndiceDedupe(radio_m=50)
+    indice.agregar("a", "acopio", -0.93, -78.61, AHORA)
+    indice.agregar("a", "acopio", -0.93, -78.61, AHORA)
+    assert len(indice) == 1 and indice.candidatos("acopio", -0.93, -78.61, AHORA) == ["a"]
+    indice.quitar("a")
+    indice.quitar("a")
+    assert len(indice) == 0 and not indice._cubetas
+
+
+def test_podar():
+    indice = IndiceDedupe(radio_m=50, horas=1)
+    indice.agregar("viejo", "acopio", -0.93, -78.61, AHORA - timedelta(hours=2))
+    indice.agregar("nuevo", "acopio", -0.93, -78.61, AHORA)
+    assert indice.podar(AHORA) == 1
+    assert "viejo" not in indice and "nuevo" in indice
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_igual_que_la_busqueda_exhaustiva(semilla):
+    azar = random.Random(semilla)
+    indice = IndiceDedupe(radio_m=50, horas=24, lat_referencia=-0.93)
+    puntos = [(i, -0.93 + azar.uniform(-0.003, 0.003), -78.61 + azar.uniform(-0.003, 0.003)) for i in range(400)]
+    for i, lat, lon in puntos:
+        indice.agregar(i, "acopio", lat, lon, AHORA)
+    for _ in range(100):
+        lat, lon = -0.93 + azar.uniform(-0.003, 0.003), -78.61 + azar.uniform(-0.003, 0.003)
+        esperados = sorted((distancia_m(lat, lon, la, lo), i) for i, la, lo in puntos if distancia_m(lat, lon, la, lo) <= 50)
+        assert indice.candidatos("acopio", lat, lon, AHORA) == [i for _, i in esperados]
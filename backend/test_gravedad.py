@@ -0,0 +1,76 @@
+"""
+Pruebas del autómata Aho–Corasick de palabras clave (app.gravedad)
+"""
+import random
+import re
+
+import pytest
+
+from app import gravedad
+from app.gravedad import Automata, normalizar
+
+
+def coincidencias_ingenuas(reglas: dict[str, int], texto: str) -> set[str]:
+    """Referencia: cada palabra buscada en cada posición que empieza una palabra del texto"""
+    texto = normalizar(texto)
+    return {
+        normalizar(p) for p in reglas
+        if any(m.start() == 0 or not texto[m.start() - 1].isalnum()
+               for m in re.finditer(re.escape(normalizar(p)), texto))
+    }
+
+
+def test_inicio_de_palabra():
+    a = Automata({"urgente": 2})
+    assert a.coincidencias("Es urgentemente necesario") == {"urgente"}
+    assert a.coincidencias("insurgente") == set()
+    assert a.coincidencias("urgente!") == {"urgente"}
+    assert a.coincidencias("(urgente)") == {"urgente"}
+
+
+def test_tildes_y_mayusculas():
+    a = Automata({"crítico": 3, "ñandú": 1})
+    assert a.coincidencias("ESTADO CRITICO") == {"critico"}
+    assert a.coincidencias("un Ñandu cerca") == {"nandu"}
+
+
+def test_cada_palabra_suma_una_vez():
+    a = Automata({"fuego": 3, "ratas": 1})
+    assert a.bonificacion("fuego, fuego y más fuego con ratas") == 4
+    assert a.bonificacion(None) == 0
+    assert a.bonificacion("") == 0
+
+
+def test_palabras_solapadas_siguen_los_enlaces_de_fallo():
+    # "he" dentro de "she" y "hers": solo cuentan si empiezan palabra
+    reglas = {"he": 1, "she": 2, "his": 4, "hers": 8}
+    a = Automata(reglas)
+    assert a.coincidencias("ushers") == set()
+    assert a.coincidencias("she hers") == {"she", "he", "hers"}
+    assert a.bonificacion("she hers his") == 15
+
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_igual_que_la_busqueda_ingenua(semilla):
+    azar = random.Random(semilla)
+    alfabeto = "abcá "
+    reglas = {
+        "".join(azar.choice("abcá") for _ in range(azar.randint(1, 4))): azar.randint(1, 3)
+        for _ in range(azar.randint(1, 8))
+    }
+    a = Automata(reglas)
+    for _ in range(50):
+        texto = "".join(azar.choice(alfabeto) for _ in range(azar.randint(0, 30)))
+        assert a.coincidencias(texto) == coincidencias_ingenuas(reglas, texto), (reglas, texto)
+
+
+def test_bonificaciones_en_orden():
+    a = Automata(gravedad.REGLAS_POR_DEFECTO)
+    textos = ["incendio en la escuela", None, "nada", "Río desbordado, PELIGRO"]
+    assert a.bonificaciones(textos) == [a.bonificacion(t) for t in textos] == [4, 0, 0, 4]
+
+
+def test_ajustar_acota_la_gravedad():
+    assert gravedad.ajustar(9, "incendio tóxico, emergencia") == gravedad.GRAVEDAD_MAX
+    assert gravedad.ajustar(0, None) == gravedad.GRAVEDAD_MIN
+    assert gravedad.ajustar(2, "basura en la esquina") == 2
@@ -0,0 +1,38 @@
+"""
+Pruebas del parser de la cabecera Range de /media (app.routers.media)
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.routers.media import _rango
+
+
+@pytest.mark.parametrize("cabecera, esperado", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=999-999", (999, 999)),
+    ("bytes= 10-20 ", (10, 20)),
+])
+def test_rangos_validos(cabecera, esperado):
+    assert _rango(cabecera, 1000) == esperado
+
+
+@pytest.mark.parametrize("cabecera", [
+    None, "", "items=0-10", "bytes=0-1,5-6", "bytes=-0", "bytes=a-", "bytes=0-b", "bytes=-", "bytes=1-2-3",
+    "bytes=50-10", "bytes=5000-10",
+])
+def test_cabecera_ignorada_sirve_el_archivo_entero(cabecera):
+    assert _rango(cabecera, 1000) is None
+
+
+@pytest.mark.parametrize("cabecera, tamano", [
+    ("bytes=1000-", 1000), ("bytes=1000-2000", 1000), ("bytes=0-", 0), ("bytes=-10", 0),
+])
+def test_rango_no_satisfacible_416(cabecera, tamano):
+    with pytest.raises(HTTPException) as e:
+        _rango(cabecera, tamano)
+    assert e.value.status_code == 416
+    assert e.value.headers["Content-Range"] == f"bytes */{tamano}"
@@ -0,0 +1,70 @@
+"""
+Pruebas del cursor opaco de la paginación keyset (app.paginacion)
+"""
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException, Response
+
+from app.models import Incidencia, Report
+from app.paginacion import (
+    CABECERA_CURSOR,
+    codificar_cursor,
+    codificar_valores,
+    decodificar_cursor,
+    decodificar_valores,
+    recortar_pagina,
+)
+
+
+class Fila:
+    def __init__(self, created_at, id_):
+        self.created_at = created_at
+        self.id = id_
+
+
+@pytest.mark.parametrize("valores", [[1], ["a", 2.5, None], ["ñandú", [1, 2]], ["x" * 100]])
+def test_valores_ida_y_vuelta(valores):
+    cursor = codificar_valores(valores)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decodificar_valores(cursor, len(valores)) == valores
+
+
+def test_cursor_con_pk_entera():
+    creado = datetime(2026, 1, 4, 10, 30, 0, 123456)
+    assert decodificar_cursor(codificar_cursor(creado, 42), Incidencia) == (creado, 42)
+
+
+def test_cursor_con_pk_uuid():
+    creado = datetime(2026, 1, 4, 10, 30)
+    id_ = uuid.uuid4()
+    assert decodificar_cursor(codificar_cursor(creado, id_), Report) == (creado, id_)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "%%%",
+    codificar_valores([1, 2, 3]),
+    codificar_valores({"a": 1}),
+    codificar_valores(["no-es-fecha", "1"]),
+    codificar_valores(["2026-01-04T10:30:00", "no-es-entero"]),
+])
+def test_cursor_invalido_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        decodificar_cursor(cursor, Incidencia)
+    assert e.value.status_code == 400
+
+
+def test_recortar_pagina_publica_el_cursor_de_la_ultima():
+    filas = [Fila(datetime(2026, 1, i), i) for i in (5, 4, 3)]
+    response = Response()
+    assert recortar_pagina(filas, 2, response) == filas[:2]
+    assert decodificar_cursor(response.headers[CABECERA_CURSOR], Incidencia) == (datetime(2026, 1, 4), 4)
+
+
+def test_recortar_pagina_sin_siguiente():
+    filas = [Fila(datetime(2026, 1, 1), 1)]
+    response = Response()
+    assert recortar_pagina(filas, 2, response) == filas
+    assert CABECERA_CURSOR not in response.headers
@@ -0,0 +1,115 @@
+"""
+Pruebas del formato binario de /tracking/actualizar/batch (app.posiciones)
+"""
+import asyncio
+import gzip
+import struct
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app import posiciones
+from app.posiciones import decodificar_lote, descomprimir, leer_cuerpo
+
+T0 = int(datetime(2026, 1, 4, 10, 30, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def lote(puntos, ejecucion_id=7, lat0=-930000, lon0=-78610000, t0=T0, magia=b"TRK1"):
+    """Codificar ``[(dlat, dlon, dt, velocidad)]`` como lo hace la app móvil"""
+    n = len(puntos)
+    columnas = list(zip(*puntos)) or [(), (), (), ()]
+    return (
+        struct.pack("<4sHIiiq", magia, n, ejecucion_id, lat0, lon0, t0)
+        + struct.pack(f"<{n}i", *columnas[0])
+        + struct.pack(f"<{n}i", *columnas[1])
+        + struct.pack(f"<{n}i", *columnas[2])
+        + struct.pack(f"<{n}H", *columnas[3])
+    )
+
+
+def codigo(excinfo) -> int:
+    return excinfo.value.status_code
+
+
+def test_decodifica_deltas_acumulados():
+    datos = lote([(0, 0, 0, 255), (100, -200, 1000, 0xFFFF), (-50, 0, 500, 0)])
+    assert len(datos) == 26 + 3 * 14
+    p = decodificar_lote(datos)
+    assert [x.ejecucion_id for x in p] == [7, 7, 7]
+    assert [(x.lat, x.lon) for x in p] == [(-0.93, -78.61), (-0.9299, -78.6102), (-0.92995, -78.6102)]
+    assert [x.velocidad for x in p] == [25.5, None, 0.0]
+    inicio = datetime(2026, 1, 4, 10, 30, tzinfo=timezone.utc)
+    assert [x.instante for x in p] == [inicio, inicio + timedelta(seconds=1), inicio + timedelta(seconds=1.5)]
+
+
+def test_columnas_de_4_bytes_little_endian():
+    # Si el decodificador usara el tamaño nativo del int de C, el segundo valor saldría de otros bytes
+    p = decodificar_lote(lote([(0x01020304, 0, 0, 0), (-1, 0, 1, 0)], lat0=0, lon0=0))
+    assert [round(x.lat * 1e6) for x in p] == [0x01020304, 0x01020303]
+
+
+def test_lote_vacio():
+    assert decodificar_lote(lote([])) == []
+
+
+@pytest.mark.parametrize("datos", [b"TRK", lote([(0, 0, 0, 0)], magia=b"TRK2"), lote([(0, 0, 0, 0)])[:-1]])
+def test_formato_invalido_400(datos):
+    with pytest.raises(HTTPException) as e:
+        decodificar_lote(datos)
+    assert codigo(e) == 400
+
+
+def test_instantes_no_crecientes_422():
+    with pytest.raises(HTTPException) as e:
+        decodificar_lote(lote([(0, 0, 0, 0), (0, 0, 10, 0), (0, 0, 0, 0)]))
+    assert codigo(e) == 422 and "posición 2" in e.value.detail
+
+
+def test_coordenadas_fuera_de_rango_422():
+    with pytest.raises(HTTPException) as e:
+        decodificar_lote(lote([(0, 0, 0, 0)], lat0=90_000_001))
+    assert codigo(e) == 422
+
+
+def test_instantes_futuros_422():
+    futuro = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp() * 1000)
+    with pytest.raises(HTTPException) as e:
+        decodificar_lote(lote([(0, 0, 0, 0)], t0=futuro))
+    assert codigo(e) == 422
+
+
+def test_lote_mayor_que_el_maximo_413(monkeypatch):
+    monkeypatch.setattr(posiciones, "GPS_LOTE_MAX", 2)
+    with pytest.raises(HTTPException) as e:
+        decodificar_lote(lote([(0, 0, i, 0) for i in range(3)]))
+    assert codigo(e) == 413
+
+
+def test_descomprimir():
+    datos = lote([(0, 0, 0, 0), (1, 1, 1, 1)])
+    assert descomprimir(gzip.compress(datos)) == datos
+    with pytest.raises(HTTPException) as e:
+        descomprimir(b"no es gzip")
+    assert codigo(e) == 400
+
+
+def test_descomprimir_con_tope(monkeypatch):
+    monkeypatch.setattr(posiciones, "GPS_LOTE_MAX", 10)
+    with pytest.raises(HTTPException) as e:
+        descomprimir(gzip.compress(b"\0" * 10_000))
+    assert codigo(e) == 413
+
+
+async def trozos(datos: bytes, largo: int = 7):
+    for i in range(0, len(datos), largo):
+        yield datos[i:i + largo]
+
+
+def test_leer_cuerpo_por_trozos(monkeypatch):
+    monkeypatch.setattr(posiciones, "GPS_LOTE_MAX", 2)
+    datos = lote([(0, 0, 0, 0), (1, 1, 1, 1)])
+    assert asyncio.run(leer_cuerpo(trozos(datos))) == datos
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(leer_cuerpo(trozos(datos + b"\0")))
+    assert codigo(e) == 413
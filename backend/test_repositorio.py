@@ -0,0 +1,50 @@
+"""
+Pruebas de las actualizaciones por clave primaria (app.repositorio)
+"""
+import asyncio
+
+from app.models import Incidencia
+from app.repositorio import actualizar_por_id
+
+
+class ResultadoFalso:
+    def __init__(self, fila):
+        self.fila = fila
+
+    def scalars(self):
+        return self
+
+    def first(self):
+        return self.fila
+
+
+class SesionFalsa:
+    """Guarda las sentencias ejecutadas y devuelve siempre la misma fila"""
+
+    def __init__(self, fila):
+        self.fila = fila
+        self.sentencias = []
+
+    async def execute(self, stmt, params=None):
+        self.sentencias.append(stmt)
+        return ResultadoFalso(self.fila)
+
+    async def scalar(self, stmt):
+        self.sentencias.append(stmt)
+        return None
+
+
+def test_patch_vacio_no_escribe_ni_sube_la_version():
+    db = SesionFalsa(fila="incidencia")
+    assert asyncio.run(actualizar_por_id(db, Incidencia, 1, {}, version=3)) == "incidencia"
+    assert [s.is_select for s in db.sentencias] == [True]
+
+
+def test_actualizar_sube_la_version_y_filtra_por_ella():
+    db = SesionFalsa(fila="incidencia")
+    asyncio.run(actualizar_por_id(db, Incidencia, 1, {"estado": "resuelta"}, version=3))
+    (stmt,) = db.sentencias
+    assert stmt.is_update
+    sql = str(stmt.compile())
+    assert "version=(incidencias.version + " in sql.replace(" = ", "=")
+    assert "incidencias.version = " in sql
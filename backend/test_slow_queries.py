@@ -0,0 +1,33 @@
+"""
+Pruebas de la caché de planes de las consultas lentas (app.slow_queries)
+"""
+import asyncio
+
+from app import slow_queries
+
+
+def test_planes_lru_con_el_tope_del_buffer(monkeypatch):
+    monkeypatch.setattr(slow_queries, "DB_SLOW_QUERY_BUFFER", 2)
+    # iniciar_explicador las reemplaza; al terminar vuelven a las de antes
+    monkeypatch.setattr(slow_queries, "_cola", None)
+    monkeypatch.setattr(slow_queries, "_loop", None)
+    explicadas = []
+
+    async def explicar(motor, sql, parametros):
+        explicadas.append(sql)
+        return {"plan": sql}
+
+    monkeypatch.setattr(slow_queries, "_explicar", explicar)
+
+    async def escenario():
+        slow_queries.iniciar_explicador()
+        for sql in ("SELECT 1", "SELECT 2", "SELECT 1", "SELECT 3"):
+            slow_queries.registrar(None, sql, None, 1.0, None, False)
+            await asyncio.sleep(0.01)
+
+    slow_queries.limpiar()
+    asyncio.run(escenario())
+    # "SELECT 1" se usó después que "SELECT 2": el desalojado es "SELECT 2"
+    assert explicadas == ["SELECT 1", "SELECT 2", "SELECT 3"]
+    assert list(slow_queries._planes) == ["SELECT 1", "SELECT 3"]
+    slow_queries.limpiar()
@@ -0,0 +1,106 @@
+"""
+Pruebas de la cola de salida de los WebSocket de tracking (app.routers.tracking)
+"""
+import asyncio
+import json
+
+from app.routers import tracking
+from app.routers.tracking import ConnectionManager, Suscriptor
+
+
+class WebSocketFalso:
+    def __init__(self, bloqueado: bool = False):
+        self.enviados: list[str] = []
+        self.cerrado_con = None
+        self.bloqueado = bloqueado
+        self.client = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, texto: str):
+        if self.bloqueado:
+            await asyncio.Event().wait()
+        self.enviados.append(texto)
+
+    async def close(self, code: int = 1000):
+        self.cerrado_con = code
+
+
+async def vaciar(suscriptor: Suscriptor):
+    tarea = asyncio.create_task(suscriptor.escribir())
+    while suscriptor.en_cola:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)  # el último envío sale después de sacarlo de la cola
+    tarea.cancel()
+
+
+def test_posiciones_sueltas_solo_la_ultima():
+    async def escenario():
+        s = Suscriptor(WebSocketFalso())
+        for i in range(5):
+            s.encolar(f"p{i}", reemplazable=True)
+        assert s.en_cola == 1 and s.descartados == 4
+        await vaciar(s)
+        assert s.websocket.enviados == ["p4"] and s.enviados == 1
+
+    asyncio.run(escenario())
+
+
+def test_cola_llena_descarta_la_mas_antigua():
+    async def escenario():
+        s = Suscriptor(WebSocketFalso(), max_cola=3)
+        for i in range(5):
+            s.encolar(f"m{i}")
+        assert s.en_cola == 3 and s.descartados == 2
+        await vaciar(s)
+        assert s.websocket.enviados == ["m2", "m3", "m4"]
+
+    asyncio.run(escenario())
+
+
+def test_lote_no_lo_reemplaza_una_posicion_suelta():
+    async def escenario():
+        manager = ConnectionManager()
+        ws = WebSocketFalso()
+        suscriptor = await manager.connect(ws, 1)
+        suscriptor.tarea.cancel()
+        manager.broadcast(1, {"type": "position_update", "lat": 1, "puntos": [{"lat": 0}, {"lat": 1}]})
+        manager.broadcast(1, {"type": "position_update", "lat": 2}, reemplazable=True)
+        manager.broadcast(1, {"type": "position_update", "lat": 3}, reemplazable=True)
+        manager.broadcast(2, {"type": "position_update", "lat": 9}, reemplazable=True)  # sin clientes
+        await vaciar(suscriptor)
+        mensajes = [json.loads(t) for t in ws.enviados]
+        assert [m["lat"] for m in mensajes] == [1, 3]
+        assert "puntos" in mensajes[0]
+        assert suscriptor.descartados == 1
+
+    asyncio.run(escenario())
+
+
+def test_cliente_lento_se_desconecta(monkeypatch):
+    monkeypatch.setattr(tracking, "TRACKING_WS_TIMEOUT", 0.01)
+
+    async def escenario():
+        manager = ConnectionManager()
+        ws = WebSocketFalso(bloqueado=True)
+        suscriptor = await manager.connect(ws, 1)
+        manager.broadcast(1, {"type": "position_update", "lat": 1}, reemplazable=True)
+        await asyncio.wait_for(suscriptor.tarea, 1)
+        assert ws.cerrado_con == 1013
+        assert manager.active_connections == {}
+
+    asyncio.run(escenario())
+
+
+def test_disconnect_cancela_la_tarea_y_es_idempotente():
+    async def escenario():
+        manager = ConnectionManager()
+        ws = WebSocketFalso()
+        suscriptor = await manager.connect(ws, 1)
+        manager.disconnect(ws, 1)
+        manager.disconnect(ws, 1)
+        await asyncio.sleep(0)
+        assert suscriptor.tarea.cancelled() and manager.active_connections == {}
+
+    asyncio.run(escenario())
@@ -0,0 +1,11 @@
+-- MIGRACIÓN: Índices compuestos (created_at, id) para la paginación por cursor de los listados
+-- (incidencias, reports, tasks). CONCURRENTLY no bloquea escrituras: ejecutar fuera de una transacción.
+
+-- La comparación por tupla no encuentra filas con created_at NULL: rellenarlas antes
+UPDATE incidencias SET created_at = COALESCE(reportado_en, now()) WHERE created_at IS NULL;
+ALTER TABLE incidencias ALTER COLUMN created_at SET DEFAULT now();
+UPDATE tasks SET created_at = now() WHERE created_at IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidencias_created_at_id ON incidencias (created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_created_at_id ON reports (created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_created_at_id ON tasks (created_at, id);
@@ -0,0 +1,9 @@
+-- MIGRACIÓN: Índices espaciales para /incidencias/near|bbox y /reportes/near|bbox
+-- Se indexa la expresión geography(lat/lon) que usa app/geo.py (debe coincidir exactamente).
+-- CONCURRENTLY no bloquea escrituras: ejecutar fuera de una transacción.
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidencias_geog
+    ON incidencias USING GIST ((geography(ST_SetSRID(ST_MakePoint(lon, lat), 4326))));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_geog
+    ON reports USING GIST ((geography(ST_SetSRID(ST_MakePoint(lon, lat), 4326))));
@@ -0,0 +1,8 @@
+-- MIGRACIÓN: Gravedad por palabras clave (app/gravedad.py)
+-- incidencias.gravedad_base guarda la gravedad indicada al reportar; gravedad = base + bonificaciones.
+-- Las filas existentes no se habían ajustado: su gravedad actual es la base.
+ALTER TABLE incidencias ADD COLUMN IF NOT EXISTS gravedad_base INTEGER;
+UPDATE incidencias SET gravedad_base = gravedad WHERE gravedad_base IS NULL;
+
+-- reports.priority_score ya existe en database/init.sql; se añade donde falte
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS priority_score REAL DEFAULT 0.0;
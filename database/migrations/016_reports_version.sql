@@ -0,0 +1,4 @@
+-- MIGRACIÓN: Columna version de reports (concurrencia optimista, como en database/init.sql)
+-- PUT /api/reportes/{id} la incrementa en cada escritura y, si el cliente envía "version", solo
+-- actualiza cuando coincide (409 en caso contrario).
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 1;
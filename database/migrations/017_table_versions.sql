@@ -0,0 +1,31 @@
+-- MIGRACIÓN: Contador de versión por tabla para los ETags de los GET (app/etags.py)
+-- Un trigger por sentencia suma 1 en cada INSERT/UPDATE/DELETE/TRUNCATE, así que el valor es
+-- común a todos los workers; si no cambia, el cliente con el mismo ETag recibe 304.
+CREATE TABLE IF NOT EXISTS table_versions (
+    tabla   TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_versions (tabla, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (tabla) DO UPDATE SET version = table_versions.version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['incidencias', 'reports', 'rutas', 'conductores'] LOOP
+        INSERT INTO table_versions (tabla) VALUES (t) ON CONFLICT DO NOTHING;
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_version', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+            t || '_version', t
+        );
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,3 @@
+-- MIGRACIÓN: Índice espacial de routes.geometry para la capa /api/tiles/rutas (app/teselas.py)
+-- Solo aplica al esquema de database/init.sql (tabla routes). CONCURRENTLY: fuera de una transacción.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_routes_geometry ON routes USING GIST (geometry);
@@ -0,0 +1,18 @@
+-- MIGRACIÓN: Tabla report_attachments (como en database/init.sql) para las fotos de evidencia
+-- POST /api/reportes/{id}/fotos guarda el archivo por su SHA-256 (columna hash) y registra aquí
+-- los metadatos. CONCURRENTLY: ejecutar fuera de una transacción.
+CREATE TABLE IF NOT EXISTS report_attachments (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    report_id UUID REFERENCES reports(id) ON DELETE CASCADE,
+    attachment_id UUID,
+    filename TEXT,
+    mime_type TEXT,
+    size_bytes INT,
+    remote_url TEXT,
+    hash TEXT,
+    type TEXT DEFAULT 'EVIDENCE',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_report_attachments_report ON report_attachments (report_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_report_attachments_hash ON report_attachments (hash);
@@ -0,0 +1,9 @@
+-- MIGRACIÓN: Deduplicación de reportes (app/deduplicacion.py)
+-- duplicates: reportes repetidos vinculados a este al ingresar; duplicate_of: marca de
+-- POST /api/internal/reportes/deduplicar sobre los ya guardados. CONCURRENTLY: fuera de una transacción.
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES reports(id) ON DELETE SET NULL;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS duplicates INT NOT NULL DEFAULT 0;
+
+-- Reportes abiertos recientes que carga el índice en memoria al arrancar
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_abiertos_created_at
+    ON reports (created_at) WHERE duplicate_of IS NULL AND status IN ('ENVIADO', 'EN_PROCESO');
@@ -0,0 +1,7 @@
+-- MIGRACIÓN: Posiciones GPS del tracking por ejecución (app/posiciones.py)
+-- POST /api/tracking/actualizar guarda cada posición en actor_locations con el ejecucion_id del
+-- camión; GET /api/tracking/ruta/{id} la lee en orden. CONCURRENTLY: fuera de una transacción.
+ALTER TABLE actor_locations ADD COLUMN IF NOT EXISTS ejecucion_id INTEGER;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_actor_locations_ejecucion
+    ON actor_locations (ejecucion_id, reported_at) WHERE ejecucion_id IS NOT NULL;
@@ -0,0 +1,4 @@
+-- MIGRACIÓN: Columna version de incidencias (concurrencia optimista, como reports en la 016)
+-- PATCH /api/incidencias/{id} la incrementa en cada escritura y, si el cliente envía "version",
+-- solo actualiza cuando coincide (409 en caso contrario).
+ALTER TABLE incidencias ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 1;
@@ -0,0 +1,60 @@
+-- MIGRACIÓN: Versiones de tabla sin fila compartida entre escritores (sustituye el contador de la 017)
+-- Con la 017 cada sentencia hacía UPDATE de la fila de su tabla en table_versions, así que dos
+-- transacciones que escribían en la misma tabla se esperaban hasta el COMMIT de la primera.
+-- Ahora el trigger solo inserta una fila en table_version_log (los INSERT no se bloquean entre
+-- sí) con el application_name de la conexión como origen. La versión de una tabla es la suma de
+-- sus contadores en table_versions más sus filas del log: sube con cada COMMIT al hacerse
+-- visible, sea cual sea el orden en que terminen las transacciones.
+-- compactar_table_versions() pasa el log a los contadores sin cambiar la suma; la app la llama
+-- periódicamente (app/etags.py).
+
+CREATE TABLE IF NOT EXISTS table_version_log (
+    id     BIGSERIAL PRIMARY KEY,
+    tabla  TEXT NOT NULL,
+    origen TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_table_version_log_tabla ON table_version_log (tabla, origen);
+
+-- Un contador por tabla y origen: cada proceso puede separar sus escrituras de las ajenas
+-- (app/clusters.py). '' agrupa los orígenes que ya no tienen conexiones abiertas.
+ALTER TABLE table_versions ADD COLUMN IF NOT EXISTS origen TEXT NOT NULL DEFAULT '';
+ALTER TABLE table_versions DROP CONSTRAINT IF EXISTS table_versions_pkey;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_table_versions_tabla_origen ON table_versions (tabla, origen);
+
+-- Los triggers de la 017 siguen llamando a esta función: basta con reemplazarla
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_version_log (tabla, origen)
+    VALUES (TG_TABLE_NAME, coalesce(current_setting('application_name', true), ''));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Versión de una tabla; con p_excluir, sin contar las escrituras de ese origen
+CREATE OR REPLACE FUNCTION table_version(p_tabla TEXT, p_excluir TEXT DEFAULT NULL) RETURNS BIGINT AS $$
+    SELECT (SELECT coalesce(sum(version), 0) FROM table_versions
+            WHERE tabla = p_tabla AND origen IS DISTINCT FROM p_excluir)::BIGINT
+         + (SELECT count(*) FROM table_version_log
+            WHERE tabla = p_tabla AND origen IS DISTINCT FROM p_excluir);
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION compactar_table_versions() RETURNS void AS $$
+BEGIN
+    WITH movidas AS (
+        DELETE FROM table_version_log RETURNING tabla, origen
+    )
+    INSERT INTO table_versions (tabla, origen, version)
+    SELECT tabla, origen, count(*) FROM movidas GROUP BY tabla, origen
+    ON CONFLICT (tabla, origen) DO UPDATE SET version = table_versions.version + EXCLUDED.version;
+
+    WITH terminados AS (
+        DELETE FROM table_versions
+        WHERE origen <> ''
+          AND origen NOT IN (SELECT application_name FROM pg_stat_activity WHERE application_name IS NOT NULL)
+        RETURNING tabla, version
+    )
+    INSERT INTO table_versions (tabla, origen, version)
+    SELECT tabla, '', sum(version) FROM terminados GROUP BY tabla
+    ON CONFLICT (tabla, origen) DO UPDATE SET version = table_versions.version + EXCLUDED.version;
+END;
+$$ LANGUAGE plpgsql;
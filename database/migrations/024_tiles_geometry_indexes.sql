@@ -0,0 +1,11 @@
+-- MIGRACIÓN: Índices geometry (4326) de lat/lon para las teselas vectoriales (app/teselas.py)
+-- Las capas filtran por el recuadro de la tesela en geometry: con geography (índices de la 014)
+-- el recuadro de las teselas de zoom bajo no es el de la tesela. La expresión debe coincidir
+-- exactamente con la de app/teselas.py.
+-- CONCURRENTLY no bloquea escrituras: ejecutar fuera de una transacción.
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_incidencias_geom
+    ON incidencias USING GIST ((ST_SetSRID(ST_MakePoint(lon, lat), 4326)));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_geom
+    ON reports USING GIST ((ST_SetSRID(ST_MakePoint(lon, lat), 4326)));
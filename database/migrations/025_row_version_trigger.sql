@@ -0,0 +1,29 @@
+-- MIGRACIÓN: version de fila siempre al día en incidencias y reports
+-- El ETag del detalle (GET /api/incidencias/{id}, /api/reportes/{id}) es la version de la fila
+-- (app/etags.py). La API la sube en sus UPDATE, pero los recálculos masivos (gravedad, zonas,
+-- deduplicación histórica) y las escrituras hechas fuera de la API no: este trigger la sube en
+-- cualquier UPDATE que cambie la fila sin haberla tocado.
+
+CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.version = OLD.version AND NEW IS DISTINCT FROM OLD THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['incidencias', 'reports'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_row_version', t);
+        EXECUTE format(
+            'CREATE TRIGGER %I BEFORE UPDATE ON %I '
+            'FOR EACH ROW EXECUTE FUNCTION bump_row_version()',
+            t || '_row_version', t
+        );
+    END LOOP;
+END;
+$$;